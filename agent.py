@@ -0,0 +1,425 @@
+import logging
+import time
+import queue
+from universal_solver import UniversalSolver, REQUEST_TIMEOUT, LOGIN_REJECTED
+from network_manager import NetworkManager, NO_GATEWAY
+from storage import StorageManager
+from probe_engine import ONLINE
+from scheduler import MonitorScheduler, AgentState
+from login_task import LoginTask
+from transport import Transport
+from fingerprint_cache import FingerprintCache, CLICK_THROUGH
+from portal_flow import TERMS_ACCEPTED
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Re-check timings while online (seconds)
+POLL_INTERVAL = 10       # No change events available -> plain polling
+KEEPALIVE_INTERVAL = 60  # Change events available -> slow safety poll only
+
+# Renew a portal session this long before its learned lifetime runs out
+# (covers the expiry detection delay of one keep-alive poll plus a full login)
+REAUTH_LEAD = 90
+# Portal no longer shows its form while logged in -> poke the keepalive page this often
+KEEPALIVE_REPEAT = 30
+# How long a saved portal session gets to let us through before a full login (seconds)
+RESUME_DEADLINE = 1
+
+
+class AutoLoginAgent:
+    """
+    The monitoring and auto-login loop, without any UI.
+    A front end (Tk window, headless daemon, benchmark) plugs in through
+    on_prompt(agent), called from the worker thread when an unknown portal
+    needs credentials; it answers later with agent.submit_login().
+
+    With `interface` set, every request goes out through that interface
+    and the SSID is read from it (one agent per Wi-Fi adapter, see AgentGroup).
+    With a `recorder` (capture.py), all of its HTTP traffic is captured.
+    """
+    def __init__(self, store=None, solver=None, net=None, on_prompt=None, interface=None, ui_queue=None,
+                 recorder=None):
+        self.interface = interface
+        self.store = store or StorageManager()
+        self.solver = solver or UniversalSolver(
+            recipes=self.store.recipes, transport=Transport(interface=interface, recorder=recorder)
+        )
+        # One probe engine races every endpoint for both detection paths
+        self.prober = self.solver.prober
+        self.net = net or NetworkManager(prober=self.prober, interface=interface)
+        # RFC 8910: the API URI comes from this network's DHCP lease
+        if self.solver.captive_api is None:
+            self.solver.captive_api = self.net.get_captive_api
+        self.on_prompt = on_prompt
+        # Portal pages we already know we can't log into, per (SSID, gateway)
+        self.fingerprints = FingerprintCache()
+
+        self.current_ssid = None
+        self.current_portal_id = None
+        self.session = None  # Portal session we opened (see _open_session)
+        self.net_events = None
+
+        # Single worker thread for every check (no thread per tick, no overlapping probes)
+        self.scheduler = MonitorScheduler(
+            self.background_logic, online_interval=POLL_INTERVAL, ui_queue=ui_queue
+        )
+
+    @property
+    def name(self):
+        return self.interface or "default"
+
+    def start(self, delay=1, watch_network=True):
+        # Probe when the network actually changes instead of on a fast timer
+        if watch_network:
+            self.net_events = self.net.watch_changes(self.on_network_change)
+        if self.net_events:
+            self.scheduler.online_interval = KEEPALIVE_INTERVAL
+        self.scheduler.start(delay=delay)
+
+    def stop(self):
+        self.scheduler.stop()
+        if self.net_events:
+            self.net_events.stop()
+
+    def on_network_change(self, reason):
+        """Called by the event source when link, address or default route changes"""
+        log.info(">> Network change detected (%s). Re-checking...", reason)
+        self.solver.transport.flush()
+        self.scheduler.wake()
+
+    def background_logic(self):
+        """
+        One network check, run by the scheduler's worker thread.
+        Returns the next AgentState.
+        """
+        # No default route at all: nothing a probe could reach
+        if self.net.get_gateway() == NO_GATEWAY:
+            log.info(">> [%s] No default route. Waiting for the network...", self.name)
+            return AgentState.BACKOFF
+
+        # 1. Check Internet (all probes race, first decisive answer wins)
+        portal_page = self.solver.get_portal_page()
+
+        if portal_page == ONLINE:
+            self._follow_api_deadline()
+            self.maintain_session()
+            return AgentState.ONLINE
+
+        # 2. Offline -> no answer from any probe
+        if not portal_page:
+            log.info(">> No portal found. Retrying...")
+            return AgentState.BACKOFF
+
+        # 3. Portal Found
+        self.current_ssid = self.net.get_ssid() or "Unknown Network"
+        portal_id = self.solver.get_portal_identifier(portal_page.url)
+        self.current_portal_id = portal_id
+
+        log.info(">> [%s] Portal: %s | Host: %s", self.name, self.current_ssid, portal_id)
+        self._end_session(portal_id)
+
+        # A session from before a restart / on another AP may still be alive server-side
+        saved = self.store.cookies.load(portal_id)
+        if saved and self._resume_session(portal_id, portal_page, saved):
+            return AgentState.ONLINE
+
+        # 4. Check Saved Creds
+        creds = self.store.get_credentials(self.current_ssid)
+        if not creds:
+            creds = self.store.find_by_portal_id(portal_id)
+
+        if not creds:
+            # Terms-only portals need no credentials: the portal flow accepts them.
+            # A login form found behind them is left for the LoginTask to learn (once it works).
+            if self.solver.analyze_page(portal_page, learn=False) is None and self._online_after_terms():
+                return AgentState.ONLINE
+
+            # 5. Unknown -> ask the front end and stop probing until it answers
+            log.info(">> Asking for credentials...")
+            if self.on_prompt:
+                self.on_prompt(self)
+            return AgentState.AWAITING_USER
+
+        log.info(">> Auto-Login with saved creds...")
+        # The page the probe just brought back is fresh (and still unread): only a
+        # resume attempt, which went to the portal since, makes a new fetch necessary
+        fresh_page = self.solver.get_portal_page() if saved else portal_page
+        if fresh_page == ONLINE:
+            return AgentState.ONLINE
+        if fresh_page:
+            network = (self.current_ssid, self.net.get_gateway())
+            # Only pages of networks that already failed are kept in full and hashed;
+            # everything else streams into the parser as usual
+            text = fresh_page.text if self.fingerprints.known(network) else None
+            if text is not None:
+                known = self.fingerprints.check(network, text)
+                metrics.count("fingerprint_cache", result="hit" if known else "miss")
+                if known:
+                    outcome, ttl = known
+                    log.info(">> [%s] Same portal page as before (%s). Skipping it for %.0fs.",
+                             self.name, outcome, ttl)
+                    self.scheduler.defer(ttl)
+                    return AgentState.BACKOFF
+
+            form_info = self.solver.analyze_page(fresh_page)
+            response = form_info and self.solver.login(form_info, creds['username'], creds['password'])
+            if response and self.solver.login_verdict(form_info, response) == LOGIN_REJECTED:
+                # The form was right (recipe kept), the credentials are not
+                log.warning(">> [%s] Portal rejected the saved credentials for %s.", self.name, self.current_ssid)
+                metrics.count("login_failures", portal=portal_id)
+                return AgentState.BACKOFF
+            if response:
+                self.fingerprints.forget(network)
+                self._open_session(portal_id, form_info['url'], response)
+                if self.net.confirm_online():
+                    log.info(">> Auto-Login Success!")
+                    metrics.count("logins", portal=portal_id)
+                    self.maintain_session()
+                    return AgentState.ONLINE
+                # Some firewalls take a while: the next check confirms
+                log.info(">> Auto-Login sent, no Internet yet.")
+                return AgentState.PORTAL_KNOWN
+
+            outcome = self.solver.last_outcome
+            if outcome == TERMS_ACCEPTED:
+                if self._online_after_terms():
+                    self.fingerprints.forget(network)
+                    return AgentState.ONLINE
+                outcome = CLICK_THROUGH
+            if outcome:
+                # Nothing to log into: re-checking the same page sooner won't change that
+                ttl = self.fingerprints.record(network, text, outcome)
+                log.info(">> [%s] No login possible on this page (%s). Next look in %.0fs.",
+                         self.name, outcome, ttl)
+                self.scheduler.defer(ttl)
+                return AgentState.BACKOFF
+
+        log.warning(">> Auto-Login Failed (Bad Creds?)")
+        metrics.count("login_failures", portal=portal_id)
+        # Don't trust the cached form layout on the next attempt
+        self.store.recipes.invalidate(portal_id)
+        return AgentState.BACKOFF
+
+    def _online_after_terms(self):
+        """The last portal walk only had terms to accept (no login form): did that get us online?"""
+        if self.solver.last_outcome != TERMS_ACCEPTED:
+            return False
+        online = self.net.is_connected()
+        log.info(">> [%s] Terms accepted, %s.", self.name, "online" if online else "still no Internet")
+        return online
+
+    def submit_login(self, username, password, on_progress, on_done):
+        """
+        Runs a user-supplied login on the worker thread (see LoginTask).
+        Callbacks get the task first: on_progress(task, text), on_done(task, success, text).
+        Credentials are saved ONLY on success. Returns the task (for cancel()).
+        """
+        task = LoginTask(
+            self.solver, self.net, username, password,
+            on_progress=lambda text: on_progress(task, text),
+            on_done=lambda success, text: on_done(task, success, text)
+        )
+        self.scheduler.run_job(self._run_login_task, task)
+        return task
+
+    def _run_login_task(self, task):
+        task.run()
+        if task.cancelled or not task.succeeded:
+            return
+        self.store.save_credentials(self.current_ssid, task.username, task.password, task.portal_id)
+        self._open_session(task.portal_id, task.login_url, task.response)
+
+    def _open_session(self, portal_id, login_url, response):
+        """A login succeeded: remember how to renew it and, once learned, when."""
+        lifetime = self.store.sessions.lifetime(portal_id)
+        login_at = self.store.sessions.record_login(portal_id)
+        # Where the portal sent us after the login (e.g. Fortinet's /keepalive page)
+        keepalive_url = None
+        if response is not None and self.solver.get_portal_identifier(response.url) == portal_id:
+            keepalive_url = response.url
+
+        refresh_at = None
+        if lifetime:
+            refresh_at = login_at + max(lifetime - REAUTH_LEAD, lifetime / 2)
+            log.info(">> [%s] %s sessions last ~%.0f min. Renewing at %s.", self.name, portal_id,
+                     lifetime / 60, time.strftime('%H:%M:%S', time.localtime(refresh_at)))
+
+        self.session = {
+            "portal_id": portal_id,
+            "ssid": self.current_ssid,
+            "login_url": login_url,
+            "keepalive_url": keepalive_url,
+            "login_at": login_at,
+            "refresh_at": refresh_at,
+        }
+        # Lets a restarted or roaming agent carry on with this session (see _resume_session)
+        self.store.cookies.save(
+            portal_id, self.solver.export_cookies(portal_id), keepalive_url,
+            expires_at=login_at + lifetime if lifetime else None
+        )
+
+    def _resume_session(self, portal_id, portal_page, saved):
+        """
+        Cookies saved by an earlier login on this portal (before a restart, or
+        on another access point of the same controller): if the portal still
+        knows them, one request lets us back in and no login is needed.
+        """
+        log.info(">> [%s] Trying the saved session on %s...", self.name, portal_id)
+        self.solver.restore_cookies(saved["cookies"])
+        try:
+            self.solver.session.get(saved["keepalive_url"] or portal_page.url, timeout=REQUEST_TIMEOUT)
+            resumed = self.net.confirm_online(deadline=RESUME_DEADLINE)
+        except Exception as e:
+            log.debug("Saved session request failed: %s", e)
+            resumed = False
+        metrics.count("session_resumes", portal=portal_id, result="ok" if resumed else "expired")
+        if not resumed:
+            log.info(">> [%s] Saved session is no longer valid.", self.name)
+            self.store.cookies.discard(portal_id)
+            return False
+
+        log.info(">> [%s] Saved session still valid. No login needed.", self.name)
+        self.session = {
+            "portal_id": portal_id,
+            "ssid": self.current_ssid,
+            "login_url": None,
+            "keepalive_url": saved["keepalive_url"],
+            "login_at": None,
+            "refresh_at": None,  # Lifetime of a resumed session is unknown
+        }
+        return True
+
+    def _end_session(self, portal_id):
+        """The portal is back. Same portal on the same network -> our session expired."""
+        session, self.session = self.session, None
+        if not session:
+            return
+        if session["portal_id"] != portal_id or session["ssid"] != self.current_ssid:
+            self.store.sessions.discard(session["portal_id"])
+            return
+        # Our session ran out here: its cookies won't get us back in
+        self.store.cookies.discard(portal_id)
+        lifetime = self.store.sessions.record_expiry(portal_id)
+        if lifetime:
+            log.info(">> [%s] Session on %s expired after %.0f min.", self.name, portal_id, lifetime / 60)
+
+    def maintain_session(self):
+        """
+        Online through a portal we logged into: renew the session shortly
+        before its learned lifetime runs out, so the connection never drops.
+        """
+        session = self.session
+        if not session or session["refresh_at"] is None:
+            return  # Lifetime not learned yet: this session's expiry will teach us
+        if time.time() < session["refresh_at"]:
+            self.scheduler.wake_at(session["refresh_at"])
+            return
+        self.refresh_session()
+
+    def _follow_api_deadline(self):
+        """The Captive Portal API says when the session ends: renew / re-check on that, not on a guess."""
+        remaining = self.solver.seconds_remaining()
+        if not remaining:
+            return
+        expires_at = time.time() + remaining
+        log.debug("[%s] Captive Portal API: %.0fs of session left", self.name, remaining)
+        if self.session:
+            self.session["refresh_at"] = expires_at - min(REAUTH_LEAD, remaining / 2)
+        else:
+            # Not our login (or no way to renew it): log in again as soon as it ends
+            self.scheduler.wake_at(expires_at)
+
+    def refresh_session(self):
+        """
+        Pre-emptive re-login with the cached recipe while the portal still
+        serves its form; otherwise a keepalive request to the post-login page.
+        """
+        session = self.session
+        portal_id = session["portal_id"]
+        log.info(">> [%s] Session on %s is about to expire. Renewing...", self.name, portal_id)
+
+        creds = self.store.get_credentials(session["ssid"]) or self.store.find_by_portal_id(portal_id)
+        recipe = self.solver.recipes.get(portal_id) if self.solver.recipes is not None else None
+        if creds and recipe and session["login_url"]:
+            try:
+                page = self.solver.session.get(session["login_url"], timeout=REQUEST_TIMEOUT)
+                # Not the recipe's form (e.g. "already logged in") is no reason to invalidate it
+                form_info = self.solver.apply_recipe(recipe, page)
+            except Exception as e:
+                log.warning(">> Could not reload the login page: %s", e)
+                form_info = None
+            if form_info:
+                response = self.solver.login(form_info, creds['username'], creds['password'])
+                if response and self.solver.login_verdict(form_info, response) != LOGIN_REJECTED:
+                    log.info(">> Session renewed.")
+                    metrics.count("session_renewals", portal=portal_id)
+                    self._open_session(portal_id, session["login_url"], response)
+                    return
+
+        if session["keepalive_url"]:
+            try:
+                self.solver.session.get(session["keepalive_url"], timeout=REQUEST_TIMEOUT)
+                log.info(">> Keepalive sent.")
+            except Exception as e:
+                log.warning(">> Keepalive failed: %s", e)
+            session["refresh_at"] = time.time() + KEEPALIVE_REPEAT
+            self.scheduler.wake_at(session["refresh_at"])
+        else:
+            log.info(">> No way to renew this session. It will be re-logged after it expires.")
+            session["refresh_at"] = None
+
+    def has_credentials_for_current(self):
+        """True once credentials exist for the network we are prompting about."""
+        return bool(
+            self.store.get_credentials(self.current_ssid)
+            or self.store.find_by_portal_id(self.current_portal_id)
+        )
+
+    def resume(self):
+        """The front end is done with the prompt: go back to monitoring."""
+        self.scheduler.resume()
+
+
+class AgentGroup:
+    """
+    One independent AutoLoginAgent per Wi-Fi interface, so adapters sitting
+    on different captive networks are probed and logged in in parallel
+    (each agent has its own worker thread, bound sockets and cookie jar).
+    With a single adapter (or none detected) it runs one unbound agent, as before.
+    Storage, the network change watcher and the UI queue are shared.
+    """
+    def __init__(self, store=None, on_prompt=None, interfaces=None, recorder=None):
+        self.store = store or StorageManager()
+        self.ui_queue = queue.Queue()
+        self.net = NetworkManager()
+        if interfaces is None:
+            interfaces = self.net.get_wifi_interfaces()
+        if len(interfaces) <= 1:
+            interfaces = [None]
+        self.agents = [
+            AutoLoginAgent(
+                store=self.store, on_prompt=on_prompt, interface=interface, ui_queue=self.ui_queue, recorder=recorder
+            )
+            for interface in interfaces
+        ]
+        self.net_events = None
+
+    def start(self, delay=1):
+        # One watcher for all interfaces; every agent re-checks its own link
+        self.net_events = self.net.watch_changes(self.on_network_change)
+        for agent in self.agents:
+            agent.net_events = self.net_events
+            agent.start(delay=delay, watch_network=False)
+        log.info(">> Monitoring %s.", ", ".join(agent.name for agent in self.agents))
+
+    def stop(self):
+        for agent in self.agents:
+            agent.scheduler.stop()
+        if self.net_events:
+            self.net_events.stop()
+
+    def on_network_change(self, reason):
+        for agent in self.agents:
+            agent.net.invalidate_ssid_cache()
+            agent.on_network_change(reason)
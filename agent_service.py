@@ -0,0 +1,462 @@
+"""
+One shared agent per machine, with a local IPC API for thin front ends.
+
+A single process (the host) owns the AgentGroup: probing, logins and
+storage. Every front end (the app of each logged-in user, a second launch,
+`daemon.py status`) is a client of its socket, so probe traffic and CPU do
+not grow with the number of front ends. A lock file next to the socket
+allows one host per socket (per machine for root's daemon, see below); the
+app hosts the service itself when none is running, and when that app quits,
+another running app takes over.
+
+Transport: a Unix domain socket; a localhost TCP port (SERVICE_PORT) where
+AF_UNIX is missing (Windows, where peers cannot be told apart by the socket).
+  - run as root (the system daemon): SYSTEM_SOCKET, in a root-owned
+    directory; it serves the front ends of every local user
+  - otherwise: in the user's runtime directory ($XDG_RUNTIME_DIR, or a
+    private 0700 directory), serving that user's front ends only
+Each side checks who is at the other end (SO_PEERCRED, or the socket's
+owner): the service drops clients of other users (unless it is root), and a
+client only talks to a service run by itself or by root, so passwords never
+reach another user's process. Over TCP, both sides prove instead that they
+can read the service's token file (socket path + ".token", in the user's
+private directory): an HMAC handshake of random nonces, before anything
+else is sent (see _proof). Front ends look for the system daemon first.
+WIFI_AUTH_SOCKET overrides the path for both.
+
+Protocol: one JSON object per line.
+  TCP only, first:  client {"op": "hello", "nonce": n1}
+                    service {"event": "hello", "nonce": n2, "proof": _proof(token, "service", n1)}
+                    client {"op": "auth", "proof": _proof(token, "client", n2)}
+  client -> service
+    {"op": "login", "agent": name, "task": id, "username": ..., "password": ...}
+    {"op": "cancel", "task": id}
+    {"op": "resume", "agent": name}      prompt answered elsewhere / dismissed
+  service -> client
+    {"event": "snapshot", "agents": [state, ...]}   once, right after connecting
+    {"event": "state", "agent": name, "interface": ..., "state": ..., "ssid": ..., "portal": ...}
+                                                     on every change (AWAITING_USER = credentials needed)
+    {"event": "progress", "task": id, "text": ...}   to the client that started the login only
+    {"event": "done", "task": id, "success": bool, "text": ...}
+Passwords only travel from a client to the service, never back.
+"""
+import os
+import hmac
+import json
+import stat
+import socket
+import struct
+import hashlib
+import logging
+import secrets
+import tempfile
+import threading
+import socketserver
+from scheduler import AgentState
+
+log = logging.getLogger(__name__)
+
+SOCKET_NAME = "wifi-auto-login.sock"
+SYSTEM_SOCKET = os.path.join("/run", "wifi-auto-login", SOCKET_NAME)
+SERVICE_PORT = 47823  # Windows: localhost only
+
+CONNECT_TIMEOUT = 2
+
+# How often an agent waiting for credentials looks for ones added meanwhile
+# (e.g. `daemon.py add` from another terminal, same database) (seconds)
+CREDENTIALS_POLL = 2
+
+
+class InstanceLock:
+    """Exclusive, non-blocking lock on a file; released when the process exits."""
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def acquire(self):
+        """True if this process now holds the lock, False if another one does."""
+        # Read-only is enough to lock, and works on a lock file another user created
+        fd = os.open(self.path, os.O_RDONLY | os.O_CREAT, 0o644)
+        try:
+            if os.name == "nt":
+                import msvcrt
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def _uid():
+    return os.getuid() if hasattr(os, "getuid") else None
+
+
+def user_socket():
+    """The socket of this user's own service (in a directory only they can use)."""
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime and _uid() is not None and os.path.isdir(f"/run/user/{_uid()}"):
+        runtime = f"/run/user/{_uid()}"
+    if not runtime:
+        runtime = os.path.join(tempfile.gettempdir(), f"wifi-auto-login-{_uid() if _uid() is not None else 'user'}")
+    return os.path.join(runtime, SOCKET_NAME)
+
+
+def service_socket():
+    """Where this process hosts the service."""
+    return os.environ.get("WIFI_AUTH_SOCKET") or (SYSTEM_SOCKET if _uid() == 0 else user_socket())
+
+
+def client_sockets():
+    """Where a front end looks for the service: the system daemon first, then this user's."""
+    if os.environ.get("WIFI_AUTH_SOCKET"):
+        return [os.environ["WIFI_AUTH_SOCKET"]]
+    return [SYSTEM_SOCKET] if _uid() == 0 else [SYSTEM_SOCKET, user_socket()]
+
+
+def _private_dir(path):
+    """
+    Creates the socket's directory if needed and makes sure nobody else
+    controls it: owned by us (or root), not writable by group or others.
+    Raises PermissionError otherwise (e.g. a directory another user planted in /tmp).
+    Without POSIX owners (Windows) it is only created: the temp directory is the user's own.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o755 if _uid() == 0 else 0o700, exist_ok=True)
+    if _uid() is None:
+        return
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid not in (_uid(), 0) or st.st_mode & 0o022:
+        raise PermissionError(f"{directory} is not a private directory of this user")
+
+
+def peer_uid(sock, path=None):
+    """User id of the process at the other end of a Unix socket (None if unknown)."""
+    if hasattr(socket, "SO_PEERCRED"):  # Linux
+        pid, uid, gid = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+        return uid
+    if hasattr(socket, "LOCAL_PEERCRED"):  # macOS / BSD: struct xucred {version, uid, ...}
+        return struct.unpack_from("2I", sock.getsockopt(0, socket.LOCAL_PEERCRED, struct.calcsize("2I") + 68))[1]
+    if path is not None:
+        return os.stat(path).st_uid  # The service's socket: whoever created it
+    return None
+
+
+def _address(path):
+    return path if hasattr(socket, "AF_UNIX") else ("127.0.0.1", SERVICE_PORT)
+
+
+def _proof(token, side, nonce):
+    """Answer of `side` ("service" / "client") to the other side's nonce: only a holder of the token can give it."""
+    return hmac.new(token.encode(), f"{side}:{nonce}".encode(), hashlib.sha256).hexdigest()
+
+
+def _read_token(path):
+    with open(path + ".token", encoding="ascii") as f:
+        return f.read().strip()
+
+
+def _readline(sock):
+    """One line, read byte by byte (nothing of what follows is consumed)."""
+    data = b""
+    while not data.endswith(b"\n"):
+        byte = sock.recv(1)
+        if not byte:
+            raise ConnectionError("connection closed during the handshake")
+        data += byte
+    try:
+        return json.loads(data)
+    except ValueError:
+        raise ConnectionError("malformed handshake") from None
+
+
+if hasattr(socket, "AF_UNIX"):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        def verify_request(self, request, client_address):
+            return self.service.allowed(request)
+
+
+class _Connection(socketserver.StreamRequestHandler):
+    """One client: its requests are handled here, events are pushed by the service."""
+    def setup(self):
+        super().setup()
+        self._send_lock = threading.Lock()
+        self.tasks = {}  # task id -> LoginTask started by this client
+        self.trusted = self.server.service.token is None or self._authenticate(self.server.service.token)
+        if self.trusted:
+            self.server.service.attach(self)
+
+    def _authenticate(self, token):
+        """TCP: the client must prove it can read the token file (and learns that we can)."""
+        self.connection.settimeout(CONNECT_TIMEOUT)
+        try:
+            hello = json.loads(self.rfile.readline())
+            nonce = secrets.token_hex(16)
+            self.send({"event": "hello", "nonce": nonce, "proof": _proof(token, "service", str(hello.get("nonce")))})
+            answer = json.loads(self.rfile.readline())
+            trusted = hmac.compare_digest(str(answer.get("proof")), _proof(token, "client", nonce))
+        except (OSError, ValueError, AttributeError):
+            trusted = False
+        if not trusted:
+            log.warning(">> Refused a front end that does not hold the service token.")
+            return False
+        self.connection.settimeout(None)
+        return True
+
+    def handle(self):
+        if not self.trusted:
+            return
+        try:
+            for line in self.rfile:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    log.warning(">> Ignoring a malformed request from a front end.")
+                    continue
+                self.server.service.handle(self, message)
+        except OSError as e:
+            log.debug("Front end connection lost: %s", e)
+
+    def finish(self):
+        self.server.service.detach(self)
+        super().finish()
+
+    def send(self, message):
+        data = (json.dumps(message) + "\n").encode()
+        try:
+            with self._send_lock:
+                self.wfile.write(data)
+        except OSError:
+            pass  # Gone; detach() follows when its reader ends
+
+
+class AgentService:
+    """Hosts the AgentGroup behind the IPC socket (see the module docstring)."""
+    def __init__(self, group_factory, path=None):
+        self.group_factory = group_factory
+        self.path = path or service_socket()
+        self.lock = InstanceLock(self.path + ".lock")
+        self.token = None  # TCP only (see _proof)
+        self.group = None
+        self.server = None
+        self.clients = set()
+        self._clients_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self, delay=1):
+        """Takes the single-instance lock and starts serving. False if another host runs."""
+        try:
+            _private_dir(self.path)
+            if not self.lock.acquire():
+                return False
+        except OSError as e:
+            log.error(">> Cannot serve on %s: %s", self.path, e)
+            return False
+        try:
+            if hasattr(socket, "AF_UNIX"):
+                # We hold the lock: a socket file left behind belongs to a dead host
+                if os.path.exists(self.path):
+                    os.unlink(self.path)
+                self.server = _UnixServer(self.path, _Connection, bind_and_activate=False)
+                self.server.service = self
+                self.server.server_bind()
+                # Root's daemon serves every local user (checked per connection), a user's service that user
+                os.chmod(self.path, 0o666 if _uid() == 0 else 0o600)
+                self.server.server_activate()
+            else:
+                self.token = secrets.token_hex(32)
+                fd = os.open(self.path + ".token", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "w", encoding="ascii") as f:
+                    f.write(self.token)
+                self.server = socketserver.ThreadingTCPServer(_address(self.path), _Connection)
+        except OSError as e:
+            log.error(">> Cannot serve on %s: %s", self.path, e)
+            self.lock.release()
+            return False
+        self.server.daemon_threads = True
+        self.server.service = self
+
+        self.group = self.group_factory()
+        for agent in self.group.agents:
+            agent.scheduler.on_state = lambda state, agent=agent: self.broadcast(self.describe(agent))
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="agent-service").start()
+        threading.Thread(target=self._watch_credentials, daemon=True, name="credentials-watch").start()
+        self.group.start(delay=delay)
+        log.info(">> Agent service listening on %s.", self.path)
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        if self.group:
+            self.group.stop()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            for leftover in (self.path, self.path + ".token"):
+                if os.path.exists(leftover):
+                    os.unlink(leftover)
+        self.lock.release()
+
+    def _watch_credentials(self):
+        while not self._stopped.wait(CREDENTIALS_POLL):
+            for agent in self.group.agents:
+                if agent.scheduler.state == AgentState.AWAITING_USER and agent.has_credentials_for_current():
+                    log.info(">> [%s] Credentials found. Resuming...", agent.name)
+                    agent.resume()
+
+    # --- clients ---
+    def allowed(self, sock):
+        """Root's daemon serves everyone; a user's service only that user's front ends."""
+        if _uid() in (None, 0):
+            return True
+        try:
+            uid = peer_uid(sock)
+        except OSError:
+            uid = None
+        if uid is not None and uid != _uid():
+            log.warning(">> Refused a front end of another user (uid %s).", uid)
+            return False
+        return True  # Unknown: the socket is 0600 in a private directory
+
+    def attach(self, client):
+        with self._clients_lock:
+            self.clients.add(client)
+        client.send({"event": "snapshot", "agents": [self.describe(agent) for agent in self.group.agents]})
+        log.debug("Front end connected (%d).", len(self.clients))
+
+    def detach(self, client):
+        with self._clients_lock:
+            self.clients.discard(client)
+        log.debug("Front end disconnected (%d).", len(self.clients))
+
+    def broadcast(self, message):
+        with self._clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.send(message)
+
+    @staticmethod
+    def describe(agent):
+        return {
+            "event": "state", "agent": agent.name, "interface": agent.interface,
+            "state": agent.scheduler.state, "ssid": agent.current_ssid, "portal": agent.current_portal_id,
+        }
+
+    def _agent(self, name):
+        for agent in self.group.agents:
+            if agent.name == name:
+                return agent
+        return None
+
+    def handle(self, client, message):
+        op = message.get("op")
+        if op == "login":
+            agent = self._agent(message.get("agent"))
+            task_id = message.get("task")
+            if agent is None:
+                client.send({"event": "done", "task": task_id, "success": False, "text": "Unknown interface."})
+                return
+            log.info(">> [%s] Login submitted by a front end.", agent.name)
+            client.tasks[task_id] = agent.submit_login(
+                message.get("username", ""), message.get("password", ""),
+                on_progress=lambda task, text: client.send({"event": "progress", "task": task_id, "text": text}),
+                on_done=lambda task, success, text: self._done(client, task_id, success, text)
+            )
+        elif op == "cancel":
+            task = client.tasks.pop(message.get("task"), None)
+            if task:
+                task.cancel()
+        elif op == "resume":
+            agent = self._agent(message.get("agent"))
+            if agent and agent.scheduler.state == AgentState.AWAITING_USER:
+                agent.resume()
+        else:
+            log.warning(">> Unknown request from a front end: %r", op)
+
+    def _done(self, client, task_id, success, text):
+        client.tasks.pop(task_id, None)
+        client.send({"event": "done", "task": task_id, "success": success, "text": text})
+
+
+class ServiceClient:
+    """
+    Connection of a front end to the service (the first of `paths` that
+    answers, see client_sockets). on_event(message) and on_close() run on the
+    reader thread. Raises OSError if no service is listening, PermissionError
+    if the only one is run by another user (or, over TCP, cannot prove it holds the token).
+    """
+    def __init__(self, on_event, on_close=None, paths=None):
+        error = OSError("No agent service")
+        for path in paths or client_sockets():
+            try:
+                self.sock = self._connect(path)
+                self.path = path
+                break
+            except OSError as e:
+                error = e
+        else:
+            raise error
+        self.on_event = on_event
+        self.on_close = on_close
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._read, daemon=True, name="service-client").start()
+
+    @staticmethod
+    def _connect(path):
+        family = socket.AF_UNIX if hasattr(socket, "AF_UNIX") else socket.AF_INET
+        token = _read_token(path) if family == socket.AF_INET else None
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(_address(path))
+            # Passwords go to this socket: only to a service of this user, or root's
+            if token is not None:
+                ServiceClient._authenticate(sock, token, path)
+            uid = peer_uid(sock, path) if token is None and _uid() is not None else None
+            if uid is not None and uid not in (_uid(), 0):
+                raise PermissionError(f"{path} is served by another user (uid {uid})")
+        except OSError:
+            sock.close()
+            raise
+        sock.settimeout(None)
+        return sock
+
+    @staticmethod
+    def _authenticate(sock, token, path):
+        """TCP: whoever listens on the port must prove it can read our token file."""
+        nonce = secrets.token_hex(16)
+        sock.sendall((json.dumps({"op": "hello", "nonce": nonce}) + "\n").encode())
+        hello = _readline(sock)
+        if not isinstance(hello, dict) or not hmac.compare_digest(
+                str(hello.get("proof")), _proof(token, "service", nonce)):
+            raise PermissionError(f"the process on port {SERVICE_PORT} is not the service of {path}")
+        sock.sendall((json.dumps({"op": "auth", "proof": _proof(token, "client", str(hello.get("nonce")))}) + "\n").encode())
+
+    def send(self, message):
+        with self._send_lock:
+            self.sock.sendall((json.dumps(message) + "\n").encode())
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def _read(self):
+        try:
+            with self.sock.makefile("r", encoding="utf-8") as lines:
+                for line in lines:
+                    self.on_event(json.loads(line))
+        except (OSError, ValueError) as e:
+            log.debug("Service connection lost: %s", e)
+        if self.on_close:
+            self.on_close()
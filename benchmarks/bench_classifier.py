@@ -0,0 +1,122 @@
+"""
+Field classifier accuracy and throughput on the saved portal pages in corpus/.
+
+    python benchmarks/bench_classifier.py [--runs 2000]
+
+corpus/labels.json holds the expected username and password field of every
+labelled page. A page counts as correct when the chosen login form has
+exactly that username and that password field. The old inline keyword
+heuristic (legacy_roles) is measured alongside FieldClassifier.
+Throughput: fields classified per second, per page and for all pages batched.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from form_parser import StreamingFormExtractor
+from field_classifier import FieldClassifier
+from universal_solver import UniversalSolver
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+BASE_URL = "http://portal.example/login"
+
+
+def legacy_roles(forms):
+    """The solver's classification before field_classifier.py (reference)."""
+    roles = []
+    for form in forms:
+        form_roles = []
+        for inp in form["inputs"]:
+            name = inp.get("name")
+            inp_type = inp.get("type", "text").lower()
+            role = "unknown"
+            if inp_type == "password":
+                role = "password"
+            elif inp_type == "hidden":
+                role = "hidden"
+            elif inp_type in ["text", "email"]:
+                if name and any(x in name.lower() for x in ['user', 'name', 'login', 'id', 'email', 'auth']):
+                    role = "username"
+                else:
+                    role = "text"
+            form_roles.append(role)
+        roles.append(form_roles)
+    return roles
+
+
+class LegacyClassifier:
+    def classify_forms(self, forms):
+        return legacy_roles(forms)
+
+
+def load_pages():
+    with open(os.path.join(CORPUS_DIR, "labels.json"), "r", encoding="utf-8") as f:
+        labels = json.load(f)
+    pages = {}
+    for filename, expected in labels.items():
+        with open(os.path.join(CORPUS_DIR, filename), "r", encoding="utf-8") as f:
+            parser = StreamingFormExtractor()
+            parser.feed_chunk(f.read())
+            parser.close()
+        pages[filename] = (parser.forms, expected)
+    return pages
+
+
+def is_correct(solver, forms, expected):
+    form = solver.pick_best_form(forms, BASE_URL)
+    if not form:
+        return False
+    by_role = {}
+    for inp in form["inputs"]:
+        by_role.setdefault(inp["role"], []).append(inp["name"])
+    return by_role.get("username") == [expected["username"]] and by_role.get("password") == [expected["password"]]
+
+
+def fields_per_second(classifier, batches, runs):
+    fields = sum(len(form["inputs"]) for forms in batches for form in forms)
+    start = time.perf_counter()
+    for _ in range(runs):
+        for forms in batches:
+            classifier.classify_forms(forms)
+    return fields * runs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    pages = load_pages()
+    classifiers = {"legacy": LegacyClassifier(), "classifier": FieldClassifier()}
+    solvers = {}
+    for name, classifier in classifiers.items():
+        solver = UniversalSolver.__new__(UniversalSolver)  # No network objects needed
+        solver.classifier = classifier
+        solvers[name] = solver
+
+    print(f"{'page':<22} " + " ".join(f"{name:>10}" for name in classifiers))
+    totals = dict.fromkeys(classifiers, 0)
+    for filename, (forms, expected) in pages.items():
+        marks = []
+        for name in classifiers:
+            ok = is_correct(solvers[name], forms, expected)
+            totals[name] += ok
+            marks.append(f"{'ok' if ok else 'WRONG':>10}")
+        print(f"{filename:<22} " + " ".join(marks))
+    print(f"{'accuracy':<22} " + " ".join(f"{totals[name] / len(pages):>10.0%}" for name in classifiers))
+
+    per_page = [forms for forms, _ in pages.values()]
+    batched = [[form for forms in per_page for form in forms]]
+    print()
+    print(f"{'fields/s':<22} {'per page':>10} {'batched':>10}")
+    for name, classifier in classifiers.items():
+        print(f"{name:<22} {fields_per_second(classifier, per_page, args.runs):>10.0f} "
+              f"{fields_per_second(classifier, batched, args.runs):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
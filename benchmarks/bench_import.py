@@ -0,0 +1,106 @@
+"""
+Bulk profile import / export (provisioning.py) at fleet scale.
+
+    python benchmarks/bench_import.py [--rows 100000] [--portals 500]
+
+Generates a profile file in each format (every 10th row references its
+password through env:, every portal gets a login recipe, 1% duplicate SSIDs
+and 1% invalid rows), imports it into a fresh database and exports it again.
+Reports wall time, rows per second and the peak Python heap of the import
+(measured in a second, traced import so tracing doesn't skew the timing).
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import StorageManager
+from provisioning import import_profiles, export_profiles, FIELDS, FORMATS
+
+
+def make_rows(rows, portals):
+    for index in range(rows):
+        portal = f"http://10.{index % portals // 250}.{index % 250}.1:1000"
+        ssid = f"Site{index % portals:04d}_WiFi_{index:06d}"
+        if index % 100 == 99:
+            ssid = f"Site{(index - 1) % portals:04d}_WiFi_{index - 1:06d}"  # Duplicate of the previous row
+        row = {
+            "ssid": ssid,
+            "portal": portal,
+            "username": f"user{index}",
+            "secret": f"env:WIFI_PASSWORD_{index % 7}" if index % 10 == 0 else f"plain:pw{index}",
+            "recipe": None,
+        }
+        if index < portals:
+            row["recipe"] = {
+                "id": 0, "action": portal + "/login", "method": "POST",
+                "fields": [
+                    {"name": "magic", "type": "hidden", "role": "hidden"},
+                    {"name": "username", "type": "text", "role": "username"},
+                    {"name": "password", "type": "password", "role": "password"},
+                ],
+                "tokens": ["magic"],
+            }
+        if index % 100 == 50:
+            row["secret"] = "nope"  # Invalid
+        yield row
+
+
+def write_file(path, fmt, rows, portals):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, FIELDS)
+            writer.writeheader()
+            for row in make_rows(rows, portals):
+                writer.writerow(dict(row, recipe=json.dumps(row["recipe"]) if row["recipe"] else ""))
+        else:
+            for row in make_rows(rows, portals):
+                f.write(json.dumps(row) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--portals", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'format':<7} {'import s':>9} {'rows/s':>9} {'peak heap MB':>13} {'export s':>9} "
+          f"{'stored':>8} {'invalid':>8} {'file MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in FORMATS:
+            source = os.path.join(tmp, f"profiles.{fmt}")
+            write_file(source, fmt, args.rows, args.portals)
+            store = StorageManager(os.path.join(tmp, f"{fmt}.db"))
+            store.conn  # Open (and create) the database outside the measurement
+
+            start = time.perf_counter()
+            result = import_profiles(store, source)
+            elapsed = time.perf_counter() - start
+
+            traced = StorageManager(os.path.join(tmp, f"{fmt}-traced.db"))
+            traced.conn
+            tracemalloc.start()
+            import_profiles(traced, source)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            traced.close()
+
+            start = time.perf_counter()
+            export_profiles(store, os.path.join(tmp, f"export.{fmt}"), include_passwords=True)
+            exported = time.perf_counter() - start
+
+            stored = len(store.list_networks())
+            print(f"{fmt:<7} {elapsed:>9.2f} {result['read'] / elapsed:>9.0f} {peak / 1024 / 1024:>13.1f} "
+                  f"{exported:>9.2f} {stored:>8} {result['invalid']:>8} "
+                  f"{os.path.getsize(source) / 1024 / 1024:>8.1f}")
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
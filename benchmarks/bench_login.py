@@ -0,0 +1,231 @@
+"""
+End-to-end login benchmark against the local captive portal simulator.
+
+    python benchmarks/bench_login.py [--runs 30] [--scenario fortinet ...] [--mode solver agent] [--metrics]
+
+For every scenario the simulator runs in its own process (so its CPU is not
+counted) and the client logs in --runs times. Modes:
+  solver  get_portal_page -> analyze_page -> login, driven directly
+  agent   AutoLoginAgent.background_logic with saved credentials (headless)
+  api     the same, but the network advertises its Captive Portal API
+          (RFC 8908, the simulator's /captive-api over HTTPS, self-signed
+          certificate from the openssl tool) so nothing is probed to find the portal
+  resume  agent restarted / roamed to another AP while its portal session is still
+          valid: the saved portal cookies get it back online without a login
+Each run ends when a probe reports ONLINE. Reported per scenario/mode:
+p50/p95/p99 time-to-online, bytes per login and client CPU per login. Bytes
+are counted on the client (ClientBytes): what it sent plus what it actually
+read, so a response abandoned after its head (early exit, stream=True) only
+counts the part that was read, not everything the simulator wrote.
+With --metrics the instrumentation is switched on and the time spent per span
+(probe, page_fetch, form_analysis, login_post, ...) is printed at the end.
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+import contextlib
+import multiprocessing
+import urllib.request
+
+from requests.adapters import HTTPAdapter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from portal_simulator import SCENARIOS, USERNAME, PASSWORD, serve, make_certificate
+from universal_solver import UniversalSolver
+from network_manager import NetworkManager
+from transport import Transport
+from storage import StorageManager
+from probe_engine import ProbeEngine, ONLINE
+from agent import AutoLoginAgent
+from metrics import metrics
+
+MODES = ["solver", "agent", "api", "resume"]
+
+# Give up on a single run after this long (seconds)
+RUN_TIMEOUT = 30
+
+
+def control(base, path):
+    with urllib.request.urlopen(base + path, timeout=5) as response:
+        return response.read()
+
+
+class ClientBytes(HTTPAdapter):
+    """
+    Sends through `adapter` and counts the bytes of every exchange as the
+    client sees them: request line, headers and body sent, then status line,
+    headers and the part of the body read so far (raw.tell(), on the wire
+    encoding). take() returns the total since the last take().
+    """
+    def __init__(self, adapter):
+        super().__init__()
+        self.adapter = adapter
+        self.sent = 0
+        self.responses = []
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        response = self.adapter.send(request, **kwargs)
+        body = request.body or b""
+        sent = (len(f"{request.method} {request.path_url} HTTP/1.1\r\n") + _headers_size(request.headers) +
+                len(body.encode() if isinstance(body, str) else body))
+        with self._lock:
+            self.sent += sent
+            self.responses.append(response.raw)
+        return response
+
+    def take(self):
+        with self._lock:
+            responses, self.responses = self.responses, []
+            total, self.sent = self.sent, 0
+        for raw in responses:
+            total += len(f"HTTP/1.1 {raw.status} {raw.reason}\r\n") + _headers_size(raw.headers) + raw.tell()
+        return total
+
+    def close(self):
+        self.adapter.close()
+
+
+def _headers_size(headers):
+    return sum(len(name) + len(value) + 4 for name, value in headers.items()) + 2
+
+
+def build_agent(base, db_path, api=None, ca=None):
+    """`api`: URI of the Captive Portal API to advertise; `ca`: certificate it is verified with."""
+    store = StorageManager(path=db_path)
+    transport = Transport()
+    transport.adapter = ClientBytes(transport.adapter)
+    solver = UniversalSolver(recipes=store.recipes, transport=transport)
+    if ca:
+        solver.session.verify = ca
+        solver.session.trust_env = False  # Else $REQUESTS_CA_BUNDLE wins over session.verify
+    # Point the probes at the simulator instead of the real internet
+    solver.prober = ProbeEngine(
+        endpoints=[
+            {"url": base + "/generate_204", "expect_status": 204, "timeout": 3},
+            {"url": base + "/neverssl", "expect_text": "NeverSSL", "timeout": 5},
+        ],
+        session=solver.transport.probe_session(dict(solver.session.headers))
+    )
+    net = NetworkManager(prober=solver.prober, captive_api=api)
+    store.save_credentials("BENCH_WIFI", USERNAME, PASSWORD, base)
+    return AutoLoginAgent(store=store, solver=solver, net=net)
+
+
+def login_once(agent, mode):
+    solver = agent.solver
+    if mode == "solver":
+        page = solver.get_portal_page()
+        if page in (None, ONLINE):
+            return page == ONLINE
+        form = solver.analyze_page(page)
+        if not form or not solver.login(form, USERNAME, PASSWORD):
+            return False
+    else:
+        agent.background_logic()
+
+    # Time-to-online: keep probing until the portal lets us through
+    deadline = time.monotonic() + RUN_TIMEOUT
+    while time.monotonic() < deadline:
+        if solver.prober.probe() == ONLINE:
+            return True
+    return False
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(scenario, modes, runs, delay):
+    certs = tempfile.TemporaryDirectory()
+    certificate = make_certificate(certs.name) if "api" in modes else None
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(scenario, port_queue, delay, 0, certificate), daemon=True)
+    server.start()
+    base = f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+    api = f"https://127.0.0.1:{port_queue.get(timeout=10)}/captive-api" if certificate else None
+
+    results = []
+    try:
+        for mode in modes:
+            with tempfile.TemporaryDirectory() as tmp:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    agent = build_agent(base, os.path.join(tmp, "bench.db"),
+                                        *((api, certificate[0]) if mode == "api" else ()))
+                timings, cpu, bytes_total, failures = [], [], [], 0
+
+                # resume: one real login first, every measured run then starts like a restarted agent
+                for run in range(runs + (mode == "resume")):
+                    control(base, "/roam" if mode == "resume" and run else "/reset")
+                    agent.solver.session.cookies.clear()
+                    if mode == "resume":
+                        agent.session = None
+
+                    agent.solver.transport.adapter.take()
+                    wall_start, cpu_start = time.perf_counter(), time.process_time()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        ok = login_once(agent, mode)
+                    wall, used = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+                    transferred = agent.solver.transport.adapter.take()
+                    if mode == "resume" and not run:
+                        continue
+                    if not ok:
+                        failures += 1
+                        continue
+                    timings.append(wall)
+                    cpu.append(used)
+                    bytes_total.append(transferred)
+
+                agent.store.close()
+                results.append((scenario, mode, sorted(timings), cpu, bytes_total, failures))
+    finally:
+        server.terminate()
+        certs.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--mode", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--delay", type=float, default=0.2, help="Per-response delay of the 'slow' scenario (s)")
+    parser.add_argument("--metrics", action="store_true", help="Record spans/counters and print the breakdown")
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.enable()
+
+    print(f"{'scenario':<10} {'mode':<7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'KB/login':>9} {'CPU ms':>7} {'fail':>5}")
+    for scenario in args.scenario:
+        for name, mode, timings, cpu, bytes_total, failures in run_scenario(
+                scenario, args.mode, args.runs, args.delay):
+            if not timings:
+                print(f"{name:<10} {mode:<7} {'-':>8} {'-':>8} {'-':>8} {'-':>9} {'-':>7} {failures:>5}")
+                continue
+            print(f"{name:<10} {mode:<7} {percentile(timings, 50) * 1000:>8.1f} "
+                  f"{percentile(timings, 95) * 1000:>8.1f} {percentile(timings, 99) * 1000:>8.1f} "
+                  f"{statistics.mean(bytes_total) / 1024:>9.1f} {statistics.mean(cpu) * 1000:>7.1f} "
+                  f"{failures:>5}")
+
+    if args.metrics:
+        snapshot = metrics.snapshot()
+        print(f"\n{'span':<32} {'count':>6} {'mean ms':>8} {'total s':>8}")
+        for name, span in sorted(snapshot["spans"].items()):
+            print(f"{name:<32} {span['count']:>6} {span['sum'] / span['count'] * 1000:>8.1f} {span['sum']:>8.2f}")
+        print(f"\n{'counter':<48} {'value':>6}")
+        for name, value in sorted(snapshot["counters"].items()):
+            print(f"{name:<48} {value:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Cost of the instrumentation (metrics.py) on the hot path.
+
+    python benchmarks/bench_metrics.py [--calls 200000]
+
+Times an empty span and a labelled counter increment while disabled (the
+default), enabled in memory, and enabled with the JSON-lines file.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Metrics
+
+
+def per_call_ns(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def measure(metrics, calls):
+    def span():
+        with metrics.span("probe"):
+            pass
+
+    def count():
+        metrics.count("probes", outcome="online")
+
+    return per_call_ns(span, calls), per_call_ns(count, calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'span ns':>9} {'count ns':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        modes = [
+            ("disabled", Metrics(), None),
+            ("memory", Metrics(), {}),
+            ("jsonl", Metrics(), {"jsonl": os.path.join(tmp, "metrics.jsonl")}),
+        ]
+        for name, metrics, options in modes:
+            if options is not None:
+                metrics.enable(**options)
+            # The JSON-lines mode writes one line per call: keep the file small
+            calls = args.calls if name != "jsonl" else max(args.calls // 10, 1)
+            span_ns, count_ns = measure(metrics, calls)
+            print(f"{name:<10} {span_ns:>9.0f} {count_ns:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
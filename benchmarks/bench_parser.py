@@ -0,0 +1,104 @@
+"""
+Streaming form extractor vs. BeautifulSoup on the saved portal pages in corpus/.
+
+    python benchmarks/bench_parser.py [--runs 50]
+
+For every page it checks that both paths pick the same login form, then
+reports the median parse time and the peak memory (tracemalloc) of each,
+and the time a known portal takes (its cached recipe applied to the stream).
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import statistics
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from form_parser import extract_forms, extract_forms_soup
+from universal_solver import UniversalSolver
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+BASE_URL = "http://portal.example/login"
+
+# Vendor portals that ship ~500 KB of inline JS and images
+PADDING = "<script>" + ("var x = 'lorem ipsum dolor sit amet';\n" * 14000) + "</script>"
+
+
+def load_corpus():
+    pages = {}
+    for filename in sorted(os.listdir(CORPUS_DIR)):
+        if filename.endswith(".html"):
+            with open(os.path.join(CORPUS_DIR, filename), "r", encoding="utf-8") as f:
+                pages[filename] = f.read()
+
+    # Large variants: junk after the form (early exit pays off) and before it (it can't)
+    heavy = pages.get("vendor_heavy.html")
+    if heavy:
+        pages["vendor_heavy_500k_tail.html"] = heavy.replace("<!-- PADDING -->", PADDING)
+        pages["vendor_heavy_500k_head.html"] = heavy.replace("</head>", PADDING + "</head>")
+    return pages
+
+
+def make_response(text):
+    """An unread response, as it comes off the socket with stream=True."""
+    response = requests.Response()
+    response.raw = io.BytesIO(text.encode("utf-8"))
+    response.status_code = 200
+    response.encoding = "utf-8"
+    response.url = BASE_URL
+    return response
+
+
+def run_streaming(text):
+    return extract_forms(make_response(text)).forms
+
+
+def run_soup(text):
+    # The old path: whole body in memory, then a full tree
+    return extract_forms_soup(make_response(text).text)[0]
+
+
+def run_recipe(solver, recipe):
+    return lambda text: solver.apply_recipe(recipe, make_response(text))
+
+
+def measure(func, text, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(text)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--runs", type=int, default=50)
+    args = arg_parser.parse_args()
+
+    solver = UniversalSolver()
+    print(f"{'page':<30} {'KB':>6} {'stream ms':>10} {'soup ms':>9} {'recipe ms':>10} "
+          f"{'stream KB':>10} {'soup KB':>9}  same")
+    for name, text in load_corpus().items():
+        form_details = solver.pick_best_form(run_streaming(text), BASE_URL)
+        same = form_details == solver.pick_best_form(run_soup(text), BASE_URL)
+        stream_t, stream_mem = measure(run_streaming, text, args.runs)
+        soup_t, soup_mem = measure(run_soup, text, args.runs)
+        recipe = "-"
+        if form_details:
+            recipe = f"{measure(run_recipe(solver, solver.compile_recipe(form_details)), text, args.runs)[0] * 1000:.2f}"
+        print(f"{name:<30} {len(text) / 1024:>6.0f} {stream_t * 1000:>10.2f} {soup_t * 1000:>9.2f} {recipe:>10} "
+              f"{stream_mem / 1024:>10.0f} {soup_mem / 1024:>9.0f}  {'yes' if same else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Offline replay of captured portal traffic (see capture.py).
+
+    python benchmarks/bench_replay.py [--runs 1000]                 # record the simulator, replay it
+    python benchmarks/bench_replay.py --record captures/            # only record (one archive per scenario)
+    python benchmarks/bench_replay.py captures/*.har.gz [--speed 1]  # replay archives (e.g. from the field)
+    python benchmarks/bench_replay.py captures/*.har.gz --metrics    # + time per span (parsing, deciding, ...)
+
+Recording runs every simulator scenario once through get_portal_page ->
+analyze_page -> login -> probe (until ONLINE) with a capturing Transport.
+Replaying feeds each archive back through the same calls --runs times with
+no network: it reports what the client decided (form found, login verdict,
+online afterwards), whether every replay decided the same, and replays per
+second (the cost of parsing and deciding alone). With --speed the recorded
+response times are waited out (1 = real time), so slow portals replay slow.
+A replay that is not "stable" decided differently depending on which probe
+of a race answered first (the race is run for real, on threads).
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from portal_simulator import SCENARIOS, USERNAME, PASSWORD, serve
+from universal_solver import UniversalSolver
+from probe_engine import ProbeEngine, DEFAULT_ENDPOINTS, ONLINE
+from transport import Transport
+from capture import Recorder
+from metrics import metrics
+
+# Probes of the simulator (by path) next to the real-internet defaults
+SIMULATOR_PROBES = {
+    "/generate_204": {"expect_status": 204, "timeout": 3},
+    "/neverssl": {"expect_text": "NeverSSL", "timeout": 5},
+}
+
+# Give up waiting for ONLINE after the login while recording (seconds)
+RECORD_TIMEOUT = 30
+
+
+def simulator_endpoints(base):
+    return [dict(probe, url=base + path) for path, probe in SIMULATOR_PROBES.items()]
+
+
+def archive_endpoints(adapter):
+    """The probe endpoints the archive was captured with (so the replayed race asks the same URLs)."""
+    urls = {url for method, url in adapter.answers if method == "GET"}
+    endpoints = [endpoint for endpoint in DEFAULT_ENDPOINTS if endpoint["url"] in urls]
+    for url in sorted(urls):
+        probe = SIMULATOR_PROBES.get(urlparse(url).path)
+        if probe:
+            endpoints.append(dict(probe, url=url))
+    return endpoints or DEFAULT_ENDPOINTS
+
+
+def build_solver(transport, endpoints):
+    solver = UniversalSolver(transport=transport)
+    solver.prober = ProbeEngine(
+        endpoints=endpoints, session=transport.probe_session(dict(solver.session.headers))
+    )
+    return solver
+
+
+def walk(solver, username, password, wait_online=0):
+    """One pass through the login sequence; returns what was decided at each step."""
+    page = solver.get_portal_page()
+    if page is None or page == ONLINE:
+        return ("down" if page is None else "online", "-", "-", "-")
+    form = solver.analyze_page(page)
+    if not form:
+        return ("portal", solver.last_outcome or "no form", "-", "-")
+    response = solver.login(form, username, password)
+    verdict = solver.login_verdict(form, response) if response is not None else "no answer"
+
+    deadline = time.monotonic() + wait_online
+    online = solver.prober.probe() == ONLINE
+    while not online and time.monotonic() < deadline:
+        online = solver.prober.probe() == ONLINE
+    return ("portal", "form", verdict, "online" if online else "captive")
+
+
+def record(scenario, path):
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(scenario, port_queue, 0.2), daemon=True)
+    server.start()
+    base = f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+    try:
+        recorder = Recorder()
+        solver = build_solver(Transport(recorder=recorder), simulator_endpoints(base))
+        with contextlib.redirect_stdout(io.StringIO()):
+            walk(solver, USERNAME, PASSWORD, wait_online=RECORD_TIMEOUT)
+        solver.prober.drain()  # The race's losers belong in the archive too
+        return recorder.save(path)
+    finally:
+        server.terminate()
+
+
+def replay(path, runs, speed):
+    transport = Transport(replay=path, replay_speed=speed)
+    solver = build_solver(transport, archive_endpoints(transport.adapter))
+    outcomes = set()
+    start = time.perf_counter()
+    for _ in range(runs):
+        transport.adapter.rewind()
+        solver.session.cookies.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            outcomes.add(walk(solver, "user", "password"))
+        solver.prober.drain()  # The race's losers must not eat the next replay's answers
+    elapsed = time.perf_counter() - start
+    return outcomes, runs / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("archives", nargs="*", help="HAR files to replay (default: record the simulator first)")
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--record", default=None, metavar="DIR", help="Record every simulator scenario into DIR and stop")
+    parser.add_argument("--speed", type=float, default=None, help="Replay at recorded timing / SPEED (default: instant)")
+    parser.add_argument("--metrics", action="store_true", help="Record spans during the replays and print the breakdown")
+    args = parser.parse_args()
+
+    if args.record:
+        os.makedirs(args.record, exist_ok=True)
+        for scenario in SCENARIOS:
+            path = os.path.join(args.record, f"{scenario}.har.gz")
+            print(f"{scenario:<10} {record(scenario, path):>4} requests -> {path}")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        archives = args.archives
+        if not archives:
+            archives = [os.path.join(tmp, f"{scenario}.har.gz") for scenario in SCENARIOS]
+            for scenario, path in zip(SCENARIOS, archives):
+                record(scenario, path)
+
+        if args.metrics:
+            metrics.enable()  # After recording: only replays are measured
+        print(f"{'archive':<24} {'page':<7} {'form':<14} {'verdict':<9} {'after':<8} {'stable':>6} {'replays/s':>10}")
+        for path in archives:
+            outcomes, rate = replay(path, args.runs, args.speed)
+            page, form, verdict, after = sorted(outcomes)[0]
+            name = os.path.basename(path)
+            print(f"{name:<24} {page:<7} {form:<14} {verdict:<9} {after:<8} "
+                  f"{'yes' if len(outcomes) == 1 else len(outcomes):>6} {rate:>10.0f}")
+
+    if args.metrics:
+        snapshot = metrics.snapshot()
+        print(f"\n{'span':<32} {'count':>6} {'mean ms':>8} {'total s':>8}")
+        for name, span in sorted(snapshot["spans"].items()):
+            print(f"{name:<32} {span['count']:>6} {span['sum'] / span['count'] * 1000:>8.3f} {span['sum']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
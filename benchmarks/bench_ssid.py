@@ -0,0 +1,66 @@
+"""
+Per-call latency of the SSID lookup paths.
+
+    python benchmarks/bench_ssid.py [--runs 200] [--interface wlan0]
+
+Linux: subprocess (iwgetid/nmcli) vs. native nl80211 vs. cached get_ssid().
+Other systems: uncached vs. cached get_ssid().
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from network_manager import NetworkManager
+
+
+def measure(func, runs):
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--interface", default=None)
+    args = parser.parse_args()
+
+    nm = NetworkManager(interface=args.interface)
+    print(f"OS: {nm.os_type} | Wi-Fi interfaces: {nm.get_wifi_interfaces() or 'none found'}")
+
+    paths = []
+    if nm.os_type == "Linux":
+        paths.append(("subprocess", lambda: nm._get_ssid_linux_subprocess(args.interface)))
+        paths.append(("native (nl80211)", lambda: nm._get_ssid_linux_native(args.interface)))
+    else:
+        def uncached():
+            nm.invalidate_ssid_cache()
+            return nm.get_ssid()
+        paths.append(("uncached", uncached))
+
+    # Warm the cache once, then every call is a dict lookup
+    nm._events_active = True
+    nm.get_ssid()
+    paths.append(("cached get_ssid()", nm.get_ssid))
+
+    print(f"{'path':<20} {'p50 us':>10} {'p95 us':>10}  result")
+    for name, func in paths:
+        try:
+            p50, p95, result = measure(func, args.runs)
+        except Exception as e:
+            print(f"{name:<20} {'-':>10} {'-':>10}  unavailable ({e})")
+            continue
+        print(f"{name:<20} {p50 * 1e6:>10.1f} {p95 * 1e6:>10.1f}  {result!r}")
+
+
+if __name__ == "__main__":
+    main()
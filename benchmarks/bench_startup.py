@@ -0,0 +1,89 @@
+"""
+Startup time and memory of the headless daemon vs. the GUI window.
+
+    python benchmarks/bench_startup.py [--runs 5]
+
+Each measurement runs in a fresh interpreter:
+  headless    what `daemon.py run` does before its loop: AgentService + AgentGroup,
+              service.start() (lock, socket, agents started)
+  app-hidden  import main_ui + AutoLoginApp.connect(): no service is running, so the app
+              hosts it in-process and connects to it (GUI mode while no portal is shown)
+  gui         the above + build the customtkinter LoginWindow (needs a display)
+The service's socket (WIFI_AUTH_SOCKET) and database live in a temporary
+directory, so an agent already running on this machine is not involved.
+Reports wall time to "ready" and the peak RSS of the process.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import sys, time, json, resource
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+mode = {mode!r}
+if mode == "headless":
+    from agent import AgentGroup
+    from agent_service import AgentService
+    from storage import StorageManager, DB_FILE
+    service = AgentService(lambda: AgentGroup(store=StorageManager(DB_FILE), on_prompt=lambda agent: None))
+    if not service.start(delay=1):
+        sys.exit("the agent service did not start")
+else:
+    from main_ui import AutoLoginApp, RemoteAgent
+    app = AutoLoginApp()
+    app.connect()
+    if app.service is None:
+        sys.exit("the app did not host the agent service")
+    if mode == "gui":
+        from login_window import LoginWindow
+        window = LoginWindow(app, RemoteAgent(app, "default"))
+        window.withdraw()
+        window.update()
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss //= 1024  # bytes on macOS, KB elsewhere
+print(json.dumps({{"seconds": elapsed, "rss_kb": rss, "tk": "tkinter" in sys.modules}}))
+"""
+
+MODES = ["headless", "app-hidden", "gui"]
+
+
+def run_child(mode, workdir):
+    code = CHILD.format(root=ROOT, mode=mode)
+    env = dict(os.environ, WIFI_AUTH_SOCKET=os.path.join(workdir, "bench.sock"))
+    process = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, cwd=workdir, env=env, timeout=60
+    )
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1] if process.stderr else "failed")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12} {'startup ms':>11} {'peak RSS MB':>12}  tk loaded")
+    with tempfile.TemporaryDirectory() as workdir:  # keeps test databases out of the project
+        for mode in MODES:
+            try:
+                samples = [run_child(mode, workdir) for _ in range(args.runs)]
+            except Exception as e:
+                print(f"{mode:<12} {'-':>11} {'-':>12}  unavailable ({e})")
+                continue
+            seconds = statistics.median(s["seconds"] for s in samples)
+            rss = statistics.median(s["rss_kb"] for s in samples)
+            print(f"{mode:<12} {seconds * 1000:>11.1f} {rss / 1024:>12.1f}  {samples[0]['tk']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,533 @@
+"""
+Behaviour checks the timing benchmarks can't see, against the local portal simulator.
+
+    python benchmarks/checks.py [name ...]     # all checks by default
+
+Every check prints "ok" or "FAIL: why"; the exit status is the number of failures.
+  dns_after_login  the portal hijacks DNS (probe host -> portal) until the login:
+                   the post-login check must resolve again and reach the real host
+  dns_per_interface two agents, one behind a DNS-hijacking portal (bound to lo), one not:
+                   the portal's answer must not be reused by the other agent
+  text_probe       the text probe reads only the head of a 1 MB portal page, and the page
+                   it hands on still parses in full
+  recipe_schema    an imported recipe lacking what apply_recipe reads is rejected; one
+                   already cached is dropped and re-learned instead of failing every tick
+  recipe_tokens    a known portal's tokens come from the recipe's own form, and the page is
+                   streamed once (no full download before the early exit)
+  prompt_no_recipe an unknown portal (terms, then a login form) is walked before the prompt, but
+                   its recipe is only cached once the user's login worked
+  login_deadlines  a login stage that answers just after its budget still succeeds, one that
+                   hangs fails at its deadline, and cancel() ends a running stage at once
+  login_off_portal a portal that accepts a login by redirecting off the portal to a 204
+                   page: the login task succeeds (as the background agent does)
+  fingerprint_tick an unsolvable page is recorded, the agent waits the TTL it got: the
+                   next scheduled ticks on the unchanged page hit the cache
+  captive_api_https a Captive Portal API saying "captive": false is only believed over
+                   HTTPS with a trusted certificate; plain HTTP is not even asked
+  service_start    the agent service starts on its default path (as daemon.py run and the
+                   app do), a front end gets its snapshot, a second host is refused
+  service_tcp      without AF_UNIX (Windows) the service still starts, on localhost TCP: its
+                   front ends authenticate with the token file, an impostor on the port is refused
+"""
+import io
+import json
+import os
+import sys
+import argparse
+import time
+import tempfile
+import threading
+import socket
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from portal_simulator import USERNAME, PASSWORD, make_server, make_api_server, make_certificate
+from universal_solver import UniversalSolver
+from form_parser import extract_forms
+from probe_engine import ProbeEngine, ONLINE, TEXT_PROBE_BYTES
+from transport import Transport
+from login_task import LoginTask, STAGE_GRACE
+from agent import AutoLoginAgent, AgentGroup
+import agent_service
+from agent_service import AgentService, ServiceClient
+from scheduler import AgentState
+from storage import StorageManager
+from provisioning import import_profiles
+import fingerprint_cache
+from fingerprint_cache import FingerprintCache, NO_FORM
+
+PROBE_HOST = "probe.check.test"
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def expect(condition, why):
+    if not condition:
+        raise CheckFailed(why)
+
+
+@contextlib.contextmanager
+def simulator(scenario="redirect", host="127.0.0.1", port=0):
+    """An in-process simulator; yields the server (state: server.RequestHandlerClass.state)."""
+    server = make_server(scenario, port, host=host)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def build_solver(base, transport=None):
+    solver = UniversalSolver(transport=transport or Transport())
+    solver.prober = ProbeEngine(
+        endpoints=[
+            {"url": base + "/generate_204", "expect_status": 204, "timeout": 2},
+            {"url": base + "/neverssl", "expect_text": "NeverSSL", "timeout": 2},
+        ],
+        session=solver.transport.probe_session(dict(solver.session.headers))
+    )
+    return solver
+
+
+def check_dns_after_login():
+    # The portal (127.0.0.1) answers the probe host until the login; the internet is 127.0.0.2
+    with simulator() as portal, simulator(host="127.0.0.2", port=portal.server_port) as internet:
+        internet.RequestHandlerClass.state.authenticated = True
+        answer = {"ip": "127.0.0.1"}
+        transport = Transport()
+        resolve = transport.dns._resolve
+
+        def hijacked(host, port, *args, **kwargs):
+            return resolve(answer["ip"] if host == PROBE_HOST else host, port, *args, **kwargs)
+
+        transport.dns._resolve = hijacked
+        transport.dns.clear()
+        try:
+            solver = build_solver(f"http://{PROBE_HOST}:{portal.server_port}", transport)
+            page = solver.get_portal_page()
+            expect(page is not None and page != "ONLINE", "the hijacked probe did not find the portal")
+            form = solver.analyze_page(page)
+            expect(form is not None, "no login form on the portal")
+
+            post = solver.session.post
+
+            def post_and_release(*args, **kwargs):
+                response = post(*args, **kwargs)
+                # Logged in: DNS now tells the truth, the portal host stays a portal for others
+                answer["ip"] = "127.0.0.2"
+                portal.RequestHandlerClass.state.authenticated = False
+                return response
+
+            solver.session.post = post_and_release
+            expect(solver.login(form, USERNAME, PASSWORD) is not None, "login POST failed")
+            expect(solver.prober.confirm_online(deadline=2), "post-login check still reached the portal (stale DNS)")
+        finally:
+            transport.dns._resolve = resolve
+            transport.dns.clear()
+
+
+def check_text_probe():
+    with simulator("large") as portal:
+        base = f"http://127.0.0.1:{portal.server_port}"
+        solver = build_solver(base)
+        text_probe = next(ep for ep in solver.prober.endpoints if "expect_text" in ep)
+        page = solver.prober._check_endpoint(text_probe)
+        expect(page is not None and page != "ONLINE", "the text probe did not see the portal")
+        head = getattr(page.raw, "head", None)
+        expect(head is not None and len(head) <= TEXT_PROBE_BYTES, "the text probe read the whole portal page")
+        expect(solver.pick_best_form(extract_forms(page).forms, page.url) is not None,
+               "no login form in the page the text probe handed on")
+
+        portal.RequestHandlerClass.state.authenticated = True
+        expect(solver.prober._check_endpoint(text_probe) == "ONLINE", "the text probe missed its marker")
+
+
+def check_recipe_schema():
+    with simulator() as portal, tempfile.TemporaryDirectory() as tmp:
+        base = f"http://127.0.0.1:{portal.server_port}"
+        store = StorageManager(os.path.join(tmp, "wifi_map.db"))
+        try:
+            solver = build_solver(base)
+            solver.recipes = store.recipes
+            page = solver.get_portal_page()
+            portal_id = solver.get_portal_identifier(page.url)
+            recipe = solver.compile_recipe(solver.pick_best_form(
+                extract_forms(page).forms, page.url))
+            del recipe["id"]
+
+            profiles = os.path.join(tmp, "profiles.jsonl")
+            with open(profiles, "w") as f:
+                f.write(json.dumps({"ssid": "Check", "portal": portal_id, "username": USERNAME,
+                                    "secret": "plain:" + PASSWORD, "recipe": recipe}) + "\n")
+            result = import_profiles(store, profiles)
+            expect(result["invalid"] == 1 and result["recipes"] == 0, f"recipe without an id imported: {result}")
+
+            # As an older import would have stored them
+            store.recipes.put(portal_id, recipe)
+            expect(solver.analyze_page(solver.get_portal_page()) is not None, "no login form with a recipe lacking its id")
+            store.recipes.put(portal_id, dict(recipe, fields=[{"role": "password"}]))
+            expect(solver.analyze_page(solver.get_portal_page()) is not None, "no login form with a broken recipe cached")
+            expect(store.recipes.get(portal_id)["fields"][0].get("name"), "the broken recipe was not re-learned")
+        finally:
+            store.close()
+
+
+TWO_FORMS = """<html><body>
+<form action="/search"><input type="hidden" name="token" value="search-token"><input name="q"></form>
+<form action="/login" method="post"><input type="hidden" name="token" value="login-token">
+<input name="username"><input type="password" name="password"><input type="submit" value="Login"></form>
+<script>{}</script></body></html>"""
+
+
+def check_recipe_tokens():
+    class Body(io.BytesIO):
+        """A response body that remembers how much of it was read."""
+        def read(self, *args, **kwargs):
+            chunk = super().read(*args, **kwargs)
+            self.bytes_read = getattr(self, "bytes_read", 0) + len(chunk)
+            return chunk
+
+    def page(padding=""):
+        response = requests.Response()
+        response.raw = Body(TWO_FORMS.format(padding).encode())
+        response.status_code, response.encoding, response.url = 200, "utf-8", "http://portal.check.test/"
+        return response
+
+    solver = UniversalSolver()
+    recipe = solver.compile_recipe(solver.pick_best_form(extract_forms(page()).forms, "http://portal.check.test/"))
+    form = solver.apply_recipe(recipe, page())
+    expect(form is not None, "the recipe did not match its own page")
+    token = {inp["name"]: inp["value"] for inp in form["inputs"]}.get("token")
+    expect(token == "login-token", f"token taken from another form: {token!r}")
+
+    padded = page("x" * 2_000_000)
+    expect(solver.apply_recipe(recipe, padded) is not None, "the recipe did not match the padded page")
+    expect(padded.raw.bytes_read < 1_000_000, f"known portal read {padded.raw.bytes_read} bytes of a 2 MB page")
+
+
+class SimulatorNet:
+    """NetworkManager stand-in for an agent in front of the simulator."""
+    def __init__(self, solver):
+        self.prober = solver.prober
+        self.get_captive_api = lambda: None
+
+    def get_gateway(self):
+        return "10.0.0.1"
+
+    def get_ssid(self):
+        return "Check"
+
+    def is_connected(self):
+        return self.prober.probe() == "ONLINE"
+
+    def confirm_online(self, deadline=2):
+        return self.prober.confirm_online(deadline=deadline)
+
+
+def check_prompt_no_recipe():
+    with simulator("multistep") as portal, tempfile.TemporaryDirectory() as tmp:
+        base = f"http://127.0.0.1:{portal.server_port}"
+        store = StorageManager(os.path.join(tmp, "wifi_map.db"))
+        try:
+            solver = build_solver(base)
+            solver.recipes = store.recipes
+            net = SimulatorNet(solver)
+            prompted = []
+            agent = AutoLoginAgent(store=store, solver=solver, net=net, on_prompt=prompted.append)
+            expect(agent.background_logic() == AgentState.AWAITING_USER and prompted, "the user was not prompted")
+            expect(store.recipes.get(base) is None, "a recipe was cached before anyone logged in")
+
+            done = []
+            task = LoginTask(solver, net, USERNAME, PASSWORD,
+                             on_progress=lambda text: None, on_done=lambda *args: done.append(args))
+            task.run()
+            expect(task.succeeded, f"the user's login failed: {done}")
+            expect(store.recipes.get(base) is not None, "no recipe cached after the login worked")
+        finally:
+            store.close()
+
+
+class FakeSolver:
+    """Just enough of UniversalSolver for a LoginTask; the login POST takes `login_time` seconds."""
+    def __init__(self, login_time):
+        self.login_time = login_time
+
+    def get_portal_page(self, timeout=None):
+        page = requests.Response()
+        page.status_code, page.url = 200, "http://portal.check.test/login"
+        return page
+
+    def get_portal_identifier(self, url):
+        return "http://portal.check.test"
+
+    def analyze_page(self, page, timeout=None, budget=None, learn=True):
+        return {"url": "http://portal.check.test/login"}
+
+    def learn_recipe(self, form):
+        pass
+
+    def login(self, form, username, password, timeout=None, budget=None):
+        time.sleep(self.login_time)
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+    def login_verdict(self, form, response):
+        return "ACCEPTED"
+
+
+class FakeNet:
+    def confirm_online(self, deadline=None):
+        return True
+
+
+class OffPortalSolver(FakeSolver):
+    """The portal lets the login through by redirecting to a connectivity check (204, off the portal)."""
+    def login(self, form, username, password, timeout=None, budget=None):
+        response = requests.Response()
+        response.status_code, response.url = 204, "http://connectivity.check.test/generate_204"
+        return response
+
+    def login_verdict(self, form, response):
+        return UniversalSolver().login_verdict(form | {"action": form["url"]}, response)
+
+
+def run_task(login_time, budget, cancel_after=None, solver=None):
+    """(on_done arguments or None, seconds run() took)"""
+    done = []
+    task = LoginTask(solver or FakeSolver(login_time), FakeNet(), USERNAME, PASSWORD,
+                     on_progress=lambda text: None, on_done=lambda *args: done.append(args),
+                     deadlines={"fetch": 1, "analyze": 1, "login": budget, "verify": 1})
+    if cancel_after is not None:
+        threading.Timer(cancel_after, task.cancel).start()
+    start = time.monotonic()
+    task.run()
+    return (done[0] if done else None), time.monotonic() - start
+
+
+def check_login_deadlines():
+    done, _ = run_task(login_time=0.6, budget=0.5)
+    expect(done == (True, "Success! Connected."), f"a login answered 0.1s after its budget was failed: {done}")
+
+    done, took = run_task(login_time=10, budget=0.5)
+    expect(done is not None and not done[0] and "Timed out" in done[1], f"a hanging login did not time out: {done}")
+    expect(took < 0.5 + STAGE_GRACE + 0.5, f"a hanging login was given up on after {took:.1f}s")
+
+    done, took = run_task(login_time=10, budget=5, cancel_after=0.2)
+    expect(done is None and took < 1, f"cancel() took {took:.1f}s to end the task (on_done: {done})")
+
+
+def check_login_off_portal():
+    done, _ = run_task(login_time=0, budget=1, solver=OffPortalSolver(0))
+    expect(done == (True, "Success! Connected."), f"a login accepted with a 204 off the portal failed: {done}")
+
+
+def check_fingerprint_tick():
+    clock = {"now": 1000.0}
+
+    class FakeTime:
+        @staticmethod
+        def monotonic():
+            return clock["now"]
+
+    page = '<html><body>Welcome! <input type="hidden" name="t" value="{}"></body></html>'
+    real_time, fingerprint_cache.time = fingerprint_cache.time, FakeTime
+    try:
+        cache = FingerprintCache()
+        network = ("Check", "10.0.0.1")
+        ttl = cache.record(network, page.format(1), NO_FORM)
+        for tick in range(1, 4):
+            clock["now"] += ttl  # The scheduler's defer(ttl)
+            known = cache.check(network, page.format(tick + 1))
+            expect(known is not None, f"scheduled tick {tick} on the unchanged page missed the cache")
+            outcome, next_ttl = known
+            expect(outcome == NO_FORM and next_ttl > ttl, f"tick {tick}: {known}, wait did not grow from {ttl}")
+            ttl = next_ttl
+        expect(cache.check(network, "<html>another page</html>") is None, "a different page hit the cache")
+    finally:
+        fingerprint_cache.time = real_time
+
+
+def check_dns_per_interface():
+    # The bound agent's network hijacks DNS (probe host -> portal), the other one's does not
+    with simulator() as portal, simulator(host="127.0.0.2", port=portal.server_port) as internet:
+        internet.RequestHandlerClass.state.authenticated = True
+        captive = Transport(interface="lo")
+        other = Transport()
+        dns = captive.dns
+        resolve = dns._resolve
+
+        def per_network(host, port, *args, **kwargs):
+            if host == PROBE_HOST:
+                host = "127.0.0.1" if dns.scope == "lo" else "127.0.0.2"
+            return resolve(host, port, *args, **kwargs)
+
+        dns._resolve = per_network
+        dns.clear()
+        try:
+            base = f"http://{PROBE_HOST}:{portal.server_port}"
+            page = build_solver(base, captive).get_portal_page()
+            expect(page is not None and page != "ONLINE", "the bound agent did not see its portal")
+            expect(build_solver(base, other).prober.probe() == "ONLINE",
+                   "the other agent got the portal's DNS answer")
+            captive.flush()
+            expect(any(key[0] is None for key in dns.entries), "flushing one interface dropped the other's answers")
+        finally:
+            dns._resolve = resolve
+            dns.clear()
+
+
+def check_captive_api_https():
+    with simulator() as portal, tempfile.TemporaryDirectory() as tmp:
+        state = portal.RequestHandlerClass.state
+        state.authenticated = True  # The API answers "captive": false
+        certfile, keyfile = make_certificate(tmp)
+        api = make_api_server(portal, certfile, keyfile)
+        threading.Thread(target=api.serve_forever, daemon=True).start()
+        try:
+            def ask(uri, ca=None):
+                solver = build_solver(f"http://127.0.0.1:{portal.server_port}")
+                if ca:
+                    solver.session.verify = ca
+                    solver.session.trust_env = False  # Else $REQUESTS_CA_BUNDLE wins over session.verify
+                solver.captive_api = lambda: uri
+                return solver.check_captive_api()
+
+            requests_before = state.stats["requests"]
+            expect(ask(f"http://127.0.0.1:{portal.server_port}/captive-api") is None,
+                   "an http:// Captive Portal API was believed")
+            expect(state.stats["requests"] == requests_before, "an http:// Captive Portal API was asked")
+            https = f"https://127.0.0.1:{api.server_port}/captive-api"
+            expect(ask(https) is None, "a Captive Portal API with an untrusted certificate was believed")
+            expect(ask(https, ca=certfile) == ONLINE, "the HTTPS Captive Portal API was not used")
+        finally:
+            api.shutdown()
+            api.server_close()
+
+
+@contextlib.contextmanager
+def private_service(tmp):
+    """The service's default path, inside `tmp` (an agent running on this machine is not disturbed)."""
+    saved = {name: os.environ.get(name) for name in ("XDG_RUNTIME_DIR", "WIFI_AUTH_SOCKET")}
+    os.environ["XDG_RUNTIME_DIR"] = tmp
+    os.environ.pop("WIFI_AUTH_SOCKET", None)
+    try:
+        yield lambda: AgentService(
+            lambda: AgentGroup(store=StorageManager(os.path.join(tmp, "check.db")), interfaces=[])
+        )
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def snapshot_of(client_paths=None):
+    received = threading.Event()
+    client = ServiceClient(on_event=lambda message: received.set(), paths=client_paths)
+    try:
+        return received.wait(5)
+    finally:
+        client.close()
+
+
+def check_service_start():
+    with tempfile.TemporaryDirectory() as tmp, private_service(tmp) as new_service:
+        service = new_service()
+        expect(service.start(delay=60), "the agent service did not start on its default path")
+        try:
+            expect(service.path == agent_service.service_socket(), "the service is not on its default path")
+            expect(snapshot_of(), "a front end got no snapshot")
+            expect(not new_service().start(delay=60), "a second host started next to the first")
+        finally:
+            service.stop()
+
+
+def check_service_tcp():
+    af_unix, port = socket.AF_UNIX, agent_service.SERVICE_PORT
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        agent_service.SERVICE_PORT = probe.getsockname()[1]
+    del socket.AF_UNIX
+    try:
+        with tempfile.TemporaryDirectory() as tmp, private_service(tmp) as new_service:
+            os.environ["XDG_RUNTIME_DIR"] = os.path.join(tmp, "not-yet-created")
+            service = new_service()
+            expect(service.start(delay=60), "the agent service did not start without AF_UNIX")
+            try:
+                expect(snapshot_of(), "a front end holding the token got no snapshot")
+            finally:
+                service.stop()
+
+            # An impostor took the port: it cannot answer the token challenge, so it gets nothing else
+            received = []
+            with socket.create_server(("127.0.0.1", agent_service.SERVICE_PORT)) as impostor:
+                def answer():
+                    conn, _ = impostor.accept()
+                    with conn, conn.makefile("rb") as lines:
+                        received.append(lines.readline())
+                        conn.sendall(b'{"event": "hello", "nonce": "x", "proof": "guess"}\n')
+                        received.append(lines.readline())
+                threading.Thread(target=answer, daemon=True).start()
+                token = service.path + ".token"
+                with open(token, "w") as f:
+                    f.write("the user's token")
+                try:
+                    ServiceClient(on_event=print, paths=[service.path])
+                    expect(False, "the client trusted an impostor on the service port")
+                except PermissionError:
+                    pass
+                time.sleep(0.2)
+                expect(received[1:] in ([], [b""]), "the client kept talking to an impostor")
+    finally:
+        socket.AF_UNIX, agent_service.SERVICE_PORT = af_unix, port
+
+
+CHECKS = {
+    "dns_after_login": check_dns_after_login,
+    "dns_per_interface": check_dns_per_interface,
+    "text_probe": check_text_probe,
+    "recipe_schema": check_recipe_schema,
+    "recipe_tokens": check_recipe_tokens,
+    "prompt_no_recipe": check_prompt_no_recipe,
+    "login_deadlines": check_login_deadlines,
+    "login_off_portal": check_login_off_portal,
+    "fingerprint_tick": check_fingerprint_tick,
+    "captive_api_https": check_captive_api_https,
+    "service_start": check_service_start,
+    "service_tcp": check_service_tcp,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("names", nargs="*", help=f"Checks to run: {', '.join(CHECKS)} (default: all)")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(CHECKS)
+    if unknown:
+        parser.error(f"unknown check(s): {', '.join(sorted(unknown))}")
+
+    failures = 0
+    for name in args.names or CHECKS:
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                CHECKS[name]()
+            print(f"{name:<24} ok")
+        except CheckFailed as e:
+            failures += 1
+            print(f"{name:<24} FAIL: {e}")
+        except Exception as e:
+            failures += 1
+            print(f"{name:<24} FAIL: {type(e).__name__}: {e}")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(main())
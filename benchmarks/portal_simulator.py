@@ -0,0 +1,404 @@
+"""
+Local stand-in captive portal for benchmarks (stdlib http.server only).
+
+    python benchmarks/portal_simulator.py --scenario fortinet --port 8080
+
+Until a client logs in, every probe URL is redirected into the portal.
+After a successful POST the probes answer like the real internet
+(/generate_204 -> 204, /neverssl -> page containing "NeverSSL").
+
+Scenarios:
+  redirect   plain 302 to the login page
+  fortinet   200 page with only a JS window.location redirect (Fortinet style)
+  multiform  login page with several forms (search, language, voucher, login)
+  slow       every portal response is delayed by --delay seconds
+  large      login form followed by ~500 KB of inline JS
+  multistep  meta-refresh hop -> accept-terms page -> login form -> "continue"
+             page; the session only opens once the welcome page is reached
+
+With --session N a login only lasts N seconds (fixed session length), after
+which the probes are redirected into the portal again.
+
+A login also sets a portal_session cookie. Like a controller behind many
+access points, the portal lets a client that comes back with a valid cookie
+straight through on its next portal request (GET /roam drops the client's
+authorization but keeps the sessions, as if it moved to another AP).
+
+A Captive Portal API (RFC 8908) is served on /captive-api in every scenario:
+{"captive", "user-portal-url", "seconds-remaining" (with --session)}.
+Clients only trust it over HTTPS: --api-port serves it (and the portal's
+other paths) with TLS too, on a self-signed localhost certificate made with
+the openssl command line tool (see make_certificate).
+
+Every login page carries a fresh single-use hidden token; only the last few
+issued are accepted, so a POST with a stale token is rejected.
+Control endpoints (not counted in /stats): GET /reset, GET /roam, GET /stats.
+"""
+import os
+import re
+import ssl
+import json
+import time
+import socket
+import secrets
+import argparse
+import threading
+import subprocess
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+SCENARIOS = ["redirect", "fortinet", "multiform", "slow", "large", "multistep"]
+
+USERNAME = "student"
+PASSWORD = "secret"
+
+LOGIN_FORM = """
+  <form action="/portal/login" method="post">
+    <input type="hidden" name="magic" value="{token}">
+    <input type="hidden" name="redirect" value="http://neverssl.com/">
+    <input type="text" name="username">
+    <input type="password" name="password">
+    <button type="submit">Sign in</button>
+  </form>"""
+
+EXTRA_FORMS = """
+  <form action="/search" method="get"><input type="text" name="q"><button>Go</button></form>
+  <form action="/lang" method="post"><input type="hidden" name="csrf" value="x1"><input type="radio" name="lang" value="en"></form>
+  <form action="/voucher" method="post"><input type="text" name="voucher"><button>Use voucher</button></form>"""
+
+TERMS_PAGE = """<html><body><h1>Acceptable use policy</h1>
+  <form action="/portal/terms" method="post">
+    <input type="hidden" name="policy" value="{version}">
+    <label><input type="checkbox" name="agree" value="yes"> I agree to the terms and conditions</label>
+    <button type="submit" name="accept" value="1">Accept</button>
+  </form></body></html>"""
+
+REFRESH_PAGE = '<html><head><meta http-equiv="refresh" content="{seconds}; url={url}"></head><body>{text}</body></html>'
+
+PADDING = (
+    "<script>" + ("var x = 'lorem ipsum dolor sit amet';\n" * 14000) + "</script>"
+)
+
+
+class PortalState:
+    def __init__(self, scenario, delay, session=0):
+        self.scenario = scenario
+        self.delay = delay
+        self.session = session  # Session length in seconds (0 = until /reset)
+        self.authenticated = False
+        self.terms_accepted = False  # multistep: terms page passed since the last login
+        self.pending_login = False   # multistep: credentials OK, welcome page not seen yet
+        self.login_at = 0
+        self.portal_sessions = {}  # portal_session cookie -> login time
+        self.tokens = deque(maxlen=4)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "bytes_in": 0, "bytes_out": 0, "logins": 0, "resumed": 0}
+
+    def online(self):
+        if self.session and time.monotonic() - self.login_at > self.session:
+            self.authenticated = False
+        return self.authenticated
+
+
+class _Counting:
+    """Wraps the handler's socket file to count the bytes the server reads / writes (see bench_login.ClientBytes for the client's side)."""
+    def __init__(self, raw, state, key):
+        self.raw, self.state, self.key = raw, state, key
+        self.enabled = True
+
+    def _count(self, n):
+        if self.enabled:
+            with self.state.lock:
+                self.state.stats[self.key] += n
+
+    def read(self, *args):
+        data = self.raw.read(*args)
+        self._count(len(data))
+        return data
+
+    def readline(self, *args):
+        data = self.raw.readline(*args)
+        self._count(len(data))
+        return data
+
+    def write(self, data):
+        self._count(len(data))
+        return self.raw.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class PortalHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # PortalState, set by make_server()
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes: without this, Nagle + delayed ACK
+        # add ~40 ms to every keep-alive response whose body the client waits for
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = _Counting(self.rfile, self.state, "bytes_in")
+        self.wfile = _Counting(self.wfile, self.state, "bytes_out")
+
+    def log_message(self, *args):
+        pass
+
+    # --- helpers ---
+    def _send(self, status, body=b"", headers=None, content_type="text/html"):
+        try:
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            if body:
+                self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The streaming parser hangs up once it has the form
+            self.close_connection = True
+
+    portal_base = None  # The plain-HTTP portal, when this handler serves the HTTPS API
+
+    def _base(self):
+        return self.portal_base or f"http://{self.headers.get('Host')}"
+
+    def _login_page(self, error=""):
+        state = self.state
+        token = secrets.token_hex(8)
+        with state.lock:
+            state.tokens.append(token)
+        forms = LOGIN_FORM.format(token=token)
+        if state.scenario == "multiform":
+            forms = EXTRA_FORMS + forms
+        body = f"<html><head><title>Portal</title></head><body><p>{error}</p>{forms}"
+        if state.scenario == "large":
+            body += PADDING
+        return (body + "</body></html>").encode()
+
+    def _portal_delay(self):
+        if self.state.scenario == "slow":
+            time.sleep(self.state.delay)
+
+    # --- routes ---
+    def do_GET(self):
+        state = self.state
+        path = urlparse(self.path).path
+
+        if path in ("/reset", "/roam", "/stats"):
+            self.rfile.enabled = self.wfile.enabled = False
+            if path in ("/reset", "/roam"):
+                with state.lock:
+                    state.authenticated = False
+                    state.terms_accepted = state.pending_login = False
+                    state.stats = dict.fromkeys(state.stats, 0)
+                    if path == "/reset":
+                        state.portal_sessions.clear()
+                self._send(200, b"ok", content_type="text/plain")
+            else:
+                with state.lock:
+                    body = json.dumps(state.stats).encode()
+                self._send(200, body, content_type="application/json")
+            self.rfile.enabled = self.wfile.enabled = True
+            return
+
+        with state.lock:
+            state.stats["requests"] += 1
+
+        if path == "/generate_204":
+            if state.online():
+                return self._send(204)
+            return self._send(302, headers={"Location": "/portal/entry"})
+
+        if path == "/neverssl":
+            if state.online():
+                return self._send(200, b"<html><title>NeverSSL - Connecting ...</title></html>")
+            return self._send(302, headers={"Location": "/portal/entry"})
+
+        if path == "/captive-api":
+            with state.lock:
+                online = state.online()
+                status = {"captive": not online, "user-portal-url": self._base() + "/portal/entry"}
+                if online and state.session:
+                    status["seconds-remaining"] = max(0, int(state.session - (time.monotonic() - state.login_at)))
+            return self._send(200, json.dumps(status).encode(), content_type="application/captive+json")
+
+        if path.startswith("/portal/") and self._resume_session():
+            return self._send(200, b"<html><body>Welcome back. You are online.</body></html>")
+
+        if path == "/portal/entry":
+            self._portal_delay()
+            if state.scenario == "fortinet":
+                body = f'<html><body><script>window.location="{self._base()}/portal/login?fgtauth=1";</script></body></html>'
+                return self._send(200, body.encode())
+            if state.scenario == "multistep":
+                body = REFRESH_PAGE.format(seconds=0, url="/portal/terms", text="Loading...")
+                return self._send(200, body.encode())
+            return self._send(302, headers={"Location": "/portal/login"})
+
+        if path == "/portal/terms":
+            return self._send(200, TERMS_PAGE.format(version=secrets.token_hex(4)).encode())
+
+        if path == "/portal/login":
+            self._portal_delay()
+            if state.scenario == "multistep" and not state.terms_accepted:
+                return self._send(302, headers={"Location": "/portal/terms"})
+            return self._send(200, self._login_page())
+
+        if path == "/portal/welcome":
+            with state.lock:
+                cookie = None
+                if state.pending_login:
+                    state.pending_login = False
+                    cookie = self._open_session()
+            # Keeps refreshing itself, like many post-login status pages
+            body = REFRESH_PAGE.format(seconds=300, url="/portal/welcome", text="Welcome! You are online.")
+            return self._send(200, body.encode(), headers=cookie and {"Set-Cookie": cookie})
+
+        self._send(404, b"not found", content_type="text/plain")
+
+    def do_POST(self):
+        state = self.state
+        with state.lock:
+            state.stats["requests"] += 1
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+
+        path = urlparse(self.path).path
+        if path == "/portal/terms":
+            if form.get("agree", [""])[0] != "yes":
+                return self._send(200, TERMS_PAGE.format(version=secrets.token_hex(4)).encode())
+            with state.lock:
+                state.terms_accepted = True
+            return self._send(302, headers={"Location": "/portal/login"})
+
+        if path != "/portal/login":
+            return self._send(404, b"not found", content_type="text/plain")
+
+        self._portal_delay()
+        token = form.get("magic", [""])[0]
+        with state.lock:
+            ok = (
+                form.get("username", [""])[0] == USERNAME
+                and form.get("password", [""])[0] == PASSWORD
+                and token in state.tokens
+            )
+            if ok:
+                state.tokens.remove(token)
+        if not ok:
+            return self._send(200, self._login_page(error="Authentication failed."))
+
+        if state.scenario == "multistep":
+            with state.lock:
+                state.terms_accepted = False
+                state.pending_login = True
+            body = """<html><body><p>Login successful.</p>
+  <form action="/portal/welcome" method="get"><button type="submit">Continue</button></form></body></html>"""
+            return self._send(200, body.encode())
+
+        with state.lock:
+            cookie = self._open_session()
+        self._send(200, b"<html><body>You are now connected.</body></html>", headers={"Set-Cookie": cookie})
+
+    def _open_session(self):
+        """Authorizes the client; returns the Set-Cookie value of its new portal session. Caller holds state.lock."""
+        state = self.state
+        state.authenticated = True
+        state.login_at = time.monotonic()
+        state.stats["logins"] += 1
+        session_id = secrets.token_hex(8)
+        state.portal_sessions[session_id] = state.login_at
+        return f"portal_session={session_id}; Path=/"
+
+    def _resume_session(self):
+        """A client that is not authorized but brings a live portal_session cookie gets through."""
+        state = self.state
+        match = re.search(r'portal_session=(\w+)', self.headers.get("Cookie", ""))
+        with state.lock:
+            if state.online() or not match or match.group(1) not in state.portal_sessions:
+                return False
+            login_at = state.portal_sessions[match.group(1)]
+            if state.session and time.monotonic() - login_at > state.session:
+                del state.portal_sessions[match.group(1)]
+                return False
+            state.authenticated = True
+            state.login_at = login_at
+            state.stats["resumed"] += 1
+        return True
+
+
+class PortalServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up early (cancelled probes, early-exit parser) are expected
+        pass
+
+
+def make_server(scenario="redirect", port=0, delay=0.5, session=0, host="127.0.0.1"):
+    handler = type("Handler", (PortalHandler,), {"state": PortalState(scenario, delay, session)})
+    return PortalServer((host, port), handler)
+
+
+def make_certificate(directory):
+    """A self-signed certificate for localhost / 127.0.0.1 (openssl CLI). Returns (certfile, keyfile)."""
+    certfile, keyfile = os.path.join(directory, "portal.pem"), os.path.join(directory, "portal.key")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", keyfile, "-out", certfile, "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+        check=True, capture_output=True
+    )
+    return certfile, keyfile
+
+
+def make_api_server(portal, certfile, keyfile, port=0):
+    """HTTPS server sharing `portal`'s state, for its Captive Portal API (/captive-api)."""
+    host, portal_port = portal.server_address[:2]
+    handler = type("ApiHandler", (portal.RequestHandlerClass,), {"portal_base": f"http://{host}:{portal_port}"})
+    server = PortalServer((host, port), handler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    return server
+
+
+def serve(scenario, port_queue, delay=0.5, session=0, certificate=None):
+    """
+    multiprocessing entry point: reports the bound port, then serves forever.
+    With a certificate (certfile, keyfile), the HTTPS API server's port is reported next.
+    """
+    server = make_server(scenario, 0, delay, session)
+    port_queue.put(server.server_port)
+    if certificate:
+        api = make_api_server(server, *certificate)
+        threading.Thread(target=api.serve_forever, daemon=True).start()
+        port_queue.put(api.server_port)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local captive portal simulator")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="redirect")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--delay", type=float, default=0.5, help="Delay for the 'slow' scenario (s)")
+    parser.add_argument("--session", type=float, default=0, help="Session length after login (s, 0 = unlimited)")
+    parser.add_argument("--api-port", type=int, default=None, help="Also serve the Captive Portal API over HTTPS here")
+    args = parser.parse_args()
+
+    server = make_server(args.scenario, args.port, args.delay, args.session)
+    print(f"Portal simulator ({args.scenario}) on http://127.0.0.1:{server.server_port}")
+    print(f"Probe URLs: /generate_204 and /neverssl | Login: {USERNAME} / {PASSWORD}")
+    if args.api_port is not None:
+        import tempfile
+        certfile, keyfile = make_certificate(tempfile.mkdtemp())
+        api = make_api_server(server, certfile, keyfile, args.api_port)
+        threading.Thread(target=api.serve_forever, daemon=True).start()
+        print(f"Captive Portal API: https://127.0.0.1:{api.server_port}/captive-api (CA: {certfile})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
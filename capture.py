@@ -0,0 +1,243 @@
+"""
+Capture and offline replay of portal traffic (HAR 1.2 archives).
+
+    recorder = Recorder()
+    solver = UniversalSolver(transport=Transport(recorder=recorder))
+    ...                                   # probe, analyze, login as usual
+    recorder.save("portal.har.gz")        # .gz -> gzip-compressed
+
+    solver = UniversalSolver(transport=Transport(replay="portal.har.gz"))
+    ...                                   # same calls, no network at all
+
+Capture wraps the transport's adapter, so every request of every session
+(probes, redirect and terms hops, form fetches, the login POST) is recorded
+with its response, timing, or the error it failed with. Bodies are read in
+full while capturing (the parser's early exit is lost in this mode).
+Credentials are redacted before anything is stored: Authorization / Cookie /
+Set-Cookie header values, and every value handed to redact() (the solver
+registers the username and password of each login).
+
+Replay answers each request from the archive: entries are matched by method
+and URL, in the order the requests were sent (the same URL answering differently over time,
+e.g. a portal before the login and a 204 after it, replays faithfully; the
+last answer repeats once a URL's entries run out). A request the archive
+never saw fails like an unreachable network. With `speed` set, recorded
+durations are waited out (scaled), which also reproduces which probe won
+a race; by default answers are instant.
+"""
+import io
+import gzip
+import json
+import time
+import base64
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from urllib.parse import quote, quote_plus
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.response import HTTPResponse
+
+log = logging.getLogger(__name__)
+
+# Entries kept in memory while capturing (oldest dropped beyond this)
+MAX_ENTRIES = 5000
+
+REDACTED = "REDACTED"
+REDACTED_HEADERS = {"authorization", "proxy-authorization", "cookie", "set-cookie"}
+# Describe the stored body, not the original transfer
+DROPPED_HEADERS = {"content-encoding", "transfer-encoding", "content-length"}
+
+# Exceptions a captured failure is replayed as (by class name)
+REPLAY_ERRORS = {
+    "ConnectTimeout": requests.ConnectTimeout,
+    "ReadTimeout": requests.ReadTimeout,
+    "Timeout": requests.Timeout,
+    "TooManyRedirects": requests.TooManyRedirects,
+}
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class Recorder:
+    """Collects HAR entries from every CaptureAdapter it is attached to (thread-safe)."""
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.entries = deque(maxlen=max_entries)
+        self._secrets = set()
+        self._lock = threading.Lock()
+
+    def redact(self, *values):
+        """Never store these strings (plain, URL- or form-encoded) in the archive."""
+        with self._lock:
+            for value in values:
+                if value:
+                    self._secrets.update({value, quote(value, safe=""), quote_plus(value)})
+
+    def _scrub(self, text):
+        for secret in self._secrets:
+            text = text.replace(secret, REDACTED)
+        return text
+
+    def _headers(self, headers):
+        return [
+            {"name": name, "value": REDACTED if name.lower() in REDACTED_HEADERS else self._scrub(str(value))}
+            for name, value in headers.items()
+        ]
+
+    def _body(self, content, content_type):
+        """HAR content text: scrubbed text, or base64 for anything binary."""
+        try:
+            return {"text": self._scrub(content.decode("utf-8"))}
+        except UnicodeDecodeError:
+            if content_type.startswith("text/"):
+                return {"text": self._scrub(content.decode("latin-1"))}
+            return {"text": base64.b64encode(content).decode("ascii"), "encoding": "base64"}
+
+    def record(self, request, started, elapsed, response=None, error=None):
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        with self._lock:
+            entry = {
+                "startedDateTime": datetime.fromtimestamp(started, timezone.utc).isoformat(),
+                "time": round(elapsed * 1000, 3),
+                "request": {
+                    "method": request.method,
+                    "url": self._scrub(request.url),
+                    "httpVersion": "HTTP/1.1",
+                    "headers": self._headers(request.headers),
+                    "queryString": [],
+                    "cookies": [],
+                    "headersSize": -1,
+                    "bodySize": len(body),
+                },
+                "response": {
+                    "status": 0, "statusText": "", "httpVersion": "HTTP/1.1", "headers": [], "cookies": [],
+                    "content": {"size": 0, "mimeType": "", "text": ""},
+                    "redirectURL": "", "headersSize": -1, "bodySize": 0,
+                },
+                "cache": {},
+                "timings": {"send": 0, "wait": round(elapsed * 1000, 3), "receive": 0},
+            }
+            if body:
+                entry["request"]["postData"] = {
+                    "mimeType": request.headers.get("Content-Type", ""),
+                    "text": self._scrub(body.decode("utf-8", "replace")),
+                }
+            if error is not None:
+                entry["_error"] = type(error).__name__
+                entry["response"]["statusText"] = self._scrub(str(error))
+            else:
+                content = response.content
+                content_type = response.headers.get("Content-Type", "")
+                entry["response"].update({
+                    "status": response.status_code,
+                    "statusText": response.reason or "",
+                    "headers": self._headers({
+                        name: value for name, value in response.headers.items()
+                        if name.lower() not in DROPPED_HEADERS
+                    }),
+                    "content": {"size": len(content), "mimeType": content_type, **self._body(content, content_type)},
+                    "redirectURL": self._scrub(response.headers.get("Location", "")),
+                    "bodySize": len(content),
+                })
+            self.entries.append(entry)
+
+    def save(self, path):
+        """Writes everything captured so far as a HAR file (gzip if `path` ends in .gz)."""
+        with self._lock:
+            entries = sorted(self.entries, key=lambda entry: entry["startedDateTime"])  # Request order
+        archive = {"log": {
+            "version": "1.2",
+            "creator": {"name": "wifi-auto-login", "version": "1"},
+            "entries": entries,
+        }}
+        with _open(path, "w") as f:
+            json.dump(archive, f, separators=(",", ":"))
+        log.info(">> Captured %d requests to %s.", len(entries), path)
+        return len(entries)
+
+
+class CaptureAdapter(HTTPAdapter):
+    """Sends through `adapter` and records every exchange in `recorder`."""
+    def __init__(self, adapter, recorder):
+        super().__init__()
+        self.adapter = adapter
+        self.recorder = recorder
+
+    def send(self, request, **kwargs):
+        started, start = time.time(), time.perf_counter()
+        try:
+            response = self.adapter.send(request, **kwargs)
+            response.content  # Read it all: the archive needs the body
+        except Exception as e:
+            self.recorder.record(request, started, time.perf_counter() - start, error=e)
+            raise
+        self.recorder.record(request, started, time.perf_counter() - start, response=response)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def load_archive(path):
+    """The entries of a HAR file (plain or .gz)."""
+    with _open(path, "r") as f:
+        return json.load(f)["log"]["entries"]
+
+
+class ReplayAdapter(HTTPAdapter):
+    """Answers every request from a captured archive; never touches the network."""
+    def __init__(self, archive, speed=None):
+        super().__init__()
+        entries = load_archive(archive) if isinstance(archive, str) else archive
+        self.answers = {}  # (method, url) -> entries in recorded order
+        for entry in entries:
+            key = (entry["request"]["method"], entry["request"]["url"])
+            self.answers.setdefault(key, []).append(entry)
+        self.speed = speed
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+    def rewind(self):
+        """Starts every URL over from its first recorded answer."""
+        with self._lock:
+            self._cursors.clear()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        key = (request.method, request.url)
+        answers = self.answers.get(key)
+        if not answers:
+            raise requests.ConnectionError(f"{request.method} {request.url} is not in the archive", request=request)
+        with self._lock:
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = min(index + 1, len(answers) - 1)
+        entry = answers[index]
+
+        if self.speed:
+            time.sleep(entry["time"] / 1000 / self.speed)
+        if "_error" in entry:
+            error = REPLAY_ERRORS.get(entry["_error"], requests.ConnectionError)
+            raise error(entry["response"]["statusText"], request=request)
+
+        answer = entry["response"]
+        content = answer["content"]
+        if content.get("encoding") == "base64":
+            body = base64.b64decode(content["text"])
+        else:
+            body = content.get("text", "").encode("utf-8")
+        headers = {header["name"]: header["value"] for header in answer["headers"]}
+        headers["Content-Length"] = str(len(body))
+        raw = HTTPResponse(
+            body=io.BytesIO(body), headers=headers, status=answer["status"],
+            reason=answer["statusText"], preload_content=False, decode_content=False
+        )
+        return self.build_response(request, raw)
+
+    def close(self):
+        pass
@@ -0,0 +1,174 @@
+"""
+Headless agent: monitoring and auto-login without any GUI (Tk is never imported).
+
+    python daemon.py run                              # start the agent
+    python daemon.py add "SSID" USERNAME [--portal URL] [--password-stdin]
+    python daemon.py list                             # saved networks (no passwords)
+    python daemon.py import profiles.csv [--strict]   # bulk provisioning (see provisioning.py)
+    python daemon.py export profiles.jsonl [--include-passwords]
+
+    python daemon.py --log-level DEBUG --metrics-port 9464 --metrics-file metrics.jsonl run
+    python daemon.py run --capture portal.har.gz      # record portal traffic (see capture.py)
+    python daemon.py status                           # state of the running agent (root's or yours)
+
+`run` hosts the shared agent (see agent_service.py): it refuses to start
+while another one (daemon or app) runs on its socket. Run as root, it is the
+machine's agent and the desktop apps of every user become its front ends;
+otherwise it serves the apps of the user who started it. When an unknown portal shows up,
+`run` prints what to add. Credentials added from another terminal (same
+database) are picked up automatically and the agent logs in right away.
+"""
+import sys
+import time
+import logging
+import getpass
+import argparse
+import threading
+from agent import AgentGroup
+from agent_service import AgentService, ServiceClient
+from storage import StorageManager, DB_FILE
+from capture import Recorder
+from metrics import metrics, setup_logging
+from provisioning import import_profiles, export_profiles, ProfileError, FORMATS
+
+log = logging.getLogger(__name__)
+
+# How long `status` waits for the agent's answer (seconds)
+STATUS_TIMEOUT = 5
+
+
+def cmd_run(args):
+    if args.metrics_file:
+        metrics.enable(jsonl=args.metrics_file)
+    if args.metrics_port:
+        metrics.serve_prometheus(args.metrics_port)
+
+    def on_prompt(agent):
+        log.warning(">> [%s] Unknown network '%s' (portal %s).", agent.name, agent.current_ssid, agent.current_portal_id)
+        log.warning('>> Add credentials with: python daemon.py add "%s" USERNAME', agent.current_ssid)
+
+    recorder = Recorder() if args.capture else None
+    service = AgentService(
+        lambda: AgentGroup(store=StorageManager(args.db), on_prompt=on_prompt, recorder=recorder)
+    )
+    if not service.start(delay=1):
+        print(f"Error: the agent is already running on this machine ({service.path}).")
+        return 1
+    log.info(">> Daemon started (headless). Waiting for network drop...")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        service.stop()
+        if recorder is not None:
+            recorder.save(args.capture)
+
+
+def cmd_status(args):
+    snapshot = []
+    received = threading.Event()
+
+    def on_event(message):
+        if message.get("event") == "snapshot":
+            snapshot.extend(message["agents"])
+            received.set()
+
+    try:
+        client = ServiceClient(on_event=on_event, on_close=received.set)
+    except OSError:
+        print("The agent is not running.")
+        return 1
+    received.wait(STATUS_TIMEOUT)
+    client.close()
+    for agent in snapshot:
+        print(f"{agent['agent']}\t{agent['state']}\t{agent['ssid'] or '-'}\t{agent['portal'] or '-'}")
+    return 0
+
+
+def cmd_add(args):
+    if args.password_stdin:
+        password = sys.stdin.readline().rstrip("\n")
+    else:
+        password = getpass.getpass(f"Password for {args.username}@{args.ssid}: ")
+    if not password:
+        print("Error: empty password.")
+        return 1
+    StorageManager(args.db).save_credentials(args.ssid, args.username, password, args.portal)
+    return 0
+
+
+def cmd_list(args):
+    for ssid, username, portal_id in StorageManager(args.db).list_networks():
+        print(f"{ssid}\t{username}\t{portal_id or '-'}")
+    return 0
+
+
+def cmd_import(args):
+    try:
+        result = import_profiles(StorageManager(args.db), args.file, args.format, strict=args.strict)
+    except (ProfileError, OSError) as e:
+        print(f"Error: {e}")
+        return 1
+    for line, reason in result["errors"]:
+        print(f"line {line}: {reason}")
+    if result["invalid"] > len(result["errors"]):
+        print(f"... and {result['invalid'] - len(result['errors'])} more invalid rows")
+    print(f"{result['imported']} profiles imported ({result['recipes']} recipes), {result['invalid']} invalid.")
+    return 0
+
+
+def cmd_export(args):
+    try:
+        count = export_profiles(StorageManager(args.db), args.file, args.format, args.include_passwords)
+    except (ProfileError, OSError) as e:
+        print(f"Error: {e}")
+        return 1
+    if args.file != "-":
+        print(f"{count} profiles exported to {args.file}.")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless WiFi auto-login agent")
+    parser.add_argument("--db", default=DB_FILE, help="Credential database (default: %(default)s)")
+    parser.add_argument("--log-level", default="INFO", help="DEBUG, INFO, WARNING or ERROR (default: %(default)s)")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this local port")
+    parser.add_argument("--metrics-file", default=None, help="Append timing/counter events to this JSON-lines file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Monitor the network and log in automatically")
+    run.add_argument("--capture", default=None, metavar="FILE",
+                     help="Record all portal traffic (credentials redacted) to this HAR file on exit (.gz = compressed)")
+
+    add = commands.add_parser("add", help="Save credentials for a network")
+    add.add_argument("ssid")
+    add.add_argument("username")
+    add.add_argument("--portal", default=None, help="Portal host (e.g. http://172.16.0.1:1000), matches any SSID")
+    add.add_argument("--password-stdin", action="store_true", help="Read the password from stdin")
+
+    commands.add_parser("list", help="Show saved networks")
+    commands.add_parser("status", help="Show what the running agent is doing")
+
+    imp = commands.add_parser("import", help="Bulk-load profiles from a CSV / JSON-lines file ('-' = stdin)")
+    imp.add_argument("file")
+    imp.add_argument("--format", choices=FORMATS, default=None, help="Default: from the file extension")
+    imp.add_argument("--strict", action="store_true", help="Abort (import nothing) on the first invalid row")
+
+    exp = commands.add_parser("export", help="Write all profiles to a CSV / JSON-lines file ('-' = stdout)")
+    exp.add_argument("file")
+    exp.add_argument("--format", choices=FORMATS, default=None, help="Default: from the file extension")
+    exp.add_argument("--include-passwords", action="store_true",
+                     help="Also export typed-in passwords (as plain:...); references are always exported")
+
+    args = parser.parse_args(argv)
+    setup_logging(args.log_level)
+    commands = {
+        "run": cmd_run, "add": cmd_add, "list": cmd_list, "status": cmd_status,
+        "import": cmd_import, "export": cmd_export,
+    }
+    return commands[args.command](args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
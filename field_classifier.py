@@ -0,0 +1,186 @@
+"""
+Field-role classification for login forms.
+
+Every visible text-like input is described by one lowercase string made of
+its name, id, placeholder, aria-label, title, autocomplete and <label> text.
+The descriptions of ALL fields of ALL forms are joined and scanned ONCE with a
+single precompiled alternation regex; every keyword hit is a feature, and a
+small linear model (WEIGHTS) turns the features of a field into a username
+score. Per form, the best-scoring field above USERNAME_THRESHOLD is the
+username; the other text fields stay "text".
+
+Roles (same as the solver always used):
+  password  type="password"
+  hidden    type="hidden" (tokens, sent back as received)
+  username  the login name / id / phone / e-mail field
+  text      any other text-like field (search, voucher, full name, ...)
+  unknown   checkboxes, radios, buttons, ...
+
+A different model plugs in as FieldClassifier(weights=..., features=...).
+"""
+import re
+from bisect import bisect_right
+from form_parser import LABEL_KEY
+
+# Attributes that describe what a field is for (in this order)
+DESCRIPTIVE_ATTRS = ("name", "id", "placeholder", "aria-label", "title", "autocomplete", LABEL_KEY)
+
+# Input types that can hold a user name
+TEXT_TYPES = {"text", "email", "tel", "number", ""}
+
+# Keyword features. Short tokens are anchored so "id" does not fire on "hidden"/"valid".
+FEATURES = {
+    "user": r"user",
+    "login": r"log[\s_-]?in|signin",
+    "email": r"mail",
+    "uid": r"(?<![a-z])u?id(?![a-z])|uid",
+    "account": r"account|acct|member|customer|subscriber",
+    "phone": r"phone|mobile|msisdn|(?<![a-z])tel(?![a-z])|cell",
+    "roll": r"roll|matric|enrol|student|employee|(?<![a-z])emp(?![a-z])|staff|card",
+    "auth": r"auth|credential",
+    "name": r"name",
+    "person_name": r"first|last|full|sur|given|family",
+    "search": r"search|query|(?<![a-z])q(?![a-z])|find",
+    "voucher": r"voucher|coupon|ticket|promo|access[\s_-]?code",
+    "otp": r"otp|captcha|verification|one[\s_-]?time|token",
+    "contact": r"comment|message|feedback|address|city|room",
+    "lang": r"lang|locale",
+}
+
+# Linear model: username score = sum of the weights of the features present
+WEIGHTS = {
+    "user": 3.0,
+    "login": 2.0,
+    "email": 2.5,
+    "uid": 2.5,
+    "account": 2.0,
+    "phone": 2.0,
+    "roll": 2.0,
+    "auth": 1.0,
+    "name": 1.0,
+    "person_name": -3.0,
+    "search": -5.0,
+    "voucher": -4.0,
+    "otp": -4.0,
+    "contact": -3.0,
+    "lang": -4.0,
+}
+
+# Extra evidence from the input type / autocomplete hint
+TYPE_WEIGHTS = {"email": 2.0, "tel": 1.0}
+AUTOCOMPLETE_WEIGHTS = {"username": 4.0, "email": 3.0, "tel": 2.0}
+
+USERNAME_THRESHOLD = 1.0
+
+# Wording of the one button / checkbox on a terms-of-service page
+CLICK_THROUGH_RE = re.compile(
+    r"accept|agree|terms|conditions|(?<![a-z])(?:tos|aup)(?![a-z])|continue|connect|proceed|get online"
+)
+CLICK_THROUGH_TYPES = {"submit", "button", "image", "checkbox"}
+# ... unless it ends the session instead ("Disconnect" also contains "connect")
+LOGOUT_RE = re.compile(r"log[\s_-]?out|logoff|sign[\s_-]?out|disconnect")
+
+
+def build_matcher(features):
+    """
+    One alternation with a named group per feature (m.lastgroup = feature).
+    Every keyword starts with a letter: the leading lookahead lets the engine
+    skip spaces, digits and punctuation without trying each alternative.
+    """
+    alternation = "|".join(f"(?P<{name}>{pattern})" for name, pattern in features.items())
+    return re.compile(f"(?=[a-z])(?:{alternation})")
+
+
+class FieldClassifier:
+    def __init__(self, weights=None, features=None, threshold=USERNAME_THRESHOLD):
+        self.weights = weights or WEIGHTS
+        self.matcher = build_matcher(features) if features else _DEFAULT_MATCHER
+        self.threshold = threshold
+
+    @staticmethod
+    def describe(inp):
+        return " ".join(inp.get(attr, "") for attr in DESCRIPTIVE_ATTRS).lower()
+
+    def classify_forms(self, forms):
+        """
+        Roles for every input of every form, in one batched pass.
+        Returns one list per form, aligned with form["inputs"].
+        """
+        roles = []
+        candidates = []  # (form index, input index) of text-like inputs
+        for form_index, form in enumerate(forms):
+            form_roles = []
+            for input_index, inp in enumerate(form["inputs"]):
+                inp_type = inp.get("type", "text").lower()
+                if inp_type == "password":
+                    form_roles.append("password")
+                elif inp_type == "hidden":
+                    form_roles.append("hidden")
+                elif inp_type in TEXT_TYPES:
+                    form_roles.append("text")
+                    candidates.append((form_index, input_index))
+                else:
+                    form_roles.append("unknown")
+            roles.append(form_roles)
+
+        if not candidates:
+            return roles
+
+        # One string, one regex scan; match offsets map back to their field
+        texts = [self.describe(forms[f]["inputs"][i]) for f, i in candidates]
+        starts, offset = [], 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + 1
+        features = [set() for _ in candidates]
+        for match in self.matcher.finditer("\n".join(texts)):
+            features[bisect_right(starts, match.start()) - 1].add(match.lastgroup)
+
+        best = {}  # form index -> (score, input index)
+        for (form_index, input_index), found in zip(candidates, features):
+            inp = forms[form_index]["inputs"][input_index]
+            score = sum(self.weights.get(feature, 0.0) for feature in found)
+            score += TYPE_WEIGHTS.get(inp.get("type", "text").lower(), 0.0)
+            score += AUTOCOMPLETE_WEIGHTS.get(inp.get("autocomplete", "").lower(), 0.0)
+            if score >= self.threshold and score > best.get(form_index, (float("-inf"),))[0]:
+                best[form_index] = (score, input_index)
+
+        for form_index, (_, input_index) in best.items():
+            roles[form_index][input_index] = "username"
+        return roles
+
+
+_DEFAULT_MATCHER = build_matcher(FEATURES)
+
+
+def find_click_through(forms):
+    """
+    The first form with nothing to type (no password, no text field),
+    just a button or checkbox that accepts terms / connects. None if there is none.
+    """
+    for form in forms:
+        types = [inp.get("type", "text").lower() for inp in form["inputs"]]
+        if any(t == "password" or t in TEXT_TYPES for t in types):
+            continue
+        words = " ".join(
+            FieldClassifier.describe(inp) + " " + inp.get("value", "").lower()
+            for inp, t in zip(form["inputs"], types) if t in CLICK_THROUGH_TYPES
+        )
+        if CLICK_THROUGH_RE.search(words) and not LOGOUT_RE.search(words):
+            return form
+    return None
+
+
+# --- TEST BLOCK ---
+if __name__ == "__main__":
+    forms = [
+        {"attrs": {}, "inputs": [{"type": "text", "name": "q", "placeholder": "Search"}]},
+        {"attrs": {}, "inputs": [
+            {"type": "hidden", "name": "magic"},
+            {"type": "text", "name": "full_name"},
+            {"type": "text", "name": "roll_no", LABEL_KEY: "Roll number"},
+            {"type": "password", "name": "pwd"},
+        ]},
+    ]
+    for form, form_roles in zip(forms, FieldClassifier().classify_forms(forms)):
+        print([(inp.get("name"), role) for inp, role in zip(form["inputs"], form_roles)])
@@ -0,0 +1,96 @@
+"""
+Negative-result cache for portals we can't log into automatically.
+
+Keyed by network (SSID + default gateway) and a content hash of the portal
+page. It remembers "no solvable login form here" and "terms-of-service
+click-through" outcomes, so an unchanged page is not downloaded into the
+parser again and a hopeless network is re-checked less and less often:
+every time the same page gives the same outcome (analyzed again, or
+recognized by its hash), its TTL doubles (up to NEGATIVE_TTL_MAX). The
+agent waits one TTL before looking again, so an entry is kept for
+ENTRY_LIFETIME TTLs: the next look still finds it. A different page on
+that network is analyzed normally.
+"""
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Outcomes worth remembering (a failed JS-redirect hop or a timeout is not)
+NO_FORM = "NO_FORM"
+CLICK_THROUGH = "CLICK_THROUGH"
+
+NEGATIVE_TTL = 120        # First time a page is found unsolvable (seconds)
+NEGATIVE_TTL_MAX = 3600   # Upper bound after repeated confirmations
+MAX_NETWORKS = 256        # Least recently used networks are forgotten beyond this
+ENTRY_LIFETIME = 2        # An entry outlives the wait it asks for by one more TTL
+
+# Per-request noise (tokens, session ids, timestamps) ignored by the hash
+VALUE_ATTR_RE = re.compile(r'value\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s>]*)')
+DIGITS = str.maketrans("", "", "0123456789")
+
+
+def page_hash(text):
+    """Hash of a page that is stable across reloads of the same portal page."""
+    return hashlib.sha1(VALUE_ATTR_RE.sub("", text).translate(DIGITS).encode("utf-8", "replace")).hexdigest()
+
+
+class FingerprintCache:
+    def __init__(self, ttl=NEGATIVE_TTL, max_ttl=NEGATIVE_TTL_MAX, max_networks=MAX_NETWORKS):
+        self.ttl = ttl
+        self.max_ttl = max_ttl
+        self.max_networks = max_networks
+        self.entries = OrderedDict()  # (ssid, gateway) -> {"hash", "outcome", "strikes", "expires"}
+        self._lock = threading.Lock()
+
+    def known(self, network):
+        """True if this network gave a negative outcome before (its pages are worth hashing)."""
+        with self._lock:
+            return network in self.entries
+
+    def check(self, network, text):
+        """
+        (outcome, seconds to wait) if `text` is the page already found
+        unsolvable on this network and its entry is still kept; otherwise None.
+        A hit counts as one more confirmation (the wait doubles).
+        """
+        digest = page_hash(text)
+        with self._lock:
+            entry = self.entries.get(network)
+            if not entry or entry["hash"] != digest or entry["expires"] <= time.monotonic():
+                return None
+            ttl = self._confirm(entry, entry["strikes"] + 1)
+            self.entries.move_to_end(network)
+            return entry["outcome"], ttl
+
+    def _confirm(self, entry, strikes):
+        """Sets the entry's strike count; returns the wait it asks for (seconds)."""
+        ttl = min(self.max_ttl, self.ttl * 2 ** (strikes - 1))
+        entry["strikes"] = strikes
+        entry["expires"] = time.monotonic() + ttl * ENTRY_LIFETIME
+        return ttl
+
+    def record(self, network, text, outcome):
+        """
+        Remembers a negative outcome. `text` may be None when the page was
+        streamed (not kept): the next visit then hashes it.
+        Returns the TTL: how long to wait before looking again (seconds).
+        """
+        digest = page_hash(text) if text is not None else None
+        with self._lock:
+            entry = self.entries.get(network)
+            strikes = 1
+            if entry and entry["outcome"] == outcome and entry["hash"] in (digest, None):
+                strikes = entry["strikes"] + 1
+            self.entries[network] = {"hash": digest, "outcome": outcome}
+            ttl = self._confirm(self.entries[network], strikes)
+            self.entries.move_to_end(network)
+            while len(self.entries) > self.max_networks:
+                self.entries.popitem(last=False)
+        return ttl
+
+    def forget(self, network):
+        """A login worked on this network: nothing negative to remember."""
+        with self._lock:
+            self.entries.pop(network, None)
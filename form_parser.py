@@ -0,0 +1,192 @@
+import re
+import codecs
+from html.parser import HTMLParser
+
+# Same pattern the solver always used: window.location="URL" or window.location.href="URL"
+JS_REDIRECT_RE = re.compile(r'window\.location\.?h?r?e?f?\s*=\s*"([^"]+)"')
+
+# <meta http-equiv="refresh" content="0; url=URL">
+META_REFRESH_URL_RE = re.compile(r"""url\s*=\s*['"]?([^'"]+)""", re.IGNORECASE)
+
+# How much of the previous chunk is kept so a redirect split across chunks is still found
+JS_OVERLAP = 4096
+CHUNK_SIZE = 65536
+
+# Input types a username can be typed into (no type = text)
+USERNAME_TYPES = {"text", "email", "tel", "number"}
+
+# Pseudo-attribute holding the text of an input's <label> (wrapping or for="id"),
+# or of a <button> element's own content
+LABEL_KEY = "_label"
+
+
+class StreamingFormExtractor(HTMLParser):
+    """
+    Incremental HTML tokenizer that only cares about <form>, <input> and <button>.
+    Feed it chunks as they arrive; it sets `done` as soon as a complete login
+    form (a username-like field and a password field) has been closed, so the
+    rest of the page can be skipped. A form with a password field alone (a PIN
+    box, a "change password" form) does not end the scan: a later, fuller form
+    would outscore it.
+
+    Result: `forms` is a list of {"attrs": {...}, "inputs": [{...}, ...]}
+    in document order (the same forms BeautifulSoup's find_all('form') sees).
+    An input's <label> text, if any, is stored under LABEL_KEY in its attrs.
+    `js_redirect` / `meta_refresh` hold the first redirect target of either kind.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.forms = []
+        self.open_forms = []
+        self.done = False
+        self.js_redirect = None
+        self.meta_refresh = None
+        self._tail = ""
+        self._labels = {}        # id -> text of <label for="id">
+        self._open_label = None  # (tag, for, text parts, wrapped inputs)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "label":
+            self._open_label = ("label", dict(attrs).get("for"), [], [])
+        elif tag == "meta" and self.meta_refresh is None:
+            meta = dict(attrs)
+            if (meta.get("http-equiv") or "").lower() == "refresh":
+                match = META_REFRESH_URL_RE.search(meta.get("content") or "")
+                if match:
+                    self.meta_refresh = match.group(1).strip()
+        elif tag == "form":
+            form = {"attrs": self._attrs(attrs), "inputs": [], "has_password": False, "has_username": False}
+            self.forms.append(form)
+            self.open_forms.append(form)
+        elif tag in ("input", "button") and self.open_forms:
+            inp = self._attrs(attrs)
+            if tag == "button":
+                inp.setdefault("type", "submit")  # HTML default, never a text field
+            input_type = inp.get("type", "text").lower()
+            is_password = input_type == "password"
+            is_username = tag == "input" and input_type in USERNAME_TYPES
+            # Nested forms: the input belongs to every enclosing form
+            for form in self.open_forms:
+                form["inputs"].append(inp)
+                form["has_password"] = form["has_password"] or is_password
+                form["has_username"] = form["has_username"] or is_username
+            if self._open_label is not None:
+                self._open_label[3].append(inp)
+            elif tag == "button":
+                self._open_label = ("button", None, [], [inp])
+
+    def handle_data(self, data):
+        if self._open_label is not None:
+            self._open_label[2].append(data)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if self._open_label is not None and tag == self._open_label[0]:
+            _, target, parts, wrapped = self._open_label
+            self._open_label = None
+            text = " ".join("".join(parts).split())
+            if target:
+                self._labels[target] = text
+            for inp in wrapped:
+                inp.setdefault(LABEL_KEY, text)
+        elif tag == "form" and self.open_forms:
+            form = self.open_forms.pop()
+            if form["has_password"] and form["has_username"] and not self.open_forms:
+                self.done = True
+
+    @property
+    def redirect(self):
+        """Where the page sends the browser without any user action (or None)."""
+        return self.js_redirect or self.meta_refresh
+
+    @staticmethod
+    def _attrs(attrs):
+        # Later duplicates win and valueless attributes become "" (BeautifulSoup behaviour)
+        return {name: (value if value is not None else "") for name, value in attrs}
+
+    def close(self):
+        super().close()
+        # <label for="..."> may come before or after its input
+        for form in self.forms:
+            for inp in form["inputs"]:
+                if LABEL_KEY not in inp and inp.get("id") in self._labels:
+                    inp[LABEL_KEY] = self._labels[inp["id"]]
+
+    def feed_chunk(self, text):
+        if self.js_redirect is None:
+            window = self._tail + text
+            match = JS_REDIRECT_RE.search(window)
+            if match:
+                self.js_redirect = match.group(1)
+            self._tail = window[-JS_OVERLAP:]
+        self.feed(text)
+
+
+def extract_forms(response, chunk_size=CHUNK_SIZE):
+    """
+    Streams a response through StreamingFormExtractor.
+    If the body was not read yet (stream=True), reading stops early and the
+    connection is closed once a complete login form is closed (see `done`).
+    A body already in memory is always parsed in full.
+    """
+    parser = StreamingFormExtractor()
+
+    if getattr(response, "_content_consumed", True):
+        text = response.text
+        for start in range(0, len(text), chunk_size):
+            parser.feed_chunk(text[start:start + chunk_size])
+    else:
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        for raw in response.iter_content(chunk_size=chunk_size):
+            parser.feed_chunk(decoder.decode(raw))
+            if parser.done:
+                # Winner found: drop the rest of the body instead of downloading it
+                response.close()
+                break
+        else:
+            parser.feed_chunk(decoder.decode(b"", final=True))
+
+    parser.close()
+    return parser
+
+
+def extract_forms_soup(text):
+    """
+    Reference implementation on top of BeautifulSoup (full tree).
+    Returns the same structure as StreamingFormExtractor.forms; used by the benchmarks.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(text, 'html.parser')
+    forms = []
+    labels = {label['for']: label.get_text() for label in soup.find_all('label') if label.get('for')}
+    for form in soup.find_all('form'):
+        inputs = []
+        for tag in form.find_all(['input', 'button']):
+            inp = dict(tag.attrs)
+            if tag.name == 'button':
+                inp.setdefault('type', 'submit')
+            wrapper = tag.find_parent('label')
+            if wrapper:
+                text = wrapper.get_text()
+            elif tag.name == 'button':
+                text = tag.get_text()
+            else:
+                text = labels.get(inp.get('id'))
+            if text is not None:
+                inp[LABEL_KEY] = " ".join(text.split())
+            inputs.append(inp)
+        forms.append({
+            "attrs": dict(form.attrs),
+            "inputs": inputs,
+            "has_password": any(inp.get('type', 'text').lower() == 'password' for inp in inputs),
+            "has_username": any(tag.name == 'input' and tag.get('type', 'text').lower() in USERNAME_TYPES
+                                for tag in form.find_all(['input', 'button']))
+        })
+    js_redirect = None
+    if not forms:
+        match = JS_REDIRECT_RE.search(text)
+        js_redirect = match.group(1) if match else None
+    return forms, js_redirect
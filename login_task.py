@@ -0,0 +1,156 @@
+import logging
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from probe_engine import ONLINE
+from universal_solver import LOGIN_REJECTED
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Hard budget per stage (seconds). A stage still running when its budget is
+# spent fails the whole task; one that returned in time never does.
+STAGE_DEADLINES = {
+    "fetch": 12,    # Fresh portal page (probe race)
+    "analyze": 10,  # Form analysis incl. redirect / terms pages in front of the form
+    "login": 15,    # Credential POST incl. confirmation pages
+    "verify": 6,    # Post-login probe burst (ends at the first 204)
+}
+# A stage's requests time out at its budget: give their answer this long to come back (seconds)
+STAGE_GRACE = 1
+
+
+class LoginCancelled(Exception):
+    pass
+
+
+class LoginFailed(Exception):
+    pass
+
+
+class LoginTask:
+    """
+    The "Connect & Save" pipeline, run off the UI thread:
+    fetch fresh page -> analyze form -> login -> verify internet.
+    A login the portal visibly rejects fails right away, without probing;
+    the form is cached as the portal's recipe only once the login is verified.
+
+    on_progress(text) is called at the start of every stage,
+    on_done(success, message) exactly once at the end (unless cancelled).
+    Both are called from the worker thread; the caller marshals them to its UI.
+    """
+    def __init__(self, solver, net, username, password, on_progress, on_done, deadlines=None):
+        self.solver = solver
+        self.net = net
+        self.username = username
+        self.password = password
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.deadlines = deadlines or STAGE_DEADLINES
+        self.portal_id = None
+        self.login_url = None  # Page the form was read from
+        self.response = None   # Portal's answer to the login
+        self.succeeded = False
+        self._cancelled = threading.Event()
+        self._wake = threading.Event()  # Stage finished or task cancelled
+        self._executor = None
+
+    def cancel(self):
+        self._cancelled.set()
+        self._wake.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _stage(self, name, message, func):
+        """
+        Runs func(budget) as one stage on the stage thread and waits for it
+        at most `budget` (+ STAGE_GRACE) seconds; a cancel() ends the wait at once.
+        func should use `budget` (seconds) as the timeout of its requests, so a
+        stage given up on stops soon after (whatever it returns is dropped).
+        """
+        self._wake.clear()
+        if self.cancelled:
+            raise LoginCancelled()
+        self.on_progress(message)
+
+        budget = self.deadlines[name]
+        start = time.monotonic()
+        future = self._executor.submit(func, budget)
+        future.add_done_callback(lambda future: self._wake.set())
+        self._wake.wait(budget + STAGE_GRACE)
+        elapsed = time.monotonic() - start
+
+        if self.cancelled:
+            raise LoginCancelled()
+        if not future.done():
+            raise LoginFailed(f"Timed out while {message.lower().rstrip('.')} ({budget:.0f}s)")
+        log.debug("Login stage %s took %.2fs", name, elapsed)
+        return future.result()
+
+    def run(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="login-stage")
+        try:
+            self._run()
+        finally:
+            self._executor.shutdown(wait=False)
+
+    def _run(self):
+        try:
+            # CRITICAL FIX: Fetch a FRESH token right now!
+            # Do not use the old cached page from 1 minute ago.
+            fresh_page = self._stage(
+                "fetch", "Getting fresh token...", lambda budget: self.solver.get_portal_page(timeout=budget)
+            )
+            if fresh_page == ONLINE:
+                raise LoginFailed("Already online. No login needed.")
+            if not fresh_page:
+                raise LoginFailed("Error: Could not reach login page.")
+            self.portal_id = self.solver.get_portal_identifier(fresh_page.url)
+
+            form_info = self._stage(
+                "analyze", "Reading login form...",
+                lambda budget: self.solver.analyze_page(fresh_page, timeout=budget, budget=budget, learn=False)
+            )
+            if not form_info:
+                raise LoginFailed("Error: Login form not found.")
+            self.login_url = form_info['url']
+
+            result = self._stage(
+                "login", "Logging in...",
+                lambda budget: self.solver.login(
+                    form_info, self.username, self.password, timeout=budget, budget=budget
+                )
+            )
+            if result is None:
+                raise LoginFailed("Error: Could not submit the login form.")
+            if self.solver.login_verdict(form_info, result) == LOGIN_REJECTED:
+                raise LoginFailed("Login rejected.\nWrong username or password?")
+            self.response = result
+
+            # Quick probes until the firewall opens up (no fixed wait)
+            online = self._stage(
+                "verify", "Checking internet...", lambda budget: self.net.confirm_online(deadline=budget)
+            )
+            if not online:
+                raise LoginFailed("Login sent, but no Internet.\nWrong Password?")
+            # The form worked: only now is it worth remembering
+            self.solver.learn_recipe(form_info)
+
+        except LoginCancelled:
+            log.info(">> Login cancelled by user.")
+            return
+        except LoginFailed as e:
+            metrics.count("login_failures", portal=self.portal_id or "unknown")
+            self.on_done(False, str(e))
+            return
+        except Exception as e:
+            log.exception("Login task failed: %s", e)
+            metrics.count("login_failures", portal=self.portal_id or "unknown")
+            self.on_done(False, f"Error: {str(e)}")
+            return
+
+        self.succeeded = True
+        metrics.count("logins", portal=self.portal_id)
+        self.on_done(True, "Success! Connected.")
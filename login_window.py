@@ -0,0 +1,157 @@
+import queue
+import customtkinter as ctk
+
+UI_QUEUE_INTERVAL = 100  # How often the Tk thread picks up work from the agent (ms)
+
+class LoginWindow(ctk.CTk):
+    """
+    The credential prompt. Only imported (and Tk only initialised) when an
+    unknown portal shows up; destroyed again once the user is done.
+    """
+    def __init__(self, app, agent):
+        super().__init__()
+        
+        # --- UI SETUP ---
+        self.title("WiFi Auto-Login")
+        self.geometry("420x510") # Made slightly taller
+        self.resizable(False, False)
+        
+        # Title
+        self.label = ctk.CTkLabel(self, text="Login Required", font=("Arial", 22, "bold"))
+        self.label.pack(pady=(30, 10))
+        
+        self.sub_label = ctk.CTkLabel(self, text="Detected Captive Portal", font=("Arial", 14), text_color="gray")
+        self.sub_label.pack(pady=(0, 20))
+        
+        # Username
+        self.user_entry = ctk.CTkEntry(self, placeholder_text="Username", width=280, height=40)
+        self.user_entry.pack(pady=10)
+        
+        # Password
+        self.pass_entry = ctk.CTkEntry(self, placeholder_text="Password", show="*", width=280, height=40)
+        self.pass_entry.pack(pady=10)
+        
+        # Show Password Checkbox
+        self.show_pass_var = ctk.BooleanVar(value=False)
+        self.show_pass_chk = ctk.CTkCheckBox(
+            self, text="Show Password", variable=self.show_pass_var, command=self.toggle_password,
+            font=("Arial", 12), width=20, height=20
+        )
+        self.show_pass_chk.pack(pady=5)
+        
+        # Status Label
+        self.status_label = ctk.CTkLabel(self, text="", text_color="#FF5555", font=("Arial", 12))
+        self.status_label.pack(pady=10)
+        
+        # Connect Button
+        self.login_btn = ctk.CTkButton(
+            self, text="Connect & Save", command=self.on_submit, width=280, height=50,
+            font=("Arial", 15, "bold"), fg_color="#1F6AA5", hover_color="#144870"
+        )
+        self.login_btn.pack(pady=(20, 5))
+
+        # Cancel Button (only active while a login is running)
+        self.cancel_btn = ctk.CTkButton(
+            self, text="Cancel", command=self.on_cancel, width=280, height=36,
+            font=("Arial", 13), fg_color="gray30", hover_color="gray20", state="disabled"
+        )
+        self.cancel_btn.pack(pady=(5, 20))
+
+        # --- LOGIC SETUP ---
+        # All probing / login work happens in the agent's worker thread
+        self.app = app
+        self.agent = agent
+        self.login_task = None
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(UI_QUEUE_INTERVAL, self.process_ui_queue)
+
+    def toggle_password(self):
+        """Toggles the password masking"""
+        if self.show_pass_var.get():
+            self.pass_entry.configure(show="")
+        else:
+            self.pass_entry.configure(show="*")
+
+    def process_ui_queue(self):
+        """Runs work posted by the agent (Tk is only touched from here)"""
+        try:
+            while True:
+                func, args = self.app.ui_queue.get_nowait()
+                func(*args)
+        except queue.Empty:
+            pass
+        self.after(UI_QUEUE_INTERVAL, self.process_ui_queue)
+
+    def show_login_ui(self):
+        """Update UI and Show Window"""
+        interface = f" ({self.agent.interface})" if self.agent.interface else ""
+        self.sub_label.configure(text=f"WiFi: {self.agent.current_ssid}{interface}")
+        
+        # Clear fields
+        self.user_entry.delete(0, 'end')
+        self.pass_entry.delete(0, 'end')
+        self.status_label.configure(text="")
+        
+        # Pop up
+        self.deiconify()
+        self.lift()
+        self.attributes('-topmost', True)
+        self.attributes('-topmost', False)
+
+    def on_submit(self):
+        """User Clicked Connect"""
+        u = self.user_entry.get()
+        p = self.pass_entry.get()
+        
+        if not u or not p:
+            self.status_label.configure(text="Please enter username and password")
+            return
+        if self.login_task:
+            return
+
+        # The whole pipeline runs on the agent thread; the UI only gets progress updates
+        self.login_task = self.agent.submit_login(
+            u, p,
+            on_progress=lambda task, text: self.app.post_ui(self.on_login_progress, task, text),
+            on_done=lambda task, ok, text: self.app.post_ui(self.on_login_done, task, ok, text)
+        )
+        self.login_btn.configure(state="disabled")
+        self.cancel_btn.configure(state="normal")
+
+    def on_login_progress(self, task, text):
+        if task is not self.login_task:
+            return # Cancelled meanwhile
+        self.status_label.configure(text=text, text_color="orange")
+
+    def on_login_done(self, task, success, text):
+        if task is not self.login_task:
+            return # Cancelled meanwhile
+        self.login_task = None
+        self.cancel_btn.configure(state="disabled")
+
+        if not success:
+            self.login_btn.configure(state="normal")
+            self.status_label.configure(text=text, text_color="red")
+            return
+
+        self.status_label.configure(text=text, text_color="green")
+        self.after(1500, self.finish_login)
+
+    def finish_login(self):
+        self.destroy() # Close window (Tk is released until the next prompt)
+        self.agent.resume() # Resume monitoring
+
+    def on_close(self):
+        """Window closed by the user: quit the app (as before)"""
+        self.app.running = False
+        self.destroy()
+
+    def on_cancel(self):
+        """Stops the running login (takes effect at the next stage boundary)"""
+        if not self.login_task:
+            return
+        self.login_task.cancel()
+        self.login_task = None
+        self.cancel_btn.configure(state="disabled")
+        self.login_btn.configure(state="normal")
+        self.status_label.configure(text="Cancelled.", text_color="gray")
@@ -1,198 +1,200 @@
+import os
 import time
-import threading
-import customtkinter as ctk
-from universal_solver import UniversalSolver
-from network_manager import NetworkManager
-from storage import StorageManager
-
-class AutoLoginApp(ctk.CTk):
-    def __init__(self):
-        super().__init__()
-        
-        # --- UI SETUP ---
-        self.title("WiFi Auto-Login")
-        self.geometry("420x450") # Made slightly taller
-        self.resizable(False, False)
-        
-        # Title
-        self.label = ctk.CTkLabel(self, text="Login Required", font=("Arial", 22, "bold"))
-        self.label.pack(pady=(30, 10))
-        
-        self.sub_label = ctk.CTkLabel(self, text="Detected Captive Portal", font=("Arial", 14), text_color="gray")
-        self.sub_label.pack(pady=(0, 20))
-        
-        # Username
-        self.user_entry = ctk.CTkEntry(self, placeholder_text="Username", width=280, height=40)
-        self.user_entry.pack(pady=10)
-        
-        # Password
-        self.pass_entry = ctk.CTkEntry(self, placeholder_text="Password", show="*", width=280, height=40)
-        self.pass_entry.pack(pady=10)
-        
-        # Show Password Checkbox
-        self.show_pass_var = ctk.BooleanVar(value=False)
-        self.show_pass_chk = ctk.CTkCheckBox(
-            self, text="Show Password", variable=self.show_pass_var, command=self.toggle_password,
-            font=("Arial", 12), width=20, height=20
-        )
-        self.show_pass_chk.pack(pady=5)
-        
-        # Status Label
-        self.status_label = ctk.CTkLabel(self, text="", text_color="#FF5555", font=("Arial", 12))
-        self.status_label.pack(pady=10)
-        
-        # Connect Button
-        self.login_btn = ctk.CTkButton(
-            self, text="Connect & Save", command=self.on_submit, width=280, height=50,
-            font=("Arial", 15, "bold"), fg_color="#1F6AA5", hover_color="#144870"
-        )
-        self.login_btn.pack(pady=20)
-
-        # --- LOGIC SETUP ---
-        self.solver = UniversalSolver()
-        self.net = NetworkManager()
-        self.store = StorageManager()
-        
+import queue
+import logging
+import itertools
+from agent import AgentGroup
+from agent_service import AgentService, ServiceClient
+from scheduler import AgentState
+from metrics import metrics, setup_logging
+
+log = logging.getLogger(__name__)
+
+# A host that just took the lock needs a moment before it listens (seconds)
+RECONNECT_DELAY = 1
+
+
+class RemoteTask:
+    """A login running in the service, as seen by the window (see AutoLoginAgent.submit_login)."""
+    def __init__(self, app, task_id, on_progress, on_done):
+        self.app = app
+        self.id = task_id
+        self.on_progress = on_progress
+        self.on_done = on_done
+
+    def cancel(self):
+        self.app.tasks.pop(self.id, None)
+        self.app.send({"op": "cancel", "task": self.id})
+
+
+class RemoteAgent:
+    """Stand-in for one of the service's agents, with what the login window needs."""
+    def __init__(self, app, name):
+        self.app = app
+        self.name = name
+        self.interface = None
+        self.state = None
         self.current_ssid = None
-        
-        # Start Hidden
-        print(">> App started (Hidden). Waiting for network drop...")
-        self.withdraw()
-        self.after(1000, self.check_network_loop)
-
-    def toggle_password(self):
-        """Toggles the password masking"""
-        if self.show_pass_var.get():
-            self.pass_entry.configure(show="")
-        else:
-            self.pass_entry.configure(show="*")
-
-    def check_network_loop(self):
-        """Main Loop running on Main Thread"""
-        checker_thread = threading.Thread(target=self.background_logic)
-        checker_thread.daemon = True
-        checker_thread.start()
-
-    def background_logic(self):
+        self.current_portal_id = None
+
+    def submit_login(self, username, password, on_progress, on_done):
+        task = RemoteTask(self.app, next(self.app.task_ids), on_progress, on_done)
+        self.app.tasks[task.id] = task
+        if not self.app.send({"op": "login", "agent": self.name, "task": task.id,
+                              "username": username, "password": password}):
+            self.app.tasks.pop(task.id, None)
+            self.app.post_ui(on_done, task, False, "Agent not reachable. Try again.")
+        return task
+
+    def resume(self):
+        self.app.send({"op": "resume", "agent": self.name})
+
+
+class AutoLoginApp:
+    """
+    Desktop app: a thin front end of the shared agent service (agent_service.py).
+    Probing, logins and storage run once per machine (root's daemon) or per
+    user, however many apps are open: the first one hosts the service
+    in-process, the others connect to it (and one of them takes over when
+    the host quits). The login window
+    (customtkinter) is only imported and built when an agent needs
+    credentials; until then no Tk is loaded at all.
+    With several Wi-Fi adapters, each one gets its own agent and its own prompt.
+    """
+    def __init__(self):
+        self.ui_queue = queue.Queue()
+        self.running = True
+        self.service = None  # Set while this app hosts the agents
+        self.client = None
+        self.agents = {}     # name -> RemoteAgent
+        self.tasks = {}      # task id -> RemoteTask
+        self.task_ids = itertools.count(1)
+        self.window = None
+
+    def post_ui(self, func, *args):
+        self.ui_queue.put((func, args))
+
+    def send(self, message):
+        """Sends a request to the service. False if it is not reachable (reconnecting)."""
         try:
-            # 1. Check Internet
-            if self.net.is_connected():
-                # print(f">> [{time.ctime()}] Online. Sleeping...") 
-                self.after(10000, self.check_network_loop)
+            self.client.send(message)
+            return True
+        except (OSError, AttributeError):
+            return False
+
+    # --- service connection ---
+    def connect(self):
+        """Connects to the service, hosting it in this process if nobody does."""
+        while self.running:
+            try:
+                self.client = ServiceClient(
+                    on_event=lambda message: self.post_ui(self.on_event, message),
+                    on_close=lambda: self.post_ui(self.on_disconnect)
+                )
+                log.info(">> Connected to the agent service%s.", " (hosted here)" if self.service else "")
                 return
-
-            # 2. Offline -> Probe
-            print(">> Internet down. Probing...")
-            portal_page = self.solver.get_portal_page()
-            
-            if not portal_page:
-                print(">> No portal found. Retrying...")
-                self.after(5000, self.check_network_loop)
-                return
-
-            # 3. Portal Found
-            self.current_ssid = self.net.get_ssid() or "Unknown Network"
-            portal_id = self.solver.get_portal_identifier(portal_page.url)
-            
-            print(f">> Portal: {self.current_ssid} | Host: {portal_id}")
-
-            # 4. Check Saved Creds
-            creds = self.store.get_credentials(self.current_ssid)
-            if not creds:
-                creds = self.store.find_by_portal_id(portal_id)
-
-            if creds:
-                print(">> Auto-Login with saved creds...")
-                # We fetch a FRESH page here to ensure the token isn't stale
-                fresh_page = self.solver.get_portal_page() 
-                if fresh_page:
-                    form_info = self.solver.analyze_page(fresh_page)
-                    if self.solver.login(form_info, creds['username'], creds['password']):
-                        print(">> Auto-Login Success!")
-                    else:
-                        print(">> Auto-Login Failed (Bad Creds?)")
-                
-                self.after(5000, self.check_network_loop)
+            except OSError:
+                pass
+            if self.service is None:
+                service = AgentService(lambda: AgentGroup(on_prompt=self.on_prompt))
+                if service.start(delay=1):
+                    self.service = service
+                    continue
+            time.sleep(RECONNECT_DELAY)
+
+    def on_disconnect(self):
+        """UI thread: the host went away (another app quit). Take over or reconnect."""
+        if not self.running:
+            return
+        log.info(">> Agent service gone. Reconnecting...")
+        self.client = None
+        for task in list(self.tasks.values()):
+            task.on_done(task, False, "Agent restarted. Try again.")
+        self.tasks.clear()
+        self.connect()
+
+    def on_prompt(self, agent):
+        """Service side (hosted here): the state event tells every front end, this app included."""
+        log.info(">> [%s] Credentials needed for '%s'.", agent.name, agent.current_ssid)
+
+    # --- events (UI thread) ---
+    def on_event(self, message):
+        event = message.get("event")
+        if event == "snapshot":
+            for state in message["agents"]:
+                self.on_state(state)
+        elif event == "state":
+            self.on_state(message)
+        elif event in ("progress", "done"):
+            task = self.tasks.get(message["task"])
+            if task is None:
+                return  # Cancelled meanwhile
+            if event == "progress":
+                task.on_progress(task, message["text"])
             else:
-                # 5. Unknown -> Show UI
-                print(">> Surfacing UI for user input...")
-                self.show_login_ui()
-
-        except Exception as e:
-            print(f"Error in background: {e}")
-            self.after(10000, self.check_network_loop)
-
-    def show_login_ui(self):
-        """Update UI and Show Window"""
-        self.sub_label.configure(text=f"WiFi: {self.current_ssid}")
-        
-        # Clear fields
-        self.user_entry.delete(0, 'end')
-        self.pass_entry.delete(0, 'end')
-        self.status_label.configure(text="")
-        
-        # Pop up
-        self.deiconify()
-        self.lift()
-        self.attributes('-topmost', True)
-        self.attributes('-topmost', False)
-
-    def on_submit(self):
-        """User Clicked Connect"""
-        u = self.user_entry.get()
-        p = self.pass_entry.get()
-        
-        if not u or not p:
-            self.status_label.configure(text="Please enter username and password")
+                self.tasks.pop(task.id, None)
+                task.on_done(task, message["success"], message["text"])
+
+    def on_state(self, state):
+        agent = self.agents.get(state["agent"])
+        if agent is None:
+            agent = self.agents[state["agent"]] = RemoteAgent(self, state["agent"])
+        agent.interface = state["interface"]
+        agent.state = state["state"]
+        agent.current_ssid = state["ssid"]
+        agent.current_portal_id = state["portal"]
+
+        if self.window is not None:
+            # Answered in another front end (or by `daemon.py add`): nothing left to ask here
+            if self.window.agent is agent and agent.state != AgentState.AWAITING_USER:
+                self.window.after(0, self.window.destroy)
             return
-        
-        self.status_label.configure(text="Getting fresh token...", text_color="orange")
-        self.update()
-        
-        # CRITICAL FIX: Fetch a FRESH token right now!
-        # Do not use the old cached page from 1 minute ago.
-        try:
-            fresh_page = self.solver.get_portal_page()
-            if not fresh_page:
-                self.status_label.configure(text="Error: Could not reach login page.")
+        if agent.state == AgentState.AWAITING_USER:
+            log.info(">> Surfacing UI for user input...")
+            self.show_login_ui(agent)
+
+    def show_login_ui(self, agent):
+        """Builds the window on first use and runs Tk until the user is done"""
+        from login_window import LoginWindow
+
+        self.window = LoginWindow(self, agent)
+        self.window.show_login_ui()
+        self.window.mainloop()
+        self.window = None
+        # Another interface may have been waiting meanwhile
+        for other in self.agents.values():
+            if self.running and other is not agent and other.state == AgentState.AWAITING_USER:
+                self.show_login_ui(other)
                 return
 
-            self.status_label.configure(text="Logging in...")
-            self.update()
-
-            form_info = self.solver.analyze_page(fresh_page)
-            if not form_info:
-                self.status_label.configure(text="Error: Login form not found.")
-                return
+    def mainloop(self):
+        # Start Hidden
+        log.info(">> App started (Hidden). Waiting for network drop...")
+        self.connect()
 
-            # Perform Login
-            result = self.solver.login(form_info, u, p)
-            
-            if result and result.status_code == 200:
-                # Double check internet
-                time.sleep(1)
-                if self.net.is_connected():
-                    self.status_label.configure(text="Success! Connected.", text_color="green")
-                    self.update()
-                    
-                    # Save Credentials ONLY on success
-                    self.store.save_credentials(
-                        self.current_ssid, u, p, 
-                        self.solver.get_portal_identifier(fresh_page.url)
-                    )
-                    
-                    time.sleep(1.5)
-                    self.withdraw() # Hide window
-                    self.check_network_loop() # Resume monitoring
-                else:
-                    self.status_label.configure(text="Login sent, but no Internet.\nWrong Password?", text_color="red")
-            else:
-                self.status_label.configure(text=f"Login Rejected (Server {result.status_code})", text_color="red")
+        # Sleep until the service sends something (no polling timer while hidden)
+        while self.running:
+            func, args = self.ui_queue.get()
+            func(*args)
 
-        except Exception as e:
-            self.status_label.configure(text=f"Error: {str(e)}", text_color="red")
-            print(e)
+    def stop(self):
+        self.running = False
+        if self.client:
+            self.client.close()
+        if self.service:
+            self.service.stop()
 
 if __name__ == "__main__":
+    # Same knobs as daemon.py's flags, through the environment
+    setup_logging(os.environ.get("WIFI_AUTH_LOG_LEVEL", "INFO"))
+    if os.environ.get("WIFI_AUTH_METRICS_FILE"):
+        metrics.enable(jsonl=os.environ["WIFI_AUTH_METRICS_FILE"])
+    if os.environ.get("WIFI_AUTH_METRICS_PORT"):
+        metrics.serve_prometheus(int(os.environ["WIFI_AUTH_METRICS_PORT"]))
+
     app = AutoLoginApp()
-    app.mainloop()
\ No newline at end of file
+    try:
+        app.mainloop()
+    except KeyboardInterrupt:
+        pass
+    app.stop()
@@ -0,0 +1,217 @@
+"""
+Hot-path instrumentation: timed spans, counters and the logging setup.
+
+    from metrics import metrics
+    with metrics.span("probe"):
+        ...
+    metrics.count("login_failures", portal=portal_id)
+
+Disabled by default: span() then hands out one shared no-op context and
+count() returns right away, so the instrumented code pays one attribute check.
+Enable it with metrics.enable(jsonl=path) (rotating JSON-lines file, one line
+per event) and/or metrics.serve_prometheus(port) (text format on /metrics).
+"""
+import json
+import time
+import logging
+import threading
+import contextlib
+import logging.handlers
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Prometheus metric names are prefixed with this
+NAMESPACE = "wifi_auth"
+
+# Span histogram buckets (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# JSON-lines file rotation
+JSONL_MAX_BYTES = 5 * 1024 * 1024
+JSONL_BACKUPS = 3
+
+LOG_FORMAT = "%(message)s"
+DEBUG_LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+_NOOP_SPAN = contextlib.nullcontext()
+
+
+def setup_logging(level="INFO"):
+    """
+    Console logging for the entry points. At INFO the output looks like
+    the old print() diagnostics; DEBUG adds timestamps, levels and modules.
+    """
+    level = getattr(logging, str(level).upper(), logging.INFO)
+    logging.basicConfig(level=level, format=DEBUG_LOG_FORMAT if level <= logging.DEBUG else LOG_FORMAT)
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, error=exc_type is not None, **self.labels)
+        return False
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., count, sum]
+        self._events = None    # Logger writing JSON lines, when enabled
+        self._server = None
+
+    # --- recording (hot path) ---
+    def span(self, name, **labels):
+        """Times the with-block as `name` (histogram + JSON line)."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, labels)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        if self._events:
+            self._emit({"type": "count", "name": name, "value": value, **labels})
+
+    def observe(self, name, seconds, error=False, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(BUCKETS) + 2)
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[index] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+            if error:
+                errors = (name + "_errors", key[1])
+                self._counters[errors] = self._counters.get(errors, 0) + 1
+        if self._events:
+            self._emit({"type": "span", "name": name, "seconds": round(seconds, 6), "error": error, **labels})
+
+    def _emit(self, event):
+        event["ts"] = round(time.time(), 3)
+        self._events.info(json.dumps(event))
+
+    # --- setup ---
+    def enable(self, jsonl=None, max_bytes=JSONL_MAX_BYTES, backups=JSONL_BACKUPS):
+        """Starts recording; with `jsonl`, every event is also appended to that (rotating) file."""
+        if jsonl and self._events is None:
+            handler = logging.handlers.RotatingFileHandler(jsonl, maxBytes=max_bytes, backupCount=backups)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            events = logging.getLogger(f"{NAMESPACE}.events")
+            events.propagate = False  # Never echoed on the console
+            events.setLevel(logging.INFO)
+            events.addHandler(handler)
+            self._events = events
+        self.enabled = True
+
+    def serve_prometheus(self, port, host="127.0.0.1"):
+        """Serves the Prometheus text format on http://host:port/metrics (background thread)."""
+        self.enable()
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="metrics").start()
+        logging.getLogger(__name__).info(">> Metrics on http://%s:%d/metrics", host, self._server.server_port)
+        return self._server.server_port
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    # --- export ---
+    def snapshot(self):
+        """Counters and span totals as plain dicts (name{labels} -> value / {count, sum})."""
+        with self._lock:
+            return {
+                "counters": {_series(name, labels): value for (name, labels), value in self._counters.items()},
+                "spans": {
+                    _series(name, labels): {"count": h[-2], "sum": h[-1]}
+                    for (name, labels), h in self._histograms.items()
+                },
+            }
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE {NAMESPACE}_{name}_total counter")
+            for (series, labels), value in counters:
+                if series == name:
+                    lines.append(f"{NAMESPACE}_{_series(name + '_total', labels)} {value}")
+
+        for name in sorted({name for (name, _), _ in histograms}):
+            metric = f"{name}_seconds"
+            lines.append(f"# TYPE {NAMESPACE}_{metric} histogram")
+            for (series, labels), h in histograms:
+                if series != name:
+                    continue
+                for bound, hits in zip(BUCKETS, h):
+                    lines.append(f"{NAMESPACE}_{_series(metric + '_bucket', labels + (('le', str(bound)),))} {hits}")
+                lines.append(f"{NAMESPACE}_{_series(metric + '_bucket', labels + (('le', '+Inf'),))} {h[-2]}")
+                lines.append(f"{NAMESPACE}_{_series(metric + '_count', labels)} {h[-2]}")
+                lines.append(f"{NAMESPACE}_{_series(metric + '_sum', labels)} {h[-1]:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series(name, labels):
+    """name{key="value",...} as used in the Prometheus text format."""
+    if not labels:
+        return name
+    text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return f"{name}{{{text}}}"
+
+
+# Process-wide instance used by every module
+metrics = Metrics()
+
+
+# --- TEST BLOCK ---
+if __name__ == "__main__":
+    metrics.enable()
+    with metrics.span("probe"):
+        time.sleep(0.02)
+    metrics.count("probes", outcome="online")
+    metrics.count("login_failures", portal="http://172.16.0.1:1000")
+    print(metrics.render_prometheus())
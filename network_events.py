@@ -0,0 +1,181 @@
+import logging
+import os
+import socket
+import struct
+import subprocess
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# rtnetlink multicast groups (linux/rtnetlink.h)
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+
+# rtnetlink message types
+RTM_NEWLINK, RTM_DELLINK = 16, 17
+RTM_NEWADDR, RTM_DELADDR = 20, 21
+RTM_NEWROUTE, RTM_DELROUTE = 24, 25
+
+NLMSG_HDR = struct.Struct("=IHHII")   # len, type, flags, seq, pid
+RTMSG = struct.Struct("=BBBBBBBBI")   # family, dst_len, src_len, tos, table, protocol, scope, type, flags
+IFINFOMSG = struct.Struct("=BxHiII")  # family, type, index, flags, change
+
+IFF_UP = 0x1
+IFF_RUNNING = 0x40
+
+# Events arrive in bursts (link up -> address -> route); wait for quiet before reporting
+DEBOUNCE = 1.0
+
+
+class NetworkEventSource:
+    """
+    Watches the kernel for link, address and default-route changes (Linux only)
+    and calls callback(reason) once per burst of changes.
+
+    Backends, in order of preference:
+    1. rtnetlink socket (no extra process)
+    2. 'ip monitor' subprocess
+    If neither is available start() returns False and the caller keeps polling.
+    """
+    def __init__(self, callback, debounce=DEBOUNCE):
+        self.callback = callback
+        self.debounce = debounce
+        self.backend = None
+        self._stop = threading.Event()
+        self._changed = threading.Event()
+        self._reason = None
+        self._link_state = {}
+        self._sock = None
+        self._proc = None
+
+    @property
+    def active(self):
+        return self.backend is not None and not self._stop.is_set()
+
+    def start(self):
+        if not hasattr(socket, "AF_NETLINK"):
+            return False
+
+        reader = None
+        try:
+            self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            self._sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE
+                             | RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE))
+            self.backend = "netlink"
+            reader = self._read_netlink
+        except OSError as e:
+            log.info(">> Netlink unavailable (%s). Trying 'ip monitor'...", e)
+            self._sock = None
+            try:
+                self._proc = subprocess.Popen(
+                    ["ip", "monitor", "link", "address", "route"],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+                )
+                self.backend = "ip monitor"
+                reader = self._read_ip_monitor
+            except (FileNotFoundError, OSError):
+                return False
+
+        threading.Thread(target=reader, daemon=True, name="net-events").start()
+        threading.Thread(target=self._dispatch, daemon=True, name="net-events-dispatch").start()
+        log.info(">> Watching network changes via %s.", self.backend)
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._changed.set()
+        if self._sock:
+            self._sock.close()
+        if self._proc:
+            self._proc.terminate()
+
+    def _notify(self, reason):
+        self._reason = reason
+        self._changed.set()
+
+    def _dispatch(self):
+        """Coalesces bursts of kernel events into one callback."""
+        while not self._stop.is_set():
+            self._changed.wait()
+            # Keep waiting while events keep coming
+            while self._changed.is_set() and not self._stop.is_set():
+                self._changed.clear()
+                time.sleep(self.debounce)
+            if self._stop.is_set():
+                return
+            try:
+                self.callback(self._reason)
+            except Exception as e:
+                log.exception("Error in network event handler: %s", e)
+
+    # --- Backend 1: rtnetlink ---
+    def _read_netlink(self):
+        while not self._stop.is_set():
+            try:
+                data = self._sock.recv(65536)
+            except OSError:
+                return
+            offset = 0
+            while offset + NLMSG_HDR.size <= len(data):
+                msg_len, msg_type, _, _, _ = NLMSG_HDR.unpack_from(data, offset)
+                if msg_len < NLMSG_HDR.size:
+                    break
+                reason = self._classify(msg_type, data, offset + NLMSG_HDR.size)
+                if reason:
+                    self._notify(reason)
+                offset += (msg_len + 3) & ~3
+
+    def _classify(self, msg_type, data, payload):
+        """Returns a reason string for changes that matter, None for noise."""
+        if msg_type in (RTM_NEWROUTE, RTM_DELROUTE):
+            if payload + RTMSG.size > len(data):
+                return None
+            dst_len = RTMSG.unpack_from(data, payload)[1]
+            # Only the default route tells us we moved to another network
+            return "default route changed" if dst_len == 0 else None
+
+        if msg_type in (RTM_NEWADDR, RTM_DELADDR):
+            return "address changed"
+
+        if msg_type in (RTM_NEWLINK, RTM_DELLINK):
+            if payload + IFINFOMSG.size > len(data):
+                return None
+            _, _, index, flags, _ = IFINFOMSG.unpack_from(data, payload)
+            # NEWLINK also fires for statistics/wireless chatter; report only up/down flips
+            state = bool(flags & IFF_UP and flags & IFF_RUNNING) if msg_type == RTM_NEWLINK else None
+            if self._link_state.get(index) == state:
+                return None
+            self._link_state[index] = state
+            return "interface changed"
+        return None
+
+    # --- Backend 2: 'ip monitor' ---
+    def _read_ip_monitor(self):
+        for line in self._proc.stdout:
+            if self._stop.is_set():
+                return
+            line = line.strip()
+            if line.startswith(("default", "Deleted default")):
+                self._notify("default route changed")
+            elif " inet" in line:
+                self._notify("address changed")
+            elif "state " in line:
+                self._notify("interface changed")
+
+
+# --- TEST BLOCK ---
+if __name__ == "__main__":
+    source = NetworkEventSource(lambda reason: print(f"[{time.ctime()}] {reason}"))
+    if not source.start():
+        print("No event backend on this system.")
+    else:
+        print(f"PID {os.getpid()} watching (Ctrl+C to stop)...")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            source.stop()
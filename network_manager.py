@@ -1,30 +1,254 @@
+import logging
 import subprocess
 import platform
+import socket
+import struct
+import glob
 import re
-import requests
 import time
+from probe_engine import ProbeEngine, ONLINE, BURST_DEADLINE
+from network_events import NetworkEventSource
+from transport import Transport
+from wireless import Nl80211, list_wireless_interfaces
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# How long a looked-up SSID / gateway is trusted when no change events can invalidate it (seconds)
+SSID_CACHE_TTL = 5
+
+# get_gateway() when the system has no default route at all (None = can't tell)
+NO_GATEWAY = ""
+
+RTF_GATEWAY = 0x2
+
+# Where DHCP clients keep the options of the current lease (RFC 8910 option 114)
+NETWORKD_LEASE = "/run/systemd/netif/leases/{index}"
+DHCLIENT_LEASES = [
+    "/var/lib/dhcp/dhclient*.leases",
+    "/var/lib/dhclient/*.lease*",
+    "/var/lib/NetworkManager/*.lease",
+]
+# option captive-portal "..." / option unknown-114 "..." (dhclient), CAPTIVE_PORTAL=... (networkd),
+# DHCP4.OPTION[n]:captive_portal = ... (nmcli)
+CAPTIVE_URI_RE = re.compile(
+    r'(?:captive[_-]portal|unknown-114|option_114|option 114)\s*[=\s]\s*"?(https?://[^";\s]+)',
+    re.IGNORECASE
+)
 
 class NetworkManager:
-    def __init__(self):
+    def __init__(self, prober=None, transport=None, interface=None, captive_api=None):
         self.os_type = platform.system()
+        self.prober = prober or ProbeEngine(session=(transport or Transport()).probe_session())
+
+        # Preferred Wi-Fi interface (None = first one that is connected)
+        self.interface = interface
+        self._ssid_cache = {}       # interface (or "*") -> (ssid, expires or None)
+        self._gateway_cache = {}    # Same layout, for get_gateway()
+        self._api_cache = {}        # Same layout, for get_captive_api()
+        # Fixed Captive Portal API URI (e.g. a local stand-in); skips the lease lookup
+        self.captive_api = captive_api
+        self._events_active = False
+        self._nl80211 = None        # Lazily opened; False when the kernel has no nl80211
+        self._wifi_interfaces = None
 
-    def get_ssid(self):
+    def get_wifi_interfaces(self):
+        """Wi-Fi interface names on this machine (discovered once)."""
+        if self._wifi_interfaces is None:
+            self._wifi_interfaces = list_wireless_interfaces(self.os_type)
+        return self._wifi_interfaces
+
+    def invalidate_ssid_cache(self):
+        self._ssid_cache.clear()
+        self._gateway_cache.clear()
+        self._api_cache.clear()
+        self._wifi_interfaces = None
+
+    def get_ssid(self, interface=None):
         """
         Cross-platform method to get the current connected WiFi SSID.
+        Results are cached until the link changes (or for SSID_CACHE_TTL without change events).
         Returns: String (SSID name) or None.
         """
+        interface = interface or self.interface
+        key = interface or "*"
+        cached = self._ssid_cache.get(key)
+        if cached and (cached[1] is None or cached[1] > time.monotonic()):
+            metrics.count("ssid_cache", result="hit")
+            return cached[0]
+        metrics.count("ssid_cache", result="miss")
+
+        try:
+            with metrics.span("ssid_lookup"):
+                if self.os_type == "Windows":
+                    ssid = self._get_ssid_windows()
+                elif self.os_type == "Darwin":  # macOS
+                    ssid = self._get_ssid_macos(interface)
+                elif self.os_type == "Linux":
+                    ssid = self._get_ssid_linux(interface)
+                else:
+                    ssid = None
+        except Exception as e:
+            log.error("Error getting SSID: %s", e)
+            return None
+
+        expires = None if self._events_active else time.monotonic() + SSID_CACHE_TTL
+        self._ssid_cache[key] = (ssid, expires)
+        return ssid
+
+    def get_gateway(self, interface=None):
+        """
+        The default gateway, as "IP/MAC" (or just "IP" if its MAC isn't in the ARP cache).
+        Identifies the physical network even when many sites share one SSID.
+        Returns NO_GATEWAY when there is no default route, None when unsupported.
+        Cached like the SSID.
+        """
+        interface = interface or self.interface
+        key = interface or "*"
+        cached = self._gateway_cache.get(key)
+        if cached and (cached[1] is None or cached[1] > time.monotonic()):
+            return cached[0]
+
+        try:
+            if self.os_type == "Linux":
+                gateway = self._get_gateway_linux(interface)
+            elif self.os_type == "Darwin":
+                gateway = self._get_gateway_macos(interface)
+            else:
+                gateway = None
+        except Exception as e:
+            log.error("Error getting gateway: %s", e)
+            return None
+
+        expires = None if self._events_active else time.monotonic() + SSID_CACHE_TTL
+        self._gateway_cache[key] = (gateway, expires)
+        return gateway
+
+    def get_captive_api(self, interface=None):
+        """
+        The Captive Portal API URI (RFC 8910) the network advertised in its
+        DHCP lease, or None. Cached like the SSID.
+        Linux: systemd-networkd / dhclient lease files, then NetworkManager (nmcli).
+        macOS: the DHCP packet of the interface (ipconfig).
+        """
+        if self.captive_api:
+            return self.captive_api
+        interface = interface or self.interface
+        key = interface or "*"
+        cached = self._api_cache.get(key)
+        if cached and (cached[1] is None or cached[1] > time.monotonic()):
+            return cached[0]
+
         try:
-            if self.os_type == "Windows":
-                return self._get_ssid_windows()
-            elif self.os_type == "Darwin":  # macOS
-                return self._get_ssid_macos()
-            elif self.os_type == "Linux":
-                return self._get_ssid_linux()
+            if self.os_type == "Linux":
+                uri = self._get_captive_api_linux(interface or self._default_interface_linux())
+            elif self.os_type == "Darwin":
+                uri = self._get_captive_api_macos(interface or "en0")
             else:
-                return None
+                uri = None
         except Exception as e:
-            print(f"Error getting SSID: {e}")
+            log.debug("No Captive Portal API URI: %s", e)
+            uri = None
+
+        expires = None if self._events_active else time.monotonic() + SSID_CACHE_TTL
+        self._api_cache[key] = (uri, expires)
+        return uri
+
+    def _get_captive_api_linux(self, interface):
+        if not interface:
             return None
+        # systemd-networkd: one KEY=value file per interface index
+        try:
+            with open(NETWORKD_LEASE.format(index=socket.if_nametoindex(interface)), "r") as f:
+                match = CAPTIVE_URI_RE.search(f.read())
+            if match:
+                return match.group(1)
+        except OSError:
+            pass
+
+        # dhclient: the LAST lease block of this interface is the current one
+        for pattern in DHCLIENT_LEASES:
+            for path in glob.glob(pattern):
+                try:
+                    with open(path, "r") as f:
+                        blocks = f.read().split("lease {")
+                except OSError:
+                    continue
+                for block in reversed(blocks):
+                    if f'interface "{interface}"' in block:
+                        match = CAPTIVE_URI_RE.search(block)
+                        if match:
+                            return match.group(1)
+                        break
+
+        # NetworkManager's own DHCP client
+        try:
+            process = subprocess.run(
+                ["nmcli", "-t", "-f", "DHCP4,DHCP6", "device", "show", interface],
+                capture_output=True, text=True
+            )
+        except FileNotFoundError:
+            return None
+        match = CAPTIVE_URI_RE.search(process.stdout)
+        return match.group(1) if match else None
+
+    def _get_captive_api_macos(self, interface):
+        process = subprocess.run(["/usr/sbin/ipconfig", "getoption", interface, "114"], capture_output=True, text=True)
+        uri = process.stdout.strip()
+        return uri if uri.startswith(("http://", "https://")) else None
+
+    def _default_interface_linux(self):
+        with open("/proc/net/route", "r") as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if fields[1] == "00000000" and int(fields[3], 16) & RTF_GATEWAY:
+                    return fields[0]
+        return None
+
+    def _get_gateway_linux(self, interface=None):
+        # Iface Destination Gateway Flags ... (addresses in little-endian hex)
+        with open("/proc/net/route", "r") as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if fields[1] != "00000000" or not int(fields[3], 16) & RTF_GATEWAY:
+                    continue
+                if interface and fields[0] != interface:
+                    continue
+                ip = socket.inet_ntoa(struct.pack("<I", int(fields[2], 16)))
+                return self._gateway_id(ip, self._get_mac_linux(ip))
+        return NO_GATEWAY
+
+    def _get_mac_linux(self, ip):
+        # IP address, HW type, Flags, HW address, Mask, Device
+        try:
+            with open("/proc/net/arp", "r") as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if fields[0] == ip and fields[3] != "00:00:00:00:00:00":
+                        return fields[3]
+        except OSError:
+            pass
+        return None
+
+    def _get_gateway_macos(self, interface=None):
+        command = ["/sbin/route", "-n", "get", "default"]
+        if interface:
+            command += ["-ifscope", interface]
+        process = subprocess.run(command, capture_output=True, text=True)
+        match = re.search(r'gateway:\s*(\S+)', process.stdout)
+        if not match:
+            return NO_GATEWAY
+        ip = match.group(1)
+        process = subprocess.run(["/usr/sbin/arp", "-n", ip], capture_output=True, text=True)
+        mac = re.search(r' at ([0-9a-f:]{11,17}) ', process.stdout)
+        return self._gateway_id(ip, mac.group(1) if mac else None)
+
+    @staticmethod
+    def _gateway_id(ip, mac):
+        return f"{ip}/{mac}" if mac else ip
 
     def _get_ssid_windows(self):
         # Uses 'netsh' to find the connected interface
@@ -40,44 +264,63 @@ class NetworkManager:
             return match.group(1).strip()
         return None
 
-    def _get_ssid_macos(self):
-        # Method 1: Modern 'networksetup' command (Works on all modern macOS)
+    def _get_ssid_macos(self, interface=None):
+        # Modern 'networksetup' command (Works on all modern macOS)
         # This is much more reliable than the private 'airport' framework path
-        try:
-            process = subprocess.run(
-                ["networksetup", "-getairportnetwork", "en0"],
-                capture_output=True, text=True
-            )
-            # Output format: "Current Wi-Fi Network: SSID_NAME"
-            if "Current Wi-Fi Network" in process.stdout:
-                ssid = process.stdout.split(": ")[1].strip()
-                return ssid
-        except Exception:
-            pass
+        # Ask every Wi-Fi device the system reports (not just en0/en1)
+        candidates = [interface] if interface else (self.get_wifi_interfaces() or ["en0", "en1"])
+        for device in candidates:
+            try:
+                process = subprocess.run(
+                    ["/usr/sbin/networksetup", "-getairportnetwork", device],
+                    capture_output=True, text=True
+                )
+                # Output format: "Current Wi-Fi Network: SSID_NAME"
+                if "Current Wi-Fi Network" in process.stdout:
+                    return process.stdout.split(": ", 1)[1].strip()
+            except Exception:
+                pass
+            
+        return None
+
+    def _get_ssid_linux(self, interface=None):
+        # Fast path: ask the kernel directly (no fork)
+        ssid = self._get_ssid_linux_native(interface)
+        if ssid:
+            return ssid
+        return self._get_ssid_linux_subprocess(interface)
+
+    def _get_ssid_linux_native(self, interface=None):
+        if self._nl80211 is None:
+            try:
+                self._nl80211 = Nl80211()
+            except OSError:
+                self._nl80211 = False
+        if not self._nl80211:
+            return None
 
-        # Method 2: Fallback to System Profiler (Slower but accurate)
         try:
-            process = subprocess.run(
-                ["/usr/sbin/networksetup", "-getairportnetwork", "en1"], # Try en1 just in case
-                capture_output=True, text=True
-            )
-            if "Current Wi-Fi Network" in process.stdout:
-                return process.stdout.split(": ")[1].strip()
-        except:
-            pass
-            
+            ssids = self._nl80211.get_ssids()
+        except OSError:
+            return None
+        if interface:
+            return ssids.get(interface)
+        for name in sorted(ssids):
+            if ssids[name]:
+                return ssids[name]
         return None
 
-    def _get_ssid_linux(self):
+    def _get_ssid_linux_subprocess(self, interface=None):
         try:
-            process = subprocess.run(["iwgetid", "-r"], capture_output=True, text=True)
-            return process.stdout.strip()
+            command = ["iwgetid", interface, "-r"] if interface else ["iwgetid", "-r"]
+            process = subprocess.run(command, capture_output=True, text=True)
+            return process.stdout.strip() or None
         except FileNotFoundError:
             try:
-                process = subprocess.run(
-                    ["nmcli", "-t", "-f", "active,ssid", "dev", "wifi"],
-                    capture_output=True, text=True
-                )
+                command = ["nmcli", "-t", "-f", "active,ssid", "dev", "wifi"]
+                if interface:
+                    command += ["list", "ifname", interface]
+                process = subprocess.run(command, capture_output=True, text=True)
                 match = re.search(r'^yes:(.*)$', process.stdout, re.MULTILINE)
                 if match:
                     return match.group(1).strip()
@@ -85,24 +328,47 @@ class NetworkManager:
                 pass
             return None
 
+    def watch_changes(self, callback):
+        """
+        Subscribes to interface / address / default-route changes.
+        Calls callback(reason) from a background thread on every change.
+        Returns: the running NetworkEventSource, or None (not supported -> keep polling).
+        """
+        if self.os_type != "Linux":
+            return None
+
+        def on_change(reason):
+            # The SSID may have changed with the link: forget cached lookups first
+            self.invalidate_ssid_cache()
+            callback(reason)
+
+        source = NetworkEventSource(on_change)
+        if source.start():
+            self._events_active = True
+            return source
+        return None
+
     def is_connected(self):
         """
         Checks for REAL internet access.
-        Returns True if we get a 204 (No Content) from Google.
-        Returns False if we get a 200 (Login Page) or error.
+        Returns True if any probe endpoint confirms we are online.
+        Returns False if we hit a Login Page or every probe failed.
         """
-        try:
-            # Short timeout to keep the UI responsive
-            response = requests.get("http://clients3.google.com/generate_204", timeout=3)
-            if response.status_code == 204:
-                return True
-            return False
-        except requests.RequestException:
-            return False
+        with metrics.span("verify"):
+            return self.prober.probe() == ONLINE
+
+    def confirm_online(self, deadline=BURST_DEADLINE):
+        """
+        Right after a login: True as soon as a quick probe gets through,
+        False if none does within `deadline` seconds (see ProbeEngine.confirm_online).
+        """
+        return self.prober.confirm_online(deadline)
 
 # --- TEST BLOCK ---
 if __name__ == "__main__":
     nm = NetworkManager()
     print(f"OS: {nm.os_type}")
     print(f"SSID: {nm.get_ssid()}")
+    print(f"Gateway: {nm.get_gateway()!r}")
+    print(f"Captive Portal API: {nm.get_captive_api()}")
     print(f"Online: {nm.is_connected()}")
\ No newline at end of file
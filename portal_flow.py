@@ -0,0 +1,232 @@
+"""
+Multi-step captive portal flows.
+
+A login is walked as a short chain of portal pages instead of one form:
+
+  redirect      JS window.location / <meta http-equiv="refresh"> hop
+  terms         accept-terms / "continue" page: its form is submitted as is
+                (checkboxes ticked, hidden fields and the button sent back)
+  credentials   the login form, handed back to the solver to fill in
+  confirmation  what the portal shows after the login POST: more redirects
+                and "continue" pages, followed only on the portal's own hosts
+
+Every request goes through the solver's session, so all steps reuse its
+pooled keep-alive connections and its cookie jar. A flow never sends the
+same request twice (a redirect cycle stops at once), makes at most
+MAX_HOPS requests and gives up when its time budget is spent; the timeout
+of each request is cut down to what is left of that budget.
+"""
+import time
+import logging
+from urllib.parse import urljoin, urlparse
+from form_parser import extract_forms
+from field_classifier import find_click_through
+from fingerprint_cache import NO_FORM, CLICK_THROUGH
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+MAX_HOPS = 6      # Requests per flow (the page it starts from is free)
+FLOW_BUDGET = 20  # Seconds per flow, every hop included
+
+# The flow accepted a terms page and then found nothing left to fill in
+TERMS_ACCEPTED = "TERMS_ACCEPTED"
+
+# Inputs a browser sends when the form's (first) submit button is clicked
+SUBMIT_TYPES = ("submit", "image")
+
+
+class PortalFlow:
+    """
+    One bounded walk through a portal (see the module docstring).
+    find_login_form() is used before the login, confirm() after it;
+    each call gets its own PortalFlow (own hop count, budget and history).
+    With learn=False, a login form found on the way is not cached as a recipe.
+    """
+    def __init__(self, solver, timeout, budget=FLOW_BUDGET, max_hops=MAX_HOPS, learn=True):
+        self.solver = solver
+        self.learn = learn
+        self.timeout = timeout
+        self.deadline = time.monotonic() + budget
+        self.max_hops = max_hops
+        self.hops = 0
+        self.visited = set()     # (method, url, payload) already requested
+        self.steps = []          # (kind, url) in the order they were taken
+        self.outcome = None      # Why no login form was found: NO_FORM, CLICK_THROUGH, TERMS_ACCEPTED
+        self.stopped = None      # "loop", "hops", "budget" or "error" if a hop was refused / failed
+
+    # --- walks ---
+    def find_login_form(self, response):
+        """
+        Follows redirects and accepts terms pages until a login form shows up.
+        Returns its form_details, or None (self.outcome then says why, if it
+        is worth remembering; a timeout or network error leaves it None).
+        """
+        page = response
+        self._seen(page)
+        stale = False  # A cached recipe did not match its portal's page
+        while page is not None:
+            # One streamed pass per page: a known portal's recipe is matched against the same forms
+            parser = extract_forms(page)
+            forms = parser.forms
+            form_details, mismatch = self._cached_form(page, forms)
+            if form_details:
+                metrics.count("recipe_cache", result="hit")
+                return form_details
+            stale = stale or mismatch
+
+            if forms:
+                log.info(">> Found %d forms on the page.", len(forms))
+                form_details = self.solver.pick_best_form(forms, page.url)
+                if form_details:
+                    self.steps.append(("credentials", page.url))
+                    metrics.count("recipe_cache", result="stale" if stale else "miss")
+                    if self.learn:
+                        if stale:
+                            log.info(">> Cached login recipe no longer matches. Re-learned it.")
+                        self.solver.learn_recipe(form_details)
+                    return form_details
+
+                terms = find_click_through(forms)
+                if terms:
+                    log.info(">> Terms page. Accepting...")
+                    page = self._submit(terms, page.url, "terms", stream=True)
+                    continue
+
+            if parser.redirect:
+                log.info(">> Redirect Detected! Following to: %s", parser.redirect)
+                page = self._request("redirect", "GET", urljoin(page.url, parser.redirect), stream=True)
+                continue
+
+            accepted = any(kind == "terms" for kind, _ in self.steps)
+            self.outcome = TERMS_ACCEPTED if accepted else NO_FORM
+            log.info(">> No login form (%s).", "terms accepted, nothing else to fill in" if accepted else "nothing to fill in")
+            return None
+
+        # A hop was refused or failed. Loops and endless chains won't fix themselves.
+        if self.stopped in ("loop", "hops"):
+            on_terms = self.steps and self.steps[-1][0] == "terms"
+            self.outcome = CLICK_THROUGH if on_terms else NO_FORM
+        return None
+
+    def confirm(self, response):
+        """
+        Follows the pages the portal shows after the login POST (redirects,
+        "continue" forms) as long as they stay on the portal's hosts.
+        Returns the last page reached (the login response itself if there is nothing to follow).
+        """
+        hosts = {urlparse(hop.url).netloc for hop in response.history + [response]}
+        page = response
+        self._seen(page)
+        while True:
+            parser = extract_forms(page)
+            terms = find_click_through(parser.forms) if parser.forms else None
+            if terms:
+                target = urljoin(page.url, terms["attrs"].get("action", ""))
+            elif parser.redirect:
+                target = urljoin(page.url, parser.redirect)
+            else:
+                return page
+            if urlparse(target).netloc not in hosts:
+                log.debug("Not following %s off the portal.", target)
+                return page
+            if target == page.url and not terms:
+                return page  # Status page refreshing itself
+
+            if terms:
+                log.info(">> Confirmation page. Continuing...")
+                next_page = self._submit(terms, page.url, "confirmation")
+            else:
+                next_page = self._request("confirmation", "GET", target)
+            if next_page is None:
+                return page
+            page = next_page
+
+    # --- steps ---
+    def _cached_form(self, page, forms):
+        """(form_details, False) from the portal's cached recipe; (None, True) if it no longer matches."""
+        recipes = self.solver.recipes
+        if recipes is None:
+            return None, False
+        portal_id = self.solver.get_portal_identifier(page.url)
+        recipe = recipes.get(portal_id)
+        if not recipe:
+            return None, False
+        form_details = self.solver.apply_recipe(recipe, page, forms)
+        if form_details:
+            log.info(">> Known portal (%s). Using cached login recipe.", portal_id)
+            return form_details, False
+        # Not necessarily stale: may be a redirect or terms page in front of the form
+        return None, True
+
+    def _submit(self, form, base_url, kind, stream=False):
+        """Submits a form the way a browser does when its first submit button is clicked."""
+        action = urljoin(base_url, form["attrs"].get("action", ""))
+        method = (form["attrs"].get("method") or "GET").upper()  # HTML default
+        payload = {}
+        clicked = False
+        for inp in form["inputs"]:
+            name = inp.get("name")
+            if not name:
+                continue
+            inp_type = inp.get("type", "text").lower()
+            if inp_type == "checkbox":
+                payload[name] = inp.get("value") or "on"
+            elif inp_type in SUBMIT_TYPES:
+                if not clicked:
+                    payload[name] = inp.get("value", "")
+                    clicked = True
+            elif inp_type == "hidden":
+                payload[name] = inp.get("value", "")
+        return self._request(kind, method, action, payload, referer=base_url, stream=stream)
+
+    def _request(self, kind, method, url, data=None, referer=None, stream=False):
+        """
+        One hop through the solver's session, within the flow's limits.
+        Returns the response, or None if the hop was refused or failed (see self.stopped).
+        """
+        key = (method, url, tuple(sorted(data.items())) if data else None)
+        if key in self.visited:
+            log.warning(">> Portal flow loops back to %s. Stopping.", url)
+            self.stopped = "loop"
+            return None
+        if self.hops >= self.max_hops:
+            log.warning(">> Portal flow still not done after %d steps. Stopping.", self.hops)
+            self.stopped = "hops"
+            return None
+        timeout = self._timeout()
+        if timeout is None:
+            log.warning(">> Portal flow ran out of time. Stopping.")
+            self.stopped = "budget"
+            return None
+
+        self.visited.add(key)
+        self.hops += 1
+        self.steps.append((kind, url))
+        metrics.count("flow_steps", kind=kind)
+        headers = {"Referer": referer} if referer else None
+        try:
+            if method == "POST":
+                response = self.solver.session.post(url, data=data, headers=headers, timeout=timeout, stream=stream)
+            else:
+                response = self.solver.session.get(url, params=data, headers=headers, timeout=timeout, stream=stream)
+        except Exception as e:
+            log.warning(">> Portal step failed (%s %s): %s", kind, url, e)
+            self.stopped = "error"
+            return None
+        self._seen(response)
+        return response
+
+    def _seen(self, response):
+        """HTTP redirects land on pages too: a later JS hop back to them is a loop."""
+        for hop in response.history + [response]:
+            self.visited.add(("GET", hop.url, None))
+
+    def _timeout(self):
+        """The request timeout, cut down to what is left of the budget (None = spent)."""
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        if isinstance(self.timeout, tuple):
+            return tuple(min(part, remaining) for part in self.timeout)
+        return min(self.timeout, remaining)
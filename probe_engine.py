@@ -0,0 +1,214 @@
+import logging
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+ONLINE = "ONLINE"
+
+# Endpoints raced in parallel on every probe.
+# - "expect_status": the endpoint answers with exactly this code when the internet works.
+# - "expect_text": the page contains this marker when the internet works.
+# Anything else that comes back (redirect, login page, wrong code) means a Captive Portal.
+DEFAULT_ENDPOINTS = [
+    {"url": "http://clients3.google.com/generate_204", "expect_status": 204, "timeout": 3},
+    {"url": "http://neverssl.com", "expect_text": "NeverSSL", "timeout": 10},
+    {"url": "http://1.1.1.1", "expect_text": "Cloudflare", "timeout": 5},
+]
+
+# Post-login confirmation burst (see confirm_online)
+BURST_TIMEOUT = 1.0        # Per probe: an open firewall answers within one RTT
+BURST_INTERVAL = 0.1       # First pause between rounds, doubled up to BURST_INTERVAL_MAX
+BURST_INTERVAL_MAX = 1.0
+BURST_DEADLINE = 6         # Give up after this long (seconds)
+
+# Body bytes a text probe searches for its marker (the real pages carry it near the top).
+# A portal page is not read any further: it is handed on with what was read (see _PeekedBody).
+TEXT_PROBE_BYTES = 16384
+
+
+class _PeekedBody:
+    """A streamed response body whose first bytes were already read: gives those back first."""
+    def __init__(self, head, raw):
+        self.head = head
+        self.raw = raw
+
+    def read(self, amt=None, decode_content=True, **kwargs):
+        if not self.head:
+            return self.raw.read(amt, decode_content=True)
+        if amt is None:
+            data, self.head = self.head + self.raw.read(decode_content=True), b""
+        else:
+            data, self.head = self.head[:amt], self.head[amt:]
+        return data
+
+    def close(self):
+        self.raw.close()
+
+    def release_conn(self):
+        self.raw.release_conn()
+
+
+class ProbeEngine:
+    def __init__(self, endpoints=None, headers=None, max_workers=None, session=None):
+        self.endpoints = endpoints or DEFAULT_ENDPOINTS
+        # Cookie-less session, normally from the shared Transport (pooled keep-alive sockets)
+        self.session = session or requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        # One small pool for the lifetime of the engine (no thread per probe)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or len(self.endpoints),
+            thread_name_prefix="probe"
+        )
+        # Probes not finished yet, losers of earlier races included (see drain)
+        self._inflight = set()
+
+    def _check_endpoint(self, endpoint, timeout=None):
+        """
+        Runs a single probe (`timeout` overrides the endpoint's own).
+        Returns: "ONLINE", response object (portal) or None (no answer).
+        """
+        # A portal page is left (mostly) unread on the socket, so the solver can
+        # stream it straight into the form parser.
+        try:
+            response = self.session.get(
+                endpoint["url"], timeout=timeout or endpoint.get("timeout", 5),
+                allow_redirects=True, stream=True
+            )
+            if "expect_status" in endpoint:
+                # A 204 page cannot have been rewritten by a portal
+                if response.status_code == endpoint["expect_status"] and not response.history:
+                    response.close()
+                    return ONLINE
+                return response
+
+            if response._content_consumed:  # Already read in full (capturing, see capture.py)
+                head = response.content[:TEXT_PROBE_BYTES]
+            else:
+                head = response.raw.read(TEXT_PROBE_BYTES, decode_content=True)
+                response.raw = _PeekedBody(head, response.raw)
+        except requests.RequestException:
+            return None
+
+        if endpoint["expect_text"] in head.decode(response.encoding or "utf-8", errors="replace"):
+            response.close()
+            return ONLINE
+        return response
+
+    def probe(self, timeout=None):
+        """
+        Races every endpoint and returns the first decisive answer,
+        within `timeout` seconds if given (else the endpoints' own timeouts).
+        Returns:
+        - "ONLINE" string (if internet is working)
+        - response object (if trapped in portal)
+        - None (if every endpoint failed / network is down)
+        """
+        with metrics.span("probe"):
+            result = self._race(timeout)
+        outcome = "online" if result == ONLINE else "portal" if result is not None else "down"
+        metrics.count("probes", outcome=outcome)
+        log.debug("Probe: %s", outcome)
+        return result
+
+    def _race(self, timeout=None):
+        if timeout is None:
+            futures = [self._submit(ep) for ep in self.endpoints]
+            deadline = time.monotonic() + max(ep.get("timeout", 5) for ep in self.endpoints) + 1
+        else:
+            futures = [self._submit(ep, min(ep.get("timeout", 5), timeout)) for ep in self.endpoints]
+            deadline = time.monotonic() + timeout
+        pending = set(futures)
+        result = None
+
+        while pending and result is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome = future.result()
+                if outcome is not None:
+                    result = outcome
+                    break
+
+        # Cancel the losers. Probes still in flight can't be interrupted,
+        # but their responses are dropped as soon as they finish.
+        for future in pending:
+            if not future.cancel():
+                future.add_done_callback(self._discard)
+        return result
+
+    def confirm_online(self, deadline=BURST_DEADLINE, timeout=BURST_TIMEOUT, interval=BURST_INTERVAL):
+        """
+        Right after a login: fires the status-only probes (e.g. generate_204)
+        in quick rounds with a tight timeout, so the first 204 the firewall
+        lets through is seen within about one round trip.
+        Returns True on the first ONLINE answer, False once `deadline` seconds pass.
+        """
+        endpoints = [ep for ep in self.endpoints if "expect_status" in ep] or self.endpoints
+        stop_at = time.monotonic() + deadline
+        rounds = 0
+        online = False
+        with metrics.span("verify"):
+            while True:
+                remaining = stop_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                rounds += 1
+                futures = [
+                    self._submit(ep, min(timeout, remaining)) for ep in endpoints
+                ]
+                for future in as_completed(futures):
+                    outcome = future.result()
+                    if outcome == ONLINE:
+                        online = True
+                        break
+                    if isinstance(outcome, requests.Response):
+                        outcome.close()  # Still the portal
+                if online:
+                    for future in futures:
+                        future.add_done_callback(self._discard)  # Portal pages of the others, if any
+                    break
+                time.sleep(max(0, min(interval, stop_at - time.monotonic())))
+                interval = min(interval * 2, BURST_INTERVAL_MAX)
+
+        metrics.count("verify_rounds", rounds)
+        log.debug("Post-login check: %s after %d round(s)", "online" if online else "not online", rounds)
+        return online
+
+    def _submit(self, endpoint, timeout=None):
+        future = self.executor.submit(self._check_endpoint, endpoint, timeout)
+        self._inflight.add(future)
+        future.add_done_callback(self._inflight.discard)
+        return future
+
+    def drain(self, timeout=None):
+        """Waits until no probe is in flight (a race's losers keep running after it returns)."""
+        wait(list(self._inflight), timeout=timeout)
+
+    @staticmethod
+    def _discard(future):
+        outcome = future.result()
+        if isinstance(outcome, requests.Response):
+            outcome.close()
+
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+
+# --- TEST BLOCK ---
+if __name__ == "__main__":
+    engine = ProbeEngine()
+    start = time.monotonic()
+    result = engine.probe()
+    elapsed = time.monotonic() - start
+    if result == ONLINE:
+        print(f"Online ({elapsed:.2f}s)")
+    elif result is not None:
+        print(f"Portal detected at {result.url} ({elapsed:.2f}s)")
+    else:
+        print(f"Network down ({elapsed:.2f}s)")
@@ -0,0 +1,279 @@
+"""
+Bulk credential provisioning: import / export whole profile sets,
+so a fleet of machines can be pre-seeded without anyone logging in by hand.
+
+Formats (picked from the file extension unless given):
+  csv    header ssid,portal,username,secret,recipe   (recipe = JSON text, optional:
+         id, action, method, fields, tokens as compile_recipe writes them)
+  jsonl  one JSON object per line with the same keys (recipe as an object)
+
+`secret` is one of:
+  env:NAME / file:PATH   kept as a reference, resolved when the agent logs in
+  plain:PASSWORD         stored like a password typed in the window
+
+Import is a single streaming pass inside a single transaction: every row is
+validated, rows are written in batches, and a later row for the same SSID
+replaces an earlier one. Memory use does not grow with the file.
+"""
+import io
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import functools
+import contextlib
+from urllib.parse import urlparse
+from storage import RECIPE_VERSION, SECRET_SCHEMES
+
+log = logging.getLogger(__name__)
+
+FIELDS = ["ssid", "portal", "username", "secret", "recipe"]
+FORMATS = ("csv", "jsonl")
+
+BATCH_SIZE = 2000          # Rows per executemany() call
+MAX_SSID_BYTES = 32        # 802.11 limit
+MAX_REPORTED_ERRORS = 20   # Invalid rows listed in the result (all are counted)
+
+
+class ProfileError(ValueError):
+    pass
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise ProfileError(f"Cannot tell the format of '{path}' (use .csv / .jsonl or --format).")
+
+
+@contextlib.contextmanager
+def _open(path, mode):
+    """A text stream for `path` ('-' = stdin/stdout, an open stream is used as is)."""
+    if not isinstance(path, str):
+        yield path
+        return
+    if path == "-":
+        yield sys.stdin if mode == "r" else sys.stdout
+        return
+    with open(path, mode, newline="", encoding="utf-8") as f:
+        yield f
+
+
+def read_profiles(stream, fmt):
+    """Yields (line number, raw record) without validating anything."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        missing = {"ssid", "username", "secret"} - set(reader.fieldnames or ())
+        if missing:
+            raise ProfileError(f"CSV header lacks {', '.join(sorted(missing))}.")
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                yield number, line
+
+
+@functools.lru_cache(maxsize=4096)  # A fleet has far fewer portals than profiles
+def normalize_portal(portal):
+    """'http://172.16.0.1:1000/login?x' -> 'http://172.16.0.1:1000' (the portal_id form)."""
+    parsed = urlparse(portal.strip())
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        raise ProfileError(f"portal must be an http(s) URL, got '{portal}'")
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+def validate_recipe(recipe):
+    """
+    Checks a recipe has everything UniversalSolver.apply_recipe reads
+    (the shape compile_recipe produces). Raises ProfileError.
+    """
+    if not isinstance(recipe, dict):
+        raise ProfileError("recipe must be a JSON object")
+    missing = {"id", "action", "method", "fields", "tokens"} - recipe.keys()
+    if missing:
+        raise ProfileError(f"recipe lacks {', '.join(sorted(missing))}")
+    if isinstance(recipe["id"], bool) or not isinstance(recipe["id"], (int, str)):
+        raise ProfileError("recipe id must be a number or a string")
+    if not isinstance(recipe["action"], str) or urlparse(recipe["action"]).scheme not in ("http", "https"):
+        raise ProfileError("recipe action must be an http(s) URL")
+    if not isinstance(recipe["method"], str) or recipe["method"].upper() not in ("GET", "POST"):
+        raise ProfileError("recipe method must be GET or POST")
+    if not isinstance(recipe["fields"], list) or not all(
+        isinstance(f, dict) and all(isinstance(f.get(key), str) and f[key] for key in ("name", "type", "role"))
+        for f in recipe["fields"]
+    ):
+        raise ProfileError("every recipe field needs a name, a type and a role")
+    if not isinstance(recipe["tokens"], list) or not all(isinstance(t, str) for t in recipe["tokens"]):
+        raise ProfileError("recipe tokens must be a list of field names")
+
+
+def validate_profile(record):
+    """
+    Raw CSV row / JSON line -> normalized profile dict.
+    Raises ProfileError with a human readable reason.
+    """
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError as e:
+            raise ProfileError(f"invalid JSON ({e.msg})")
+        if not isinstance(record, dict):
+            raise ProfileError("expected a JSON object")
+
+    ssid = record.get("ssid") or ""
+    username = record.get("username") or ""
+    secret = record.get("secret") or ""
+    portal = record.get("portal") or ""
+    recipe = record.get("recipe") or None
+
+    if not isinstance(ssid, str) or not ssid:
+        raise ProfileError("ssid is required")
+    if len(ssid.encode("utf-8")) > MAX_SSID_BYTES:
+        raise ProfileError(f"ssid longer than {MAX_SSID_BYTES} bytes")
+    if not isinstance(username, str) or not username:
+        raise ProfileError("username is required")
+
+    scheme, _, value = str(secret).partition(":")
+    if scheme == "plain" and value:
+        password, secret = value, None
+    elif scheme in SECRET_SCHEMES and value:
+        password = ""
+    else:
+        raise ProfileError("secret must be env:NAME, file:PATH or plain:PASSWORD")
+
+    portal_id = normalize_portal(portal) if portal else None
+
+    if recipe is not None:
+        if isinstance(recipe, str):
+            try:
+                recipe = json.loads(recipe)
+            except ValueError as e:
+                raise ProfileError(f"recipe is not valid JSON ({e.msg})")
+        if not portal_id:
+            raise ProfileError("a recipe needs a portal")
+        validate_recipe(recipe)
+
+    return {
+        "ssid": ssid,
+        "portal_id": portal_id,
+        "username": username,
+        "password": password,
+        "secret": secret,
+        "recipe": recipe,
+    }
+
+
+def import_profiles(store, path, fmt=None, strict=False):
+    """
+    Loads a profile file into `store` in one transaction.
+    Invalid rows are skipped and reported; with strict=True the first one
+    aborts the import and nothing is written.
+    Returns {"read", "imported", "recipes", "invalid", "errors": [(line, reason), ...]}.
+    """
+    fmt = fmt or detect_format(path)
+    result = {"read": 0, "imported": 0, "recipes": 0, "invalid": 0, "errors": []}
+    credentials, recipes = [], []
+    now = time.time()
+
+    def flush(conn):
+        conn.executemany(
+            "INSERT INTO credentials (ssid, username, password, portal_id, updated_at, secret) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(ssid) DO UPDATE SET "
+            "username = excluded.username, password = excluded.password, portal_id = excluded.portal_id, "
+            "updated_at = excluded.updated_at, secret = excluded.secret",
+            credentials
+        )
+        conn.executemany(
+            "INSERT INTO recipes (portal_id, version, recipe, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(portal_id) DO UPDATE SET "
+            "version = excluded.version, recipe = excluded.recipe, updated_at = excluded.updated_at",
+            recipes
+        )
+        result["imported"] += len(credentials)
+        result["recipes"] += len(recipes)
+        credentials.clear()
+        recipes.clear()
+
+    with _open(path, "r") as stream, store.transaction() as conn:
+        for line, record in read_profiles(stream, fmt):
+            result["read"] += 1
+            try:
+                profile = validate_profile(record)
+            except ProfileError as e:
+                if strict:
+                    raise ProfileError(f"line {line}: {e}")
+                result["invalid"] += 1
+                if len(result["errors"]) < MAX_REPORTED_ERRORS:
+                    result["errors"].append((line, str(e)))
+                continue
+
+            credentials.append((
+                profile["ssid"], profile["username"], profile["password"],
+                profile["portal_id"], now, profile["secret"]
+            ))
+            if profile["recipe"]:
+                recipes.append((profile["portal_id"], RECIPE_VERSION, json.dumps(profile["recipe"]), now))
+            if len(credentials) >= BATCH_SIZE:
+                flush(conn)
+        flush(conn)
+
+    log.info(">> Imported %d profiles (%d recipes), %d invalid rows skipped.",
+             result["imported"], result["recipes"], result["invalid"])
+    return result
+
+
+def export_profiles(store, path, fmt=None, include_passwords=False):
+    """
+    Writes every saved network to `path` in the import format.
+    Referenced secrets are exported as references; typed-in passwords only
+    with include_passwords=True (as plain:...), otherwise the secret is left empty.
+    Returns the number of profiles written.
+    """
+    fmt = fmt or detect_format(path)
+    written = 0
+    with _open(path, "w") as stream, store._lock:
+        writer = csv.DictWriter(stream, FIELDS) if fmt == "csv" else None
+        if writer:
+            writer.writeheader()
+
+        rows = store.conn.execute(
+            "SELECT c.ssid, c.portal_id, c.username, c.password, c.secret, r.recipe "
+            "FROM credentials c LEFT JOIN recipes r ON r.portal_id = c.portal_id AND r.version = ? "
+            "ORDER BY c.ssid", (RECIPE_VERSION,)
+        )
+        for ssid, portal_id, username, password, secret, recipe in rows:
+            if not secret:
+                secret = f"plain:{password}" if include_passwords else ""
+            if writer:
+                writer.writerow({
+                    "ssid": ssid, "portal": portal_id or "", "username": username,
+                    "secret": secret, "recipe": recipe or ""
+                })
+            else:
+                stream.write(json.dumps({
+                    "ssid": ssid, "portal": portal_id, "username": username,
+                    "secret": secret, "recipe": json.loads(recipe) if recipe else None
+                }) + "\n")
+            written += 1
+    return written
+
+
+# --- TEST BLOCK ---
+if __name__ == "__main__":
+    from storage import StorageManager
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    store = StorageManager(":memory:")
+    sample = io.StringIO(
+        "ssid,portal,username,secret,recipe\n"
+        "Hostel_WiFi,http://172.16.0.1:1000/login,student,env:HOSTEL_PASSWORD,\n"
+        "Library,,reader,plain:books,\n"
+        ",,nobody,plain:x,\n"
+    )
+    print(import_profiles(store, sample, fmt="csv"))
+    export_profiles(store, sys.stdout, fmt="jsonl")
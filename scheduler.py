@@ -0,0 +1,166 @@
+import logging
+import queue
+import random
+import threading
+import time
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+
+class AgentState:
+    ONLINE = "ONLINE"                # Internet works, slow re-check
+    PROBING = "PROBING"              # A check is running right now
+    PORTAL_KNOWN = "PORTAL_KNOWN"    # Portal with saved creds, login just sent -> confirm soon
+    AWAITING_USER = "AWAITING_USER"  # Unknown portal, waiting for the user to type credentials
+    BACKOFF = "BACKOFF"              # No network / login failed -> retry with growing delay
+
+
+# Re-check timings (seconds)
+ONLINE_INTERVAL = 10
+CONFIRM_INTERVAL = 3
+BACKOFF_BASE = 5
+BACKOFF_MAX = 300
+
+
+class MonitorScheduler:
+    """
+    One long-lived worker thread that runs every network check in sequence,
+    so checks never overlap and the shared solver session is only used here.
+
+    - tick() runs one check and returns the next AgentState.
+    - wake() forces an immediate re-check (e.g. network changed).
+    - run_job(fn) runs fn on the worker between checks (e.g. a user-started login),
+      so it never races a probe for the solver session.
+    - post_ui(fn) hands work to the Tk thread; the UI drains `ui_queue`.
+    - wake_at(t), called from tick(), brings the next check forward to time t
+      (e.g. shortly before a portal session runs out).
+    - defer(seconds), called from tick(), holds the next BACKOFF check back
+      at least that long (e.g. a portal page already known to be unsolvable).
+      wake() still re-checks right away.
+    - on_state(state), if set, hears every change of the settled state
+      (what tick() returned, or PROBING after resume()); PROBING during a
+      routine check is not reported.
+    """
+    def __init__(self, tick, online_interval=ONLINE_INTERVAL, ui_queue=None, on_state=None):
+        self.tick = tick
+        self.on_state = on_state
+        self._reported = None
+        self.online_interval = online_interval
+        self.state = AgentState.PROBING
+        self.failures = 0
+        self.due_at = None
+        self.not_before = None
+        # May be shared by several schedulers that feed the same UI
+        self.ui_queue = ui_queue or queue.Queue()
+        self.jobs = queue.Queue()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="monitor")
+
+    def start(self, delay=0):
+        self._first_delay = delay
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        """Re-check now. Ignored while the user is being asked for credentials."""
+        if self.state != AgentState.AWAITING_USER:
+            self._wake.set()
+
+    def resume(self):
+        """Leaves AWAITING_USER (user logged in or dismissed the prompt) and re-checks."""
+        self.state = AgentState.PROBING
+        self.failures = 0
+        self._report(AgentState.PROBING)
+        self._wake.set()
+
+    def run_job(self, func, *args):
+        """Queues func(*args) on the worker thread, even while AWAITING_USER."""
+        self.jobs.put((func, args))
+        self._wake.set()
+
+    def wake_at(self, timestamp):
+        """Next check no later than `timestamp` (time.time()). Only valid for the current tick."""
+        if self.due_at is None or timestamp < self.due_at:
+            self.due_at = timestamp
+
+    def defer(self, seconds):
+        """Next BACKOFF check no earlier than `seconds` from now. Only valid for the current tick."""
+        self.not_before = max(self.not_before or 0, time.time() + seconds)
+
+    def post_ui(self, func, *args):
+        self.ui_queue.put((func, args))
+
+    def next_delay(self):
+        """Seconds until the next check for the current state (None = wait for resume())."""
+        if self.state == AgentState.ONLINE:
+            if self.due_at is not None:
+                return max(0, min(self.online_interval, self.due_at - time.time()))
+            return self.online_interval
+        if self.state == AgentState.PORTAL_KNOWN:
+            return CONFIRM_INTERVAL
+        if self.state == AgentState.AWAITING_USER:
+            return None
+        # BACKOFF: exponential with jitter so a fleet behind one portal doesn't retry in lockstep
+        ceiling = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** max(self.failures - 1, 0)))
+        delay = random.uniform(ceiling / 2, ceiling)
+        if self.not_before is not None:
+            delay = max(delay, self.not_before - time.time())
+        return delay
+
+    def _report(self, state):
+        if self.on_state is None or state == self._reported:
+            return
+        self._reported = state
+        try:
+            self.on_state(state)
+        except Exception as e:
+            log.exception("Error in state listener: %s", e)
+
+    def _run_jobs(self):
+        while True:
+            try:
+                func, args = self.jobs.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                func(*args)
+            except Exception as e:
+                log.exception("Error in background job: %s", e)
+
+    def _run(self):
+        self._wake.wait(self._first_delay)
+        while not self._stop.is_set():
+            self._wake.clear()
+            self._run_jobs()
+
+            # Woken up only to run a job: keep waiting for the user
+            if self.state == AgentState.AWAITING_USER:
+                self._wake.wait()
+                continue
+
+            self.state = AgentState.PROBING
+            self.due_at = None
+            self.not_before = None
+            try:
+                new_state = self.tick()
+            except Exception as e:
+                log.exception("Error in background: %s", e)
+                new_state = AgentState.BACKOFF
+
+            self.state = new_state
+            self._report(new_state)
+            if new_state == AgentState.BACKOFF:
+                self.failures += 1
+                metrics.count("retries")
+            elif new_state == AgentState.ONLINE:
+                self.failures = 0
+
+            delay = self.next_delay()
+            if new_state == AgentState.BACKOFF:
+                log.info(">> [%s] Backing off: next check in %.0fs", time.strftime('%H:%M:%S'), delay)
+            self._wake.wait(delay)
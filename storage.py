@@ -1,51 +1,358 @@
+import logging
 import json
 import os
+import time
+import sqlite3
+import threading
+import contextlib
+
+log = logging.getLogger(__name__)
 
 # CONSTANTS
-DB_FILE = "wifi_map.json"
+DB_FILE = "wifi_map.db"
 
-class StorageManager:
-    def __init__(self):
-        self.db = self._load_db()
+# Older releases kept everything in flat JSON files; they are imported once, automatically
+LEGACY_DB_FILE = "wifi_map.json"
+LEGACY_RECIPE_FILE = "login_recipes.json"
 
-    def _load_db(self):
-        """Loads the JSON database."""
-        if not os.path.exists(DB_FILE):
-            return {}
-        try:
-            with open(DB_FILE, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading DB: {e}")
-            return {}
-
-    def _save_db(self):
-        """Saves the JSON database to disk."""
+# Bump this whenever the recipe layout (or the analyzer that builds it) changes.
+# Recipes written by an older version are dropped and rebuilt on next login.
+RECIPE_VERSION = 2
+
+# Session lifetime learning (see SessionLog)
+SESSION_SAMPLES = 5         # Recent expiries the estimate is based on
+MIN_SESSION_LIFETIME = 60   # Shorter "sessions" are network flaps, not portal timeouts
+
+# Portal cookies are kept at most this long when nothing tells us sooner (seconds)
+COOKIE_MAX_AGE = 12 * 3600
+
+# Provisioned credentials may reference their password instead of storing it:
+#   env:NAME    environment variable NAME of the agent process
+#   file:PATH   first line of the file at PATH (e.g. a mounted secret)
+SECRET_SCHEMES = ("env", "file")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS credentials (
+    ssid       TEXT PRIMARY KEY,
+    username   TEXT NOT NULL,
+    password   TEXT NOT NULL,
+    portal_id  TEXT,
+    updated_at REAL,
+    secret     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_credentials_portal ON credentials(portal_id);
+
+CREATE TABLE IF NOT EXISTS recipes (
+    portal_id  TEXT PRIMARY KEY,
+    version    INTEGER NOT NULL,
+    recipe     TEXT NOT NULL,
+    updated_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    id         INTEGER PRIMARY KEY,
+    portal_id  TEXT NOT NULL,
+    login_at   REAL NOT NULL,
+    expired_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_portal ON sessions(portal_id, login_at);
+
+CREATE TABLE IF NOT EXISTS cookies (
+    portal_id     TEXT PRIMARY KEY,
+    cookies       TEXT NOT NULL,
+    keepalive_url TEXT,
+    saved_at      REAL NOT NULL,
+    expires_at    REAL NOT NULL
+);
+"""
+
+
+def resolve_secret(reference):
+    """Password behind an env:/file: reference. Raises ValueError if it can't be read."""
+    scheme, _, target = reference.partition(":")
+    if scheme == "env":
+        value = os.environ.get(target)
+        if value is None:
+            raise ValueError(f"environment variable {target} is not set")
+        return value
+    if scheme == "file":
         try:
-            with open(DB_FILE, 'w') as f:
-                json.dump(self.db, f, indent=4)
-        except Exception as e:
-            print(f"Error saving DB: {e}")
+            with open(target, 'r') as f:
+                return f.readline().rstrip("\r\n")
+        except OSError as e:
+            raise ValueError(f"cannot read {target}: {e.strerror}")
+    raise ValueError(f"unknown secret scheme '{scheme}'")
+
+
+class RecipeCache:
+    """
+    Remembers the login form layout of every portal we have seen,
+    keyed by portal host (see UniversalSolver.get_portal_identifier).
+    Lets the solver skip the full HTML analysis on known portals.
+    Stored in the 'recipes' table of the StorageManager database.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, portal_id):
+        row = self.store._query_one(
+            "SELECT recipe FROM recipes WHERE portal_id = ? AND version = ?",
+            (portal_id, RECIPE_VERSION)
+        )
+        return json.loads(row[0]) if row else None
+
+    def put(self, portal_id, recipe):
+        if self.get(portal_id) == recipe:
+            return
+        self.store._execute(
+            "INSERT INTO recipes (portal_id, version, recipe, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(portal_id) DO UPDATE SET "
+            "version = excluded.version, recipe = excluded.recipe, updated_at = excluded.updated_at",
+            (portal_id, RECIPE_VERSION, json.dumps(recipe), time.time())
+        )
+
+    def invalidate(self, portal_id):
+        """Forgets a portal (its page changed or the login failed)."""
+        if self.store._execute("DELETE FROM recipes WHERE portal_id = ?", (portal_id,)).rowcount:
+            log.info(">> Login recipe for %s invalidated.", portal_id)
+
+    def clear(self):
+        self.store._execute("DELETE FROM recipes")
+
+
+class SessionLog:
+    """
+    Login and expiry timestamps per portal, used to learn how long a
+    portal keeps a session open (fixed session length or idle timeout).
+    A session is "open" from a successful login until the portal shows up
+    again (expired) or the network changes under it (discarded, not a sample).
+    Stored in the 'sessions' table of the StorageManager database.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def record_login(self, portal_id, at=None):
+        """Opens a session. A still-open one was renewed in time, so it is dropped."""
+        at = at or time.time()
+        with self.store._lock:
+            self.discard(portal_id)
+            self.store._execute(
+                "INSERT INTO sessions (portal_id, login_at) VALUES (?, ?)", (portal_id, at)
+            )
+        return at
+
+    def record_expiry(self, portal_id, at=None):
+        """Closes the open session. Returns its lifetime in seconds, or None if none was open."""
+        at = at or time.time()
+        with self.store._lock:
+            row = self.store._query_one(
+                "SELECT id, login_at FROM sessions WHERE portal_id = ? AND expired_at IS NULL "
+                "ORDER BY login_at DESC LIMIT 1", (portal_id,)
+            )
+            if not row:
+                return None
+            self.store._execute("UPDATE sessions SET expired_at = ? WHERE id = ?", (at, row[0]))
+        return at - row[1]
+
+    def discard(self, portal_id):
+        """The session ended for another reason (network change): not a lifetime sample."""
+        self.store._execute(
+            "DELETE FROM sessions WHERE portal_id = ? AND expired_at IS NULL", (portal_id,)
+        )
+
+    def lifetime(self, portal_id):
+        """
+        Shortest of the last SESSION_SAMPLES observed lifetimes (seconds),
+        or None while the portal has never been seen expiring.
+        """
+        with self.store._lock:
+            rows = self.store.conn.execute(
+                "SELECT expired_at - login_at FROM sessions "
+                "WHERE portal_id = ? AND expired_at IS NOT NULL AND expired_at - login_at >= ? "
+                "ORDER BY login_at DESC LIMIT ?", (portal_id, MIN_SESSION_LIFETIME, SESSION_SAMPLES)
+            ).fetchall()
+        return min(row[0] for row in rows) if rows else None
+
+
+class PortalCookies:
+    """
+    The portal's cookies and post-login (keepalive) URL from our last
+    successful login, per portal host. A restarted agent, or one that moved
+    to another access point of the same controller, tries them before
+    logging in again. An entry lasts until its earliest cookie expires, the
+    learned session lifetime runs out or COOKIE_MAX_AGE passes.
+    Stored in the 'cookies' table of the StorageManager database.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def save(self, portal_id, cookies, keepalive_url=None, expires_at=None):
+        """`cookies`: list of dicts (see UniversalSolver.export_cookies)."""
+        if not cookies and not keepalive_url:
+            self.discard(portal_id)
+            return
+        now = time.time()
+        expiries = [cookie["expires"] for cookie in cookies if cookie.get("expires")]
+        expires_at = min([expires_at or now + COOKIE_MAX_AGE] + expiries)
+        self.store._execute(
+            "INSERT INTO cookies (portal_id, cookies, keepalive_url, saved_at, expires_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(portal_id) DO UPDATE SET cookies = excluded.cookies, "
+            "keepalive_url = excluded.keepalive_url, saved_at = excluded.saved_at, expires_at = excluded.expires_at",
+            (portal_id, json.dumps(cookies), keepalive_url, now, expires_at)
+        )
+
+    def load(self, portal_id):
+        """{"cookies", "keepalive_url", "expires_at"}, or None if there is nothing (still) valid."""
+        row = self.store._query_one(
+            "SELECT cookies, keepalive_url, expires_at FROM cookies WHERE portal_id = ?", (portal_id,)
+        )
+        if not row:
+            return None
+        if row[2] <= time.time():
+            self.discard(portal_id)
+            return None
+        return {"cookies": json.loads(row[0]), "keepalive_url": row[1], "expires_at": row[2]}
+
+    def discard(self, portal_id):
+        self.store._execute("DELETE FROM cookies WHERE portal_id = ?", (portal_id,))
+
+
+class StorageManager:
+    """
+    Credential store on SQLite (WAL mode):
+    - O(1) lookups by SSID (primary key) and by portal host (secondary index)
+    - every write is a small atomic transaction, never a full rewrite
+    - several agent processes can share the file safely
+    The database is opened lazily on first use.
+    """
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._conn = None
+        self._lock = threading.RLock()
+        self.recipes = RecipeCache(self)
+        self.sessions = SessionLog(self)
+        self.cookies = PortalCookies(self)
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    self._conn = self._open()
+        return self._conn
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        self._upgrade_schema(conn)
+        self._migrate_legacy(conn)
+        return conn
+
+    def _upgrade_schema(self, conn):
+        """Adds columns introduced after a database was created."""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(credentials)")}
+        if "secret" not in columns:
+            conn.execute("ALTER TABLE credentials ADD COLUMN secret TEXT")
+
+    def _migrate_legacy(self, conn):
+        """Imports the old JSON files (once) and renames them out of the way."""
+        if os.path.exists(LEGACY_DB_FILE):
+            try:
+                with open(LEGACY_DB_FILE, 'r') as f:
+                    legacy = json.load(f)
+                now = time.time()
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO credentials (ssid, username, password, portal_id, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [(ssid, data["username"], data["password"], data.get("portal_id"), now)
+                         for ssid, data in legacy.items()]
+                    )
+                os.replace(LEGACY_DB_FILE, LEGACY_DB_FILE + ".migrated")
+                log.info(">> Migrated %d networks from %s to %s.", len(legacy), LEGACY_DB_FILE, self.path)
+            except Exception as e:
+                log.error("Error migrating %s: %s", LEGACY_DB_FILE, e)
+
+        if os.path.exists(LEGACY_RECIPE_FILE):
+            try:
+                with open(LEGACY_RECIPE_FILE, 'r') as f:
+                    legacy = json.load(f)
+                if legacy.get("version") == RECIPE_VERSION:
+                    now = time.time()
+                    with conn:
+                        conn.execute("BEGIN IMMEDIATE")
+                        conn.executemany(
+                            "INSERT OR IGNORE INTO recipes VALUES (?, ?, ?, ?)",
+                            [(portal_id, RECIPE_VERSION, json.dumps(recipe), now)
+                             for portal_id, recipe in legacy.get("recipes", {}).items()]
+                        )
+                os.replace(LEGACY_RECIPE_FILE, LEGACY_RECIPE_FILE + ".migrated")
+            except Exception as e:
+                log.error("Error migrating %s: %s", LEGACY_RECIPE_FILE, e)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params)
+
+    def _query_one(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        One write transaction (BEGIN IMMEDIATE .. COMMIT, ROLLBACK on error).
+        Yields the connection; other threads of this process wait on the lock.
+        """
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _credentials(self, ssid, username, password, portal_id, secret):
+        """Row -> credentials dict, with a referenced password resolved (None if unreadable)."""
+        if secret:
+            try:
+                password = resolve_secret(secret)
+            except ValueError as e:
+                log.error("[%s] Password reference %s unusable: %s", ssid, secret, e)
+                return None
+        return {"username": username, "password": password, "portal_id": portal_id}
 
     def save_credentials(self, ssid, username, password, portal_id=None):
         """
-        Saves credentials to a simple JSON file.
+        Saves credentials for one SSID (single-row upsert).
         WARNING: Passwords are visible if you open the file.
         """
-        self.db[ssid] = {
-            "username": username,
-            "password": password,  # Stored as plain text
-            "portal_id": portal_id
-        }
-        self._save_db()
-        print(f"[{ssid}] Credentials saved to {DB_FILE}.")
+        try:
+            self._execute(
+                "INSERT INTO credentials (ssid, username, password, portal_id, updated_at, secret) "
+                "VALUES (?, ?, ?, ?, ?, NULL) ON CONFLICT(ssid) DO UPDATE SET "
+                "username = excluded.username, password = excluded.password, "
+                "portal_id = excluded.portal_id, updated_at = excluded.updated_at, secret = NULL",
+                (ssid, username, password, portal_id, time.time())  # Stored as plain text
+            )
+            log.info("[%s] Credentials saved to %s.", ssid, self.path)
+        except sqlite3.Error as e:
+            log.error("Error saving DB: %s", e)
 
     def get_credentials(self, ssid):
         """
         Retrieves credentials for a specific SSID.
         """
-        if ssid in self.db:
-            return self.db[ssid]
+        row = self._query_one(
+            "SELECT ssid, username, password, portal_id, secret FROM credentials WHERE ssid = ?", (ssid,)
+        )
+        if row:
+            return self._credentials(*row)
         return None
 
     def find_by_portal_id(self, portal_id):
@@ -55,23 +362,40 @@ class StorageManager:
         if not portal_id:
             return None
 
-        for saved_ssid, data in self.db.items():
-            if data.get("portal_id") == portal_id:
-                print(f"Match found via Portal ID! (Original SSID: {saved_ssid})")
-                return data # Returns the dict containing username/password
+        row = self._query_one(
+            "SELECT ssid, username, password, portal_id, secret FROM credentials "
+            "WHERE portal_id = ? ORDER BY rowid LIMIT 1", (portal_id,)
+        )
+        if row:
+            log.info("Match found via Portal ID! (Original SSID: %s)", row[0])
+            return self._credentials(*row)
         return None
 
+    def list_networks(self):
+        """All saved networks as (ssid, username, portal_id), without passwords."""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT ssid, username, portal_id FROM credentials ORDER BY ssid"
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
 # --- TEST BLOCK ---
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     store = StorageManager()
-    
+
     # Test Saving
     store.save_credentials("TEST_WIFI", "my_user", "my_secret_pass", "http://1.1.1.1")
-    
+
     # Test Retrieving
     creds = store.get_credentials("TEST_WIFI")
     if creds:
         print(f"Retrieved: {creds['username']} / {creds['password']}")
-    
+
     # Check the file
-    print(f"\nCheck the '{DB_FILE}' file in this folder. You will see the password there.")
\ No newline at end of file
+    print(f"\nCheck the '{DB_FILE}' file in this folder (sqlite3 {DB_FILE} 'SELECT * FROM credentials').")
@@ -0,0 +1,182 @@
+import logging
+import socket
+import platform
+import threading
+import time
+import contextlib
+import requests
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from metrics import metrics
+from capture import CaptureAdapter, ReplayAdapter
+
+log = logging.getLogger(__name__)
+
+# Connection pool limits (per Transport)
+POOL_HOSTS = 8      # Distinct hosts kept warm (probe endpoints + portal)
+POOL_PER_HOST = 4   # Idle keep-alive sockets per host (probes run in parallel)
+
+# How long a resolved hostname is trusted
+DNS_TTL = 60
+
+
+class DnsCache:
+    """
+    TTL cache in front of socket.getaddrinfo, installed process-wide.
+    Only successful lookups are cached: a portal that hijacks DNS until
+    login must not leave a stale failure behind. Its hijacked answers are
+    successful lookups too, so the solver clears the cache when it finds a
+    portal and flushes it after every login POST.
+    Answers are kept per scope (the interface a lookup was made for, see
+    InterfaceAdapter): one network's portal answers never reach another.
+    """
+    def __init__(self, ttl=DNS_TTL):
+        self.ttl = ttl
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._resolve = socket.getaddrinfo
+
+    @property
+    def scope(self):
+        """Scope of the lookups made on this thread (None = the default route)."""
+        return getattr(self._local, "scope", None)
+
+    @contextlib.contextmanager
+    def scoped(self, scope):
+        """Lookups made on this thread inside the block are cached under `scope`."""
+        previous, self._local.scope = self.scope, scope
+        try:
+            yield
+        finally:
+            self._local.scope = previous
+
+    def getaddrinfo(self, host, port, *args, **kwargs):
+        key = (self.scope, host, port, args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with self._lock:
+            hit = self.entries.get(key)
+        if hit and hit[0] > now:
+            metrics.count("dns_cache", result="hit")
+            return hit[1]
+        metrics.count("dns_cache", result="miss")
+
+        result = self._resolve(host, port, *args, **kwargs)
+        with self._lock:
+            self.entries[key] = (now + self.ttl, result)
+        return result
+
+    def install(self):
+        socket.getaddrinfo = self.getaddrinfo
+
+    def clear(self, *scopes):
+        """Forgets the answers of these scopes (of every scope if none is given)."""
+        with self._lock:
+            if not scopes:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries if key[0] in scopes]:
+                del self.entries[key]
+
+
+# Not exported by every Python build
+SO_BINDTODEVICE = getattr(socket, "SO_BINDTODEVICE", 25)  # Linux
+IP_BOUND_IF = 25                                          # macOS
+
+
+def bind_options(interface):
+    """Socket options that pin every connection to one network interface."""
+    os_type = platform.system()
+    if os_type == "Linux":
+        return [(socket.SOL_SOCKET, SO_BINDTODEVICE, interface.encode())]
+    if os_type == "Darwin":
+        return [(socket.IPPROTO_IP, IP_BOUND_IF, socket.if_nametoindex(interface))]
+    log.warning(">> Binding to an interface is not supported on %s. Using the default route.", os_type)
+    return []
+
+
+class InterfaceAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose sockets all go out through `interface`; its DNS
+    answers are cached under that interface (see DnsCache).
+    """
+    def __init__(self, interface, dns=None, **kwargs):
+        self.interface = interface
+        self.dns = dns
+        self.socket_options = HTTPConnection.default_socket_options + bind_options(interface)
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = self.socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if self.dns is None:
+            return super().send(request, **kwargs)
+        with self.dns.scoped(self.interface):
+            return super().send(request, **kwargs)
+
+
+class Transport:
+    """
+    Shared HTTP layer for the probes and the solver.
+
+    Every session it hands out is mounted on the SAME pooled adapter, so a
+    keep-alive connection opened by a probe (e.g. to the portal host it was
+    redirected to) is reused by the fresh-token fetch and the login POST.
+    Cookies are NOT shared: the probe session never stores any, the portal
+    session is the only place portal cookies live.
+    With `interface` set, every socket is bound to that interface
+    (SO_BINDTODEVICE on Linux, IP_BOUND_IF on macOS).
+    With `recorder` set, every exchange is also captured into it; with
+    `replay` (a HAR archive path or its entries), nothing goes on the
+    network and the archive answers instead (see capture.py).
+    """
+    _dns = None
+
+    def __init__(self, pool_hosts=POOL_HOSTS, pool_per_host=POOL_PER_HOST, dns_ttl=DNS_TTL, interface=None,
+                 recorder=None, replay=None, replay_speed=None):
+        self.interface = interface
+        self.recorder = recorder
+        self.replaying = replay is not None
+        # One DNS cache per process (socket.getaddrinfo is global), scoped per interface
+        if Transport._dns is None:
+            Transport._dns = DnsCache(dns_ttl)
+            Transport._dns.install()
+        self.dns = Transport._dns
+
+        pool = dict(pool_connections=pool_hosts, pool_maxsize=pool_per_host, max_retries=0)
+        if self.replaying:
+            self.adapter = ReplayAdapter(replay, speed=replay_speed)
+        elif interface:
+            self.adapter = InterfaceAdapter(interface, dns=self.dns, **pool)
+        else:
+            self.adapter = HTTPAdapter(**pool)
+        if recorder is not None:
+            self.adapter = CaptureAdapter(self.adapter, recorder)
+
+    def new_session(self, headers=None, store_cookies=True):
+        session = requests.Session()
+        session.mount("http://", self.adapter)
+        session.mount("https://", self.adapter)
+        if self.replaying:
+            session.trust_env = False  # No network: skip the proxy / netrc lookups of every request
+        if headers:
+            session.headers.update(headers)
+        if not store_cookies:
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    def probe_session(self, headers=None):
+        """Cookie-less session for connectivity probes."""
+        return self.new_session(headers, store_cookies=False)
+
+    def clear_dns(self):
+        """Forgets the DNS answers of this transport's interface (other interfaces keep theirs)."""
+        self.dns.clear(self.interface)
+
+    def flush(self):
+        """Network changed or portal login sent: old sockets and DNS answers no longer apply."""
+        self.clear_dns()
+        self.adapter.close()
@@ -1,21 +1,89 @@
-import requests
-from bs4 import BeautifulSoup
+import logging
 from urllib.parse import urljoin, urlparse
 import re
+import time
+from probe_engine import ProbeEngine, ONLINE
+from form_parser import extract_forms
+from field_classifier import FieldClassifier
+from portal_flow import PortalFlow, FLOW_BUDGET
+from transport import Transport
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Timeout (connect, read) for every request the solver sends itself
+REQUEST_TIMEOUT = (5, 10)
+
+# What the portal's answer to a login says (see login_verdict)
+LOGIN_ACCEPTED = "ACCEPTED"  # Sent away from the portal, or a success message
+LOGIN_REJECTED = "REJECTED"  # Login form again, an error message or 401/403
+LOGIN_UNKNOWN = "UNKNOWN"    # Nothing conclusive: only the probes can tell
+
+# Markers in the visible text of the answer (scripts and tags stripped)
+LOGIN_ERROR_RE = re.compile(
+    r"invalid|incorrect|wrong (?:user|pass|cred)|(?:authentication|login|logon|sign[\s-]?in) (?:has )?failed"
+    r"|unsuccessful|access denied|not match|try again|unauthori[sz]ed",
+    re.IGNORECASE
+)
+LOGIN_SUCCESS_RE = re.compile(
+    r"success|you are (?:now )?(?:connected|online|logged in)|welcome|authenticated",
+    re.IGNORECASE
+)
+SCRIPT_RE = re.compile(r'<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+TAG_RE = re.compile(r'<[^>]*>')
+VERDICT_TEXT_LIMIT = 65536  # Only the start of the page is read for markers
+
+# RFC 8908 Captive Portal API
+CAPTIVE_API_TIMEOUT = (2, 3)
+CAPTIVE_API_RETRY = 300  # A broken API endpoint is skipped for this long (seconds)
+
+# Form score per field role: the form with a password and the most login-like fields wins
+ROLE_SCORES = {"password": 10, "username": 5, "hidden": 1}
+
+def cap_timeout(timeout, limit):
+    """A request timeout (seconds or a (connect, read) tuple) cut down to `limit` (None = as is)."""
+    if limit is None:
+        return timeout
+    if isinstance(timeout, tuple):
+        return tuple(min(part, limit) for part in timeout)
+    return min(timeout, limit)
+
 
 class UniversalSolver:
-    def __init__(self):
+    def __init__(self, prober=None, recipes=None, transport=None, classifier=None, captive_api=None):
+        # Pooled keep-alive connections + DNS cache, shared with the probes
+        self.transport = transport or Transport()
+
         # Create a session to store cookies (essential for session-based firewalls)
-        self.session = requests.Session()
-        
         # Mimic a modern Laptop (Windows 10 Chrome) to avoid being blocked
-        self.session.headers.update({
+        self.session = self.transport.new_session({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1'
         })
 
+        # Races all connectivity endpoints at once (shared with NetworkManager)
+        self.prober = prober or ProbeEngine(
+            session=self.transport.probe_session(dict(self.session.headers))
+        )
+
+        # Optional RecipeCache (storage.py) of known portal login forms
+        self.recipes = recipes
+
+        # Decides which input is the username, password, token, ... (see field_classifier.py)
+        self.classifier = classifier or FieldClassifier()
+
+        # Why the last analyze_page() found nothing (see PortalFlow.outcome)
+        self.last_outcome = None
+
+        # Callable returning the network's Captive Portal API URI, or None
+        # (normally NetworkManager.get_captive_api, wired up by the agent)
+        self.captive_api = captive_api
+        # Last answer of that API: {"captive", "user-portal-url", "seconds-remaining", ..., "fetched_at"}
+        self.api_status = None
+        self._api_failed = {}  # URI -> time.monotonic() until it is skipped
+
     def get_portal_identifier(self, full_url):
         """
         Extracts the unique 'Host' from the URL.
@@ -24,121 +92,224 @@ class UniversalSolver:
         parsed = urlparse(full_url)
         return f"{parsed.scheme}://{parsed.netloc}"
 
-    def get_portal_page(self):
+    def get_portal_page(self, timeout=None):
         """
-        Probes the network.
+        Asks the Captive Portal API if the network advertises one, else probes the network.
+        `timeout` (seconds) caps the whole fetch, API and probe race included.
         Returns: 
         - response object (if trapped in portal)
         - "ONLINE" string (if internet is working)
         - None (if network is down/unreachable)
         """
-        print(">> Probing network...")
+        # Fast path: the network tells us itself (RFC 8908), no probing and scraping
+        stop_at = time.monotonic() + timeout if timeout is not None else None
+        result = self.check_captive_api(timeout)
+        if result is not None:
+            return result
+
+        log.debug(">> Probing network...")
+        remaining = stop_at - time.monotonic() if stop_at is not None else None
+        if remaining is not None and remaining <= 0:
+            return None
+        with metrics.span("page_fetch"):
+            result = self.prober.probe(remaining)
+
+        if result is None or result == ONLINE:
+            return result
+
+        # Captive: names resolved before may now be the portal's hijacked answers, or go stale at login
+        self.transport.clear_dns()
+
+        # The probe ran outside our session, keep the portal's cookies
+        for hop in result.history + [result]:
+            self.session.cookies.update(hop.cookies)
+        return result
+
+    def check_captive_api(self, timeout=None):
+        """
+        Asks the Captive Portal API (if the network advertises one), within
+        `timeout` seconds if given. Only an https:// URI is asked (certificate
+        verified by the session); anything else is ignored.
+        Returns ONLINE, the user portal page (response), or None to fall back to probing.
+        Sets self.api_status (None when there is no usable answer).
+        """
+        self.api_status = None
+        stop_at = time.monotonic() + timeout if timeout is not None else None
+        uri = self.captive_api() if self.captive_api else None
+        if not uri or self._api_failed.get(uri, 0) > time.monotonic():
+            return None
+        if urlparse(uri).scheme != "https":
+            # RFC 8908: only an HTTPS API with a valid certificate may be believed (e.g. "captive": false)
+            log.warning(">> Captive Portal API %s is not HTTPS. Probing instead.", uri)
+            metrics.count("captive_api", result="insecure")
+            self._api_failed[uri] = time.monotonic() + CAPTIVE_API_RETRY
+            return None
+
         try:
-            # Probe 1: NeverSSL (HTTP)
-            response = self.session.get("http://neverssl.com", timeout=10, allow_redirects=True)
-            
-            # If we see "NeverSSL" text, we are actually ONLINE.
-            if "NeverSSL" in response.text:
-                return "ONLINE"
-            
-            # Otherwise, we are at a login page
-            return response
-
-        except requests.exceptions.RequestException:
-            # Probe 2: Fallback to Cloudflare IP (Bypass DNS errors)
-            try:
-                response = self.session.get("http://1.1.1.1", timeout=5, allow_redirects=True)
-                if "Cloudflare" in response.text:
-                    return "ONLINE"
-                return response
-            except:
-                return None
-
-    def analyze_page(self, response):
-        """
-        Scrapes HTML to find the login form structure.
-        Handles standard HTML Forms AND JavaScript Redirects.
-        """
-        soup = BeautifulSoup(response.text, 'html.parser')
-        forms = soup.find_all('form')
-        
-        # --- LOGIC FIX: HANDLE JS REDIRECT ---
-        # Some firewalls (like Fortinet) return a page with NO forms, just a JS redirect.
-        if len(forms) == 0:
-            print(">> No forms found. Checking for JavaScript Redirect...")
-            # Look for patterns like: window.location="URL" or window.location.href="URL"
-            match = re.search(r'window\.location\.?h?r?e?f?\s*=\s*"([^"]+)"', response.text)
-            
-            if match:
-                redirect_url = match.group(1)
-                print(f">> JS Redirect Detected! Following to: {redirect_url}")
-                
-                try:
-                    # Recursively follow the link to find the real page
-                    new_response = self.session.get(redirect_url, allow_redirects=True)
-                    # Recursively analyze the NEW page
-                    return self.analyze_page(new_response)
-                except Exception as e:
-                    print(f">> Failed to follow JS redirect: {e}")
-                    return None
-            else:
-                print(">> No JS redirect found either.")
-                return None
-        # -------------------------------------
-
-        print(f">> Found {len(forms)} forms on the page.")
+            with metrics.span("captive_api"):
+                response = self.session.get(
+                    uri, headers={'Accept': 'application/captive+json'},
+                    timeout=cap_timeout(CAPTIVE_API_TIMEOUT, timeout)
+                )
+                response.raise_for_status()
+                status = response.json()
+            if not isinstance(status, dict) or not isinstance(status.get("captive"), bool):
+                raise ValueError("no 'captive' flag")
+        except Exception as e:
+            log.warning(">> Captive Portal API %s unusable (%s). Probing instead.", uri, e)
+            metrics.count("captive_api", result="error")
+            self._api_failed[uri] = time.monotonic() + CAPTIVE_API_RETRY
+            return None
+
+        status["fetched_at"] = time.time()
+        self.api_status = status
+        if not status["captive"]:
+            metrics.count("captive_api", result="online")
+            return ONLINE
+
+        metrics.count("captive_api", result="captive")
+        portal_url = status.get("user-portal-url")
+        if not portal_url:
+            return None
+        log.info(">> Captive Portal API: login at %s", portal_url)
+        try:
+            with metrics.span("page_fetch"):
+                remaining = max(0.1, stop_at - time.monotonic()) if stop_at is not None else None
+                return self.session.get(portal_url, stream=True, timeout=cap_timeout(REQUEST_TIMEOUT, remaining))
+        except Exception as e:
+            log.warning(">> Could not open the user portal: %s", e)
+            return None
+
+    def seconds_remaining(self):
+        """Session time left according to the Captive Portal API (None = not told)."""
+        status = self.api_status
+        if not status or status.get("captive") or not isinstance(status.get("seconds-remaining"), (int, float)):
+            return None
+        return max(0, status["seconds-remaining"] - (time.time() - status["fetched_at"]))
+
+    def analyze_page(self, response, timeout=REQUEST_TIMEOUT, budget=FLOW_BUDGET, learn=True):
+        """
+        Finds the login form structure.
+        Walks the portal from `response` (redirects, terms pages, see portal_flow.py);
+        on each page a known portal is served from the recipe cache (only fresh
+        tokens are read), everything else goes through the full HTML analysis.
+        `timeout` applies to every page fetched on the way, `budget` to the whole walk.
+        A newly analyzed form is cached as the portal's recipe unless learn=False
+        (then the caller calls learn_recipe once a login with it worked).
+        """
+        with metrics.span("form_analysis"):
+            flow = PortalFlow(self, timeout, budget, learn=learn)
+            form_details = flow.find_login_form(response)
+        self.last_outcome = flow.outcome
+        return form_details
+
+    def learn_recipe(self, form_details):
+        """Caches the recipe of an analyzed form for its portal (if there is a RecipeCache)."""
+        if self.recipes is not None:
+            self.recipes.put(self.get_portal_identifier(form_details['url']), self.compile_recipe(form_details))
+
+    def compile_recipe(self, form_details):
+        """
+        Reduces an analyzed form to what is needed to log in again:
+        where to send it, and which fields play which role.
+        """
+        return {
+            "id": form_details['id'],
+            "action": form_details['action'],
+            "method": form_details['method'],
+            "fields": [
+                {"name": inp['name'], "type": inp['type'], "role": inp['role']}
+                for inp in form_details['inputs']
+            ],
+            "tokens": [inp['name'] for inp in form_details['inputs'] if inp['role'] == 'hidden']
+        }
+
+    def apply_recipe(self, recipe, response, forms=None):
+        """
+        Rebuilds form_details from a cached recipe and the fresh page.
+        `forms` are the page's extracted forms if the caller already streamed
+        it (otherwise it is streamed here, stopping after the login form).
+        Returns None if the page no longer matches the recipe; a malformed
+        recipe (e.g. a hand-written one from an old import) is invalidated.
+        """
+        try:
+            return self._apply_recipe(recipe, response, forms)
+        except (KeyError, TypeError, AttributeError) as e:
+            portal_id = self.get_portal_identifier(response.url)
+            log.warning(">> Cached login recipe for %s is malformed (%r). Dropping it.", portal_id, e)
+            if self.recipes is not None:
+                self.recipes.invalidate(portal_id)
+            return None
+
+    def _apply_recipe(self, recipe, response, forms):
+        if forms is None:
+            forms = extract_forms(response).forms
+        required = [
+            field['name'] for field in recipe['fields'] if field['role'] in ('username', 'password', 'hidden')
+        ]
+        for form in forms:
+            # The form must still post to the same place (some portals put a session id in the action)
+            if urljoin(response.url, form['attrs'].get('action', '')) != recipe['action']:
+                continue
+            # Fresh tokens come from this form only, never from another form on the page
+            values = {}
+            for inp in form['inputs']:
+                if inp.get('name') and inp['name'] not in values:
+                    values[inp['name']] = inp.get('value', '')
+            # Every field the recipe relies on must still be in it
+            if all(name in values for name in required):
+                break
+        else:
+            return None
 
+        return {
+            "id": recipe.get('id', 0),
+            "url": response.url,
+            "action": recipe['action'],
+            "method": recipe['method'],
+            "inputs": [
+                {
+                    "name": field['name'],
+                    "type": field.get('type', 'text'),
+                    "value": values.get(field['name'], ''),
+                    "role": field['role']
+                }
+                for field in recipe['fields']
+            ]
+        }
+
+    def pick_best_form(self, forms, base_url):
+        """
+        Scores every extracted form (see form_parser) and returns the
+        form_details of the most likely login form, or None.
+        Field roles come from the classifier, in one pass over all forms.
+        """
         best_form = None
         highest_score = 0
 
-        for index, form in enumerate(forms):
+        for index, (form, roles) in enumerate(zip(forms, self.classifier.classify_forms(forms))):
             # Calculate the full URL for the form action
-            action_url = urljoin(response.url, form.get('action', ''))
+            action_url = urljoin(base_url, form['attrs'].get('action', ''))
             
             form_details = {
                 "id": index,
+                "url": base_url,
                 "action": action_url,
-                "method": form.get('method', 'POST').upper(),
+                "method": form['attrs'].get('method', 'POST').upper(),
                 "inputs": []
             }
-            
-            current_score = 0
-            has_password = False
-            
-            # Find all inputs (and buttons) in this form
-            all_inputs = form.find_all(['input', 'button'])
-            
-            for inp in all_inputs:
+
+            current_score = sum(ROLE_SCORES.get(role, 0) for role in roles)
+            has_password = "password" in roles
+
+            # All inputs (and buttons) in this form
+            for inp, field_role in zip(form['inputs'], roles):
                 name = inp.get('name')
-                inp_type = inp.get('type', 'text').lower()
-                value = inp.get('value', '')
-                
-                field_role = "unknown"
-                
-                # HEURISTIC 1: Password Field
-                if inp_type == "password":
-                    field_role = "password"
-                    has_password = True
-                    current_score += 10
-                
-                # HEURISTIC 2: Hidden Tokens (Critical for Firewalls)
-                elif inp_type == "hidden":
-                    field_role = "hidden"
-                    current_score += 1
-                
-                # HEURISTIC 3: Username Field
-                elif inp_type in ["text", "email"]:
-                    if name and any(x in name.lower() for x in ['user', 'name', 'login', 'id', 'email', 'auth']):
-                        field_role = "username"
-                        current_score += 5
-                    else:
-                        field_role = "text"
-                
                 if name: 
                     form_details['inputs'].append({
                         "name": name,
-                        "type": inp_type,
-                        "value": value,
+                        "type": inp.get('type', 'text').lower(),
+                        "value": inp.get('value', ''),
                         "role": field_role
                     })
 
@@ -149,13 +320,17 @@ class UniversalSolver:
 
         return best_form
 
-    def login(self, form_details, username, password):
+    def login(self, form_details, username, password, timeout=REQUEST_TIMEOUT, budget=FLOW_BUDGET):
         """
         Constructs the payload and submits the form.
+        Returns the portal's answer, after any confirmation pages it leads to.
         """
         payload = {}
         
-        print(f">> Preparing login payload for: {form_details['action']}")
+        log.info(">> Preparing login payload for: %s", form_details['action'])
+        if self.transport.recorder is not None:
+            # Capturing traffic (capture.py): keep the credentials out of the archive
+            self.transport.recorder.redact(username, password)
         
         for inp in form_details['inputs']:
             if inp['role'] == 'username':
@@ -174,17 +349,78 @@ class UniversalSolver:
                 'Origin': self.get_portal_identifier(form_details['action'])
             }
             
-            if form_details['method'] == 'POST':
-                resp = self.session.post(form_details['action'], data=payload, headers=headers)
-            else:
-                resp = self.session.get(form_details['action'], params=payload, headers=headers)
-                
+            with metrics.span("login_post"):
+                if form_details['method'] == 'POST':
+                    resp = self.session.post(form_details['action'], data=payload, headers=headers, timeout=timeout)
+                else:
+                    resp = self.session.get(form_details['action'], params=payload, headers=headers, timeout=timeout)
+                # "Login successful, continue..." pages: the session is only opened at their end
+                resp = PortalFlow(self, timeout, budget).confirm(resp)
+
             return resp
         except Exception as e:
-            print(f">> Submission Error: {e}")
+            log.error(">> Submission Error: %s", e)
             return None
+        finally:
+            # A DNS-hijacking portal answered every lookup (and took every keep-alive socket)
+            # until now: post-login checks must resolve and connect afresh
+            self.transport.flush()
+
+    def export_cookies(self, portal_id):
+        """The session's cookies for the portal's host, as plain dicts (see restore_cookies)."""
+        host = urlparse(portal_id).hostname or ""
+        cookies = []
+        for cookie in self.session.cookies:
+            domain = cookie.domain.lstrip(".")
+            # http.cookiejar files cookies of dotless hosts (e.g. "localhost") under "host.local"
+            if domain.endswith(".local") and "." not in host:
+                domain = domain[:-len(".local")]
+            if host == domain or host.endswith("." + domain):
+                cookies.append({
+                    "name": cookie.name, "value": cookie.value, "domain": cookie.domain,
+                    "path": cookie.path, "expires": cookie.expires, "secure": cookie.secure
+                })
+        return cookies
+
+    def restore_cookies(self, cookies):
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie["path"],
+                expires=cookie["expires"], secure=cookie["secure"]
+            )
+
+    def login_verdict(self, form_details, response):
+        """
+        Reads the portal's answer to a login (no extra request):
+        LOGIN_REJECTED, LOGIN_ACCEPTED or LOGIN_UNKNOWN.
+        """
+        verdict = self._login_verdict(form_details, response)
+        metrics.count("login_verdicts", verdict=verdict)
+        return verdict
+
+    def _login_verdict(self, form_details, response):
+        if response is None or response.status_code in (401, 403):
+            return LOGIN_REJECTED
+
+        # Redirected off the portal (usually to the page first asked for)
+        portal_hosts = {urlparse(form_details['action']).netloc, urlparse(form_details.get('url', '')).netloc}
+        if urlparse(response.url).netloc not in portal_hosts:
+            return LOGIN_ACCEPTED
+
+        # The password form again: the portal didn't take the credentials
+        if any(form['has_password'] for form in extract_forms(response).forms):
+            return LOGIN_REJECTED
+
+        text = response.text[:VERDICT_TEXT_LIMIT]
+        visible = TAG_RE.sub(" ", SCRIPT_RE.sub(" ", text))
+        if LOGIN_ERROR_RE.search(visible):
+            return LOGIN_REJECTED
+        if LOGIN_SUCCESS_RE.search(visible):
+            return LOGIN_ACCEPTED
+        return LOGIN_UNKNOWN
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     # Quick Test
     solver = UniversalSolver()
     page = solver.get_portal_page()
@@ -0,0 +1,144 @@
+import os
+import re
+import socket
+import struct
+import subprocess
+import threading
+
+# --- netlink / generic netlink constants (linux/netlink.h, linux/genetlink.h) ---
+NETLINK_GENERIC = 16
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+# --- nl80211 (linux/nl80211.h) ---
+NL80211_CMD_GET_INTERFACE = 5
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_IFNAME = 4
+NL80211_ATTR_SSID = 52
+
+NLMSG_HDR = struct.Struct("=IHHII")  # len, type, flags, seq, pid
+GENL_HDR = struct.Struct("=BBH")     # cmd, version, reserved
+NLA_HDR = struct.Struct("=HH")       # len, type
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _attr(attr_type, payload):
+    data = NLA_HDR.pack(NLA_HDR.size + len(payload), attr_type) + payload
+    return data + b"\0" * (_align(len(data)) - len(data))
+
+
+def _parse_attrs(data, offset, end):
+    attrs = {}
+    while offset + NLA_HDR.size <= end:
+        length, attr_type = NLA_HDR.unpack_from(data, offset)
+        if length < NLA_HDR.size:
+            break
+        attrs[attr_type & 0x3fff] = data[offset + NLA_HDR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+class Nl80211:
+    """
+    Reads the SSID of every wireless interface straight from the kernel
+    (nl80211 over a generic netlink socket). No subprocess, no extra packages.
+    """
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        self.sock.bind((0, 0))
+        self.sock.settimeout(1)
+        self.seq = 0
+        self._lock = threading.Lock()
+        self.family_id = self._resolve_family(b"nl80211")
+
+    def _request(self, msg_type, flags, cmd, payload=b""):
+        """Sends one generic netlink request, returns the list of reply payloads."""
+        self.seq += 1
+        body = GENL_HDR.pack(cmd, 1, 0) + payload
+        self.sock.send(NLMSG_HDR.pack(NLMSG_HDR.size + len(body), msg_type, flags, self.seq, 0) + body)
+
+        replies = []
+        while True:
+            data = self.sock.recv(65536)
+            offset = 0
+            while offset + NLMSG_HDR.size <= len(data):
+                length, reply_type, _, seq, _ = NLMSG_HDR.unpack_from(data, offset)
+                if length < NLMSG_HDR.size:
+                    return replies
+                if seq == self.seq:
+                    if reply_type == NLMSG_DONE:
+                        return replies
+                    if reply_type == NLMSG_ERROR:
+                        error = struct.unpack_from("=i", data, offset + NLMSG_HDR.size)[0]
+                        if error:
+                            raise OSError(-error, os.strerror(-error))
+                        return replies
+                    replies.append((data, offset + NLMSG_HDR.size + GENL_HDR.size, offset + length))
+                offset += _align(length)
+            if not flags & NLM_F_DUMP and replies:
+                return replies
+
+    def _resolve_family(self, name):
+        replies = self._request(
+            GENL_ID_CTRL, NLM_F_REQUEST, CTRL_CMD_GETFAMILY, _attr(CTRL_ATTR_FAMILY_NAME, name + b"\0")
+        )
+        for data, start, end in replies:
+            attrs = _parse_attrs(data, start, end)
+            if CTRL_ATTR_FAMILY_ID in attrs:
+                return struct.unpack("=H", attrs[CTRL_ATTR_FAMILY_ID][:2])[0]
+        raise OSError("nl80211 not available")
+
+    def get_ssids(self):
+        """Returns {interface name: SSID or None} for every wireless interface."""
+        with self._lock:
+            replies = self._request(self.family_id, NLM_F_REQUEST | NLM_F_DUMP, NL80211_CMD_GET_INTERFACE)
+        ssids = {}
+        for data, start, end in replies:
+            attrs = _parse_attrs(data, start, end)
+            name = attrs.get(NL80211_ATTR_IFNAME, b"").rstrip(b"\0").decode(errors="replace")
+            if not name:
+                continue
+            ssid = attrs.get(NL80211_ATTR_SSID)
+            ssids[name] = ssid.decode("utf-8", errors="replace") if ssid else None
+        return ssids
+
+    def close(self):
+        self.sock.close()
+
+
+def list_wireless_interfaces(os_type):
+    """
+    Names of the Wi-Fi interfaces on this machine, in system order.
+    Linux: /sys/class/net/*/wireless, macOS: networksetup hardware ports.
+    """
+    if os_type == "Linux":
+        try:
+            return sorted(
+                name for name in os.listdir("/sys/class/net")
+                if os.path.isdir(f"/sys/class/net/{name}/wireless")
+                or os.path.exists(f"/sys/class/net/{name}/phy80211")
+            )
+        except OSError:
+            return []
+
+    if os_type == "Darwin":
+        try:
+            process = subprocess.run(
+                ["networksetup", "-listallhardwareports"], capture_output=True, text=True
+            )
+        except OSError:
+            return []
+        # Blocks look like: "Hardware Port: Wi-Fi\nDevice: en0\n..."
+        return re.findall(r'Hardware Port: (?:Wi-Fi|AirPort)\s*\nDevice: (\S+)', process.stdout)
+
+    return []